@@ -1,1872 +1,6023 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
-from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
-from datetime import datetime, timedelta
-from web3 import Web3
-import os
-import sqlite3
-import json
-from functools import wraps
-import pandas as pd
-import logging
-import joblib
-from geopy.geocoders import Nominatim
-from geopy.distance import geodesic
-from math import radians, cos, sin, sqrt, atan2
-
-import re
-import requests
-from io import BytesIO
-from PIL import Image
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-
-# Initialize Flask app
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your-secret-key-here'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///healthcare.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOAD_FOLDER'] = 'uploads/prescriptions'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-# Initialize geolocator once
-geolocator = Nominatim(user_agent="my_medicine_app", timeout=10)
-try:
-    # Load dataset
-    df = pd.read_csv("Medicine_Details.csv")
-    # Clean column names
-    df.columns = df.columns.str.strip()
-    
-    # Extract dosage from composition
-    def extract_dosage(comp):
-        doses = re.findall(r'(\d+)\s?mg', str(comp), re.IGNORECASE)
-        return sum(map(int, doses)) if doses else 0
-    
-    df["Dosage (mg)"] = df["Composition"].apply(extract_dosage)
-    
-    # Ensure required columns exist
-    df["Type"] = df.get("Type", "Tablet")
-    df["Manufacturer"] = df.get("Manufacturer", "Unknown")
-    df["Image URL"] = df.get("Image URL", "")
-    
-    # TF-IDF on composition
-    tfidf = TfidfVectorizer()
-    vectors = tfidf.fit_transform(df['Composition'])
-    
-    print("✅ Medicine dataset loaded successfully!")
-except Exception as e:
-    print(f"❌ Error loading medicine dataset: {e}")
-    df = None
-    tfidf = None
-    vectors = None
-
-# Helper function to get similar medicines
-def get_similar_medicines(med_name):
-    """Get similar medicines based on composition"""
-    if df is None or med_name not in df["Medicine Name"].values:
-        return None, None
-    
-    idx = df[df["Medicine Name"] == med_name].index[0]
-    cosine_sim = cosine_similarity(vectors[idx], vectors).flatten()
-    similar_idx = cosine_sim.argsort()[::-1][1:6]  # Top 5 similar
-    
-    main_med = df.loc[idx].to_dict()
-    similar_meds = []
-    
-    for i in similar_idx:
-        med = df.loc[i].to_dict()
-        # Calculate similarity percentage
-        med['similarity'] = round(cosine_sim[i] * 100, 2)
-        similar_meds.append(med)
-    
-    return main_med, similar_meds
-
-# Load ML models once at startup
-model_shortage = joblib.load('medicine_shortage_model.pkl')
-model_price = joblib.load('medicine_price_spike_model.pkl')
-
-# Region, medicine and season mappings
-region_map = {'Mumbai': 0, 'Delhi': 1, 'Chennai': 2, 'Kolkata': 3, 'Banglore': 4}
-medicine_map = {
-    'Insulin': 0, 'Thyroxine': 1, 'Metformin': 2, 'Levothyroxine': 3, 'Paracetamol': 4,
-    'Amoxicillin': 5, 'Aspirin': 6, 'Atorvastatin': 7, 'Omeprazole': 8, 'Amlodipine': 9,
-    'Azithromycin': 10, 'Cetrizine': 11, 'Doxycycline': 12, 'Diclofenac': 13, 'Losartan': 14,
-    'Salbutamol': 15, 'Clopidogrel': 16, 'Fluconazole': 17, 'Levocetirizine': 18, 'Metronidazole': 19,
-    'Montelukast': 20, 'Ciprofloxacin': 21, 'Prednisolone': 22, 'Ranitidine': 23, 'Warfarin': 24,
-    'Glimepiride': 25, 'Levamisole': 26, 'Betahistine': 27, 'Norfloxacin': 28, 'Famotidine': 29,
-    'Hydrochlorothiazide': 30, 'Tramadol': 31, 'Cefixime': 32, 'Clindamycin': 33, 'Olmesartan': 34,
-    'Methylprednisolone': 35, 'Tiotropium': 36, 'Enalapril': 37, 'Rifampicin': 38, 'Gabapentin': 39,
-    'Paroxetine': 40, 'Clonazepam': 41, 'Dexamethasone': 42, 'Mefenamic Acid': 43, 'Baclofen': 44,
-    'Ondansetron': 45, 'Tadalafil': 46, 'Valacyclovir': 47, 'Etoricoxib': 48, 'Esomeprazole': 49,
-    'Phenylephrine': 50, 'Mirtazapine': 51, 'Amantadine': 52, 'Azathioprine': 53, 'Betamethasone': 54,
-    'Nifedipine': 55, 'Nortriptyline': 56, 'Diazepam': 57, 'Fluoxetine': 58, 'Levofloxacin': 59,
-    'Nystatin': 60, 'Pregabalin': 61, 'Rosuvastatin': 62, 'Sildenafil': 63
-}
-season_map = {'Winter': 1, 'Summer': 5, 'Monsoon': 8}
-
-typical_avg_daily_demand = {
-    ('Mumbai', 'Insulin', 'Winter'): 50,
-    ('Mumbai', 'Insulin', 'Summer'): 90,
-    ('Mumbai', 'Insulin', 'Monsoon'): 70,
-    ('Mumbai', 'Atorvastatin', 'Winter'): 25,
-    ('Mumbai', 'Atorvastatin', 'Summer'): 35,
-    ('Mumbai', 'Atorvastatin', 'Monsoon'): 30,
-    ('Delhi', 'Paracetamol', 'Winter'): 110,
-    ('Delhi', 'Paracetamol', 'Summer'): 80,
-    ('Delhi', 'Paracetamol', 'Monsoon'): 90,
-    ('Chennai', 'Amoxicillin', 'Winter'): 45,
-    ('Chennai', 'Amoxicillin', 'Summer'): 55,
-    ('Chennai', 'Amoxicillin', 'Monsoon'): 50,
-    ('Kolkata', 'Aspirin', 'Winter'): 40,
-    ('Kolkata', 'Aspirin', 'Summer'): 30,
-    ('Kolkata', 'Aspirin', 'Monsoon'): 35,
-    ('Banglore', 'Metformin', 'Winter'): 70,
-    ('Banglore', 'Metformin', 'Summer'): 65,
-    ('Banglore', 'Metformin', 'Monsoon'): 75,
-}
-typical_stock_level = {
-    ('Mumbai', 'Insulin', 'Winter'): 20,
-    ('Mumbai', 'Insulin', 'Summer'): 14,
-    ('Mumbai', 'Insulin', 'Monsoon'): 3,
-    ('Mumbai', 'Atorvastatin', 'Winter'): 5,
-    ('Mumbai', 'Atorvastatin', 'Summer'): 8,
-    ('Mumbai', 'Atorvastatin', 'Monsoon'): 7,
-    ('Delhi', 'Paracetamol', 'Winter'): 20,
-    ('Delhi', 'Paracetamol', 'Summer'): 12,
-    ('Delhi', 'Paracetamol', 'Monsoon'): 11,
-    ('Chennai', 'Amoxicillin', 'Winter'): 20,
-    ('Chennai', 'Amoxicillin', 'Summer'): 9,
-    ('Chennai', 'Amoxicillin', 'Monsoon'): 22,
-    ('Kolkata', 'Aspirin', 'Winter'): 15,
-    ('Kolkata', 'Aspirin', 'Summer'): 1,
-    ('Kolkata', 'Aspirin', 'Monsoon'): 12,
-    ('Banglore', 'Metformin', 'Winter'): 35,
-    ('Banglore', 'Metformin', 'Summer'): 2,
-    ('Banglore', 'Metformin', 'Monsoon'): 17,
-}
-# Blockchain Configuration - Updated with your new contract address
-BLOCKCHAIN_CONFIG = {
-    'provider_url': 'http://127.0.0.1:8545',
-    'contract_address': "0x8A791620dd6260079BF849Dc5567aDC3F2FdC318",  # Your new deployed address
-    'contract_abi_file': 'MedicineLedger.json'
-}
-
-# Configure logging first
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-# Initialize Web3 and contract with better error handling
-def initialize_blockchain():
-    """Initialize blockchain connection with comprehensive error handling"""
-    try:
-        # Test Web3 connection
-        w3 = Web3(Web3.HTTPProvider(BLOCKCHAIN_CONFIG['provider_url']))
-        
-        if not w3.is_connected():
-            raise Exception("Cannot connect to blockchain provider")
-        
-        logger.info(f"Connected to blockchain at {BLOCKCHAIN_CONFIG['provider_url']}")
-        logger.info(f"Latest block: {w3.eth.block_number}")
-        
-        # Check if we have accounts
-        if not w3.eth.accounts:
-            raise Exception("No accounts available from blockchain provider")
-        
-        logger.info(f"Available accounts: {len(w3.eth.accounts)}")
-        
-        # Load contract ABI
-        if not os.path.exists(BLOCKCHAIN_CONFIG['contract_abi_file']):
-            raise Exception(f"Contract ABI file not found: {BLOCKCHAIN_CONFIG['contract_abi_file']}")
-        
-        with open(BLOCKCHAIN_CONFIG['contract_abi_file']) as f:
-            contract_data = json.load(f)
-            contract_abi = contract_data.get('abi')
-            
-        if not contract_abi:
-            raise Exception("ABI not found in contract file")
-        
-        # Initialize contract
-        contract = w3.eth.contract(
-            address=w3.to_checksum_address(BLOCKCHAIN_CONFIG['contract_address']), 
-            abi=contract_abi
-        )
-        
-        # Test contract connection by calling a simple function
-        try:
-            # Try to call a view function to test the contract
-            stock_count = contract.functions.getStockCount().call()
-            logger.info(f"Contract connection successful. Stock count: {stock_count}")
-        except Exception as e:
-            logger.warning(f"Contract function test failed: {e}")
-            # Continue anyway as contract might be deployed but empty
-        
-        # Use the first Hardhat account
-        default_account = w3.eth.accounts[0]
-        logger.info(f"Using default account: {default_account}")
-        
-        return w3, contract, default_account, True
-        
-    except FileNotFoundError as e:
-        logger.error(f"Blockchain file not found: {e}")
-        return None, None, None, False
-    except Exception as e:
-        logger.error(f"Blockchain connection failed: {e}")
-        return None, None, None, False
-
-# Initialize blockchain components
-w3, contract, default_account, blockchain_enabled = initialize_blockchain()
-
-# Ensure upload directory exists
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-# Initialize database
-db = SQLAlchemy(app)
-
-# Authentication decorator
-def login_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
-            return redirect(url_for('login'))
-        return f(*args, **kwargs)
-    return decorated_function
-
-def role_required(roles):
-    def decorator(f):
-        @wraps(f)
-        def decorated_function(*args, **kwargs):
-            if 'user_type' not in session or session['user_type'] not in roles:
-                flash('Access denied. Insufficient permissions.', 'error')
-                return redirect(url_for('dashboard'))
-            return f(*args, **kwargs)
-        return decorated_function
-    return decorator
-
-def get_db_connection():
-    conn = sqlite3.connect('healthcare.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def execute_query(query, params=None):
-    conn = get_db_connection()
-    try:
-        if params:
-            result = conn.execute(query, params).fetchall()
-        else:
-            result = conn.execute(query).fetchall()
-        conn.commit()
-        return result
-    except Exception as e:
-        logger.error(f"Database error: {e}")
-        return None
-    finally:
-        conn.close()
-
-def execute_insert(query, params):
-    conn = get_db_connection()
-    try:
-        cursor = conn.execute(query, params)
-        conn.commit()
-        return cursor.lastrowid
-    except Exception as e:
-        logger.error(f"Database insert error: {e}")
-        return None
-    finally:
-        conn.close()
-
-# Correct haversine distance function
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371  # Earth radius in kilometers
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-    a = sin(dlat/2)*2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)*2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    return R * c
-
-# Blockchain helper functions with improved error handling
-def get_user_blockchain_account(user_id):
-    """Get or create a blockchain account for a user"""
-    if not blockchain_enabled or not w3 or not w3.eth.accounts:
-        return None
-    
-    try:
-        account_index = user_id % len(w3.eth.accounts)
-        return w3.eth.accounts[account_index]
-    except Exception as e:
-        logger.error(f"Error getting user blockchain account: {e}")
-        return w3.eth.accounts[0] if w3.eth.accounts else None
-
-def record_to_blockchain(action_type, data):
-    """Record important actions to blockchain with improved error handling"""
-    if not blockchain_enabled or not contract:
-        logger.warning("Blockchain disabled - action not recorded to blockchain")
-        return None
-    
-    try:
-        user_account = get_user_blockchain_account(session.get('user_id', 0))
-        if not user_account:
-            logger.error("No user account available for blockchain transaction")
-            return None
-        
-        if action_type == 'stock_update':
-            tx_hash = contract.functions.addMedicineStock(
-                data['pharmacy_name'],
-                data['medicine_name'],
-                data['quantity'],
-                data['price']
-            ).transact({'from': user_account, 'gas': 300000})
-            
-        elif action_type == 'shortage_report':
-            tx_hash = contract.functions.reportShortage(
-                data['medicine_name'],
-                data['location_name']
-            ).transact({'from': user_account, 'gas': 300000})
-        
-        else:
-            logger.warning(f"Unknown blockchain action type: {action_type}")
-            return None
-        
-        # Wait for transaction receipt with timeout
-        try:
-            receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=60)
-            logger.info(f"Blockchain transaction successful: {receipt.transactionHash.hex()}")
-            return receipt.transactionHash.hex()
-        except Exception as e:
-            logger.error(f"Transaction receipt error: {e}")
-            return tx_hash.hex() if hasattr(tx_hash, 'hex') else str(tx_hash)
-        
-    except Exception as e:
-        logger.error(f"Blockchain transaction failed: {e}")
-        return None
-
-def get_blockchain_data():
-    """Fetch data from blockchain with improved error handling"""
-    if not blockchain_enabled or not contract:
-        return {'stocks': [], 'shortages': [], 'orders': [], 'enabled': False, 'error': 'Blockchain not available'}
-    
-    try:
-        # Test contract connection first
-        try:
-            stock_count = contract.functions.getStockCount().call()
-        except Exception as e:
-            logger.error(f"Cannot call getStockCount: {e}")
-            return {'stocks': [], 'shortages': [], 'orders': [], 'enabled': False, 'error': 'Contract call failed'}
-        
-        # Get shortage and order counts
-        try:
-            shortage_count = contract.functions.getShortageCount().call()
-        except Exception as e:
-            logger.warning(f"Cannot call getShortageCount: {e}")
-            shortage_count = 0
-            
-        try:
-            order_count = contract.functions.getOrderCount().call()
-        except Exception as e:
-            logger.warning(f"Cannot call getOrderCount: {e}")
-            order_count = 0
-        
-        # Fetch all stock updates
-        stock_list = []
-        for i in range(min(stock_count, 100)):  # Limit to prevent timeouts
-            try:
-                stock = contract.functions.stockUpdates(i).call()
-                stock_list.append({
-                    "pharmacy": stock[0],
-                    "medicine": stock[1],
-                    "quantity": stock[2],
-                    "price": stock[3],
-                    "timestamp": stock[4]
-                })
-            except Exception as e:
-                logger.warning(f"Error fetching stock {i}: {e}")
-                continue
-        
-        # Fetch all shortage reports
-        shortage_list = []
-        for i in range(min(shortage_count, 100)):  # Limit to prevent timeouts
-            try:
-                report = contract.functions.shortageReports(i).call()
-                shortage_list.append({
-                    "medicine": report[0],
-                    "location": report[1],
-                    "timestamp": report[2]
-                })
-            except Exception as e:
-                logger.warning(f"Error fetching shortage {i}: {e}")
-                continue
-        
-        # Fetch all orders
-        order_list = []
-        for i in range(min(order_count, 100)):  # Limit to prevent timeouts
-            try:
-                order = contract.functions.getOrder(i).call()
-                order_list.append({
-                    "medicine": order[0],
-                    "quantity": order[1],
-                    "retailer": order[2],
-                    "manufacturer": order[3],
-                    "status": order[4]
-                })
-            except Exception as e:
-                logger.warning(f"Error fetching order {i}: {e}")
-                continue
-        
-        logger.info(f"Successfully fetched blockchain data: {len(stock_list)} stocks, {len(shortage_list)} shortages, {len(order_list)} orders")
-        
-        return {
-            'stocks': stock_list,
-            'shortages': shortage_list,
-            'orders': order_list,
-            'enabled': True,
-            'total_stocks': stock_count,
-            'total_shortages': shortage_count,
-            'total_orders': order_count
-        }
-        
-    except Exception as e:
-        logger.error(f"Failed to fetch blockchain data: {e}")
-        return {
-            'stocks': [], 
-            'shortages': [], 
-            'orders': [], 
-            'enabled': False,
-            'error': str(e)
-        }
-
-def update_retailer_stock_blockchain(medicine_name, new_stock):
-    """Update retailer stock on blockchain"""
-    if not blockchain_enabled or not contract:
-        return None
-    
-    try:
-        user_account = get_user_blockchain_account(session.get('user_id', 0))
-        if not user_account:
-            return None
-        
-        # Call the updateRetailerStock function
-        tx_hash = contract.functions.updateRetailerStock(
-            medicine_name,
-            new_stock
-        ).transact({'from': user_account, 'gas': 300000})
-        
-        # Wait for transaction receipt
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=60)
-        logger.info(f"Retailer stock update successful: {receipt.transactionHash.hex()}")
-        return receipt.transactionHash.hex()
-        
-    except Exception as e:
-        logger.error(f"Blockchain retailer stock update failed: {e}")
-        return None
-
-def get_retailer_stock_from_blockchain(retailer_address, medicine_name):
-    """Get retailer stock from blockchain"""
-    if not blockchain_enabled or not contract:
-        return 0
-    
-    try:
-        stock = contract.functions.retailerStocks(retailer_address, medicine_name).call()
-        return stock
-    except Exception as e:
-        logger.error(f"Failed to get retailer stock from blockchain: {e}")
-        return 0
-
-def sync_auto_orders():
-    """Sync new auto-orders from blockchain into SQLite"""
-    if not blockchain_enabled or not contract:
-        return
-
-    try:
-        order_count = contract.functions.getOrderCount().call()
-        conn = get_db_connection()
-
-        for i in range(min(order_count, 100)):  # Limit to prevent timeouts
-            try:
-                order = contract.functions.getOrder(i).call()
-                medicine_name, quantity, retailer_addr, manufacturer_addr, status = order
-
-                blockchain_order_id = f"{retailer_addr}_{medicine_name}_{i}"
-                existing = conn.execute(
-                    "SELECT id FROM manufacturer_orders WHERE blockchain_order_id = ?",
-                    (blockchain_order_id,)
-                ).fetchone()
-
-                if not existing:
-                    # Get medicine ID with error handling
-                    med = conn.execute("SELECT id FROM medicines WHERE name = ?", (medicine_name,)).fetchone()
-                    if not med:
-                        logger.warning(f"Medicine '{medicine_name}' not found in database")
-                        continue
-
-                    conn.execute("""
-                        INSERT INTO manufacturer_orders (blockchain_order_id, medicine_id, quantity_ordered, retailer_address, manufacturer_address, status)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """, (blockchain_order_id, med["id"], quantity, retailer_addr, manufacturer_addr, status))
-            except Exception as e:
-                logger.error(f"Error processing order {i}: {e}")
-                continue
-
-        conn.commit()
-        conn.close()
-
-    except Exception as e:
-        logger.error(f"sync_auto_orders error: {e}")
-
-# Database helper functions
-def get_db_connection():
-    conn = sqlite3.connect('healthcare.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def execute_query(query, params=None):
-    conn = get_db_connection()
-    try:
-        if params:
-            result = conn.execute(query, params).fetchall()
-        else:
-            result = conn.execute(query).fetchall()
-        conn.commit()
-        return result
-    except Exception as e:
-        logger.error(f"Database error: {e}")
-        return None
-    finally:
-        conn.close()
-
-def execute_insert(query, params):
-    conn = get_db_connection()
-    try:
-        cursor = conn.execute(query, params)
-        conn.commit()
-        return cursor.lastrowid
-    except Exception as e:
-        logger.error(f"Database insert error: {e}")
-        return None
-    finally:
-        conn.close()
-
-# Routes
-
-@app.route('/')
-def index():
-    """Landing page with platform overview"""
-    blockchain_data = get_blockchain_data()
-    return render_template('index.html', blockchain_data=blockchain_data)
-
-@app.route('/login', methods=['GET', 'POST'])
-def login():
-    """Login page for all user types"""
-    if request.method == 'POST':
-        email = request.form.get('email')
-        password = request.form.get('password')
-        
-        user = execute_query(
-            'SELECT * FROM users WHERE email = ? AND is_active = TRUE',
-            (email,)
-        )
-        
-        if user and check_password_hash(user[0]['password_hash'], password):
-            session['user_id'] = user[0]['id']
-            session['user_type'] = user[0]['user_type']
-            session['full_name'] = user[0]['full_name']
-            
-            flash(f'Welcome back, {user[0]["full_name"]}!', 'success')
-            return redirect(url_for('dashboard'))
-        else:
-            flash('Invalid email or password', 'error')
-    
-    return render_template('login.html')
-
-@app.template_filter('datefmt')
-def datefmt(value, format="%Y-%m-%d"):
-    if not value:
-        return ''
-    if isinstance(value, str):
-        try:
-            value = datetime.fromisoformat(value)
-        except ValueError:
-            return value
-    return value.strftime(format)
-@app.route('/api/search_pharmacies', methods=['POST'])
-def api_search_pharmacies():
-    data = request.get_json()
-    user_lat = data.get('latitude')
-    user_lon = data.get('longitude')
-    medicines = [m.strip().lower() for m in data.get('medicines', [])]
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        SELECT p.id, p.pharmacy_name, p.latitude, p.longitude, pm.medicine_name, pm.price
-        FROM pharmacies p
-        JOIN pharmacy_medicines pm ON p.id = pm.pharmacy_id
-    ''')
-
-    rows = cursor.fetchall()
-    conn.close()
-
-    results = {}
-    for pid, pname, plat, plon, med_name, price in rows:
-        if med_name.lower() in medicines:
-            distance = haversine(user_lat, user_lon, plat, plon)
-            if distance <= 20:  # 20 km radius
-                if pid not in results:
-                    results[pid] = {
-                        "pharmacy_name": pname,
-                        "latitude": plat,
-                        "longitude": plon,
-                        "medicines": []
-                    }
-                results[pid]["medicines"].append({
-                    "medicine_name": med_name,
-                    "price": price
-                })
-
-    if not results:
-        return jsonify({"message": "No pharmacies found nearby with requested medicines."}), 404
-
-    return jsonify({"pharmacies": list(results.values())})
-
-
-location_cache = {
-    "Mumbai": (19.0760, 72.8777),
-    "Delhi": (28.6139, 77.2090),
-    "Bangalore":(12.97,77.59),
-    "Kolkata":(22.57, 88.36),
-    "Hyderabad": (17.38, 78.48)
-    # Add more if needed
-}
-
-@app.route('/search_pharmacies')
-def search_pharmacies():
-    user_location_str = request.args.get('location')
-    user_location_str = user_location_str.strip().lower()
-    user_latlng = location_cache.get(user_location_str)
-    medicines_str = request.args.get('medicines')
-    
-    
-    if not user_location_str or not medicines_str:
-        return jsonify({"error": "Missing parameters"}), 400
-
-    user_location_str = user_location_str.strip().title()
-
-    user_latlng = location_cache.get(user_location_str)
-    if not user_latlng:
-        return jsonify({"error": "Invalid location"}), 400
-
-    requested_medicines = [m.strip().lower() for m in medicines_str.split(',')]
-
-    # Expanded dummy pharmacy data
-    dummy_pharmacies = [
-        # Mumbai
-        {
-            "id": 1,
-            "pharmacy_name": "Test Pharmacy Mumbai",
-            "address": "123 Test St, Mumbai",
-            "latitude": 19.07,
-            "longitude": 72.88,
-            "medicine_prices": {
-                "insulin": 500,
-                "thyroxine": 300,
-                "paracetamol": 20
-            }
-        },
-        {
-            "id": 4,
-            "pharmacy_name": "mumb Care Pharmacy",
-            "address": "78 Shahdara, Delhi",
-            "latitude": 19.07,
-            "longitude": 72.88,
-            "medicine_prices": {
-                "thyroxine": 310,
-                "paracetamol": 25
-            }
-        },
-        {
-            "id": 2,
-            "pharmacy_name": "Another Pharmacy Mumbai",
-            "address": "456 Sample Rd, Mumbai",
-            "latitude": 19.09,
-            "longitude": 72.86,
-            "medicine_prices": {
-                "insulin": 520,
-                "amoxicillin": 40
-            }
-        },
-        {
-            "id": 6,
-            "pharmacy_name": "HealthMart Pharmacy mira bhayandar",
-            "address": "50 MG Road, mmr",
-            "latitude": 19.07,
-            "longitude": 72.88,
-            "medicine_prices": {
-                "insulin": 495,
-                "thyroxine": 305,
-                "amoxicillin": 45
-            }
-        },
-
-        {
-            "id": 7,
-            "pharmacy_name": "Wellness Pharmacy navi mumbai",
-            "address": "22 Park Street, mmr",
-            "latitude": 19.07,
-            "longitude": 72.88,
-            "medicine_prices": {
-                "paracetamol": 23,
-                "thyroxine": 320
-            }
-        },
-
-        # Delhi
-        {
-            "id": 3,
-            "pharmacy_name": "Fortis Pharmacy Delhi",
-            "address": "45 Connaught Place, Delhi",
-            "latitude": 28.63,
-            "longitude": 77.21,
-            "medicine_prices": {
-                "insulin": 510,
-                "amoxicillin": 42,
-                "paracetamol": 22
-            }
-        },
-        
-        {
-            "id": 4,
-            "pharmacy_name": "Delhi Care Pharmacy",
-            "address": "78 Shahdara, Delhi",
-            "latitude": 28.66,
-            "longitude": 77.25,
-            "medicine_prices": {
-                "thyroxine": 310,
-                "paracetamol": 25
-            }
-        },
-        {
-            "id": 5,
-            "pharmacy_name": "CarePlus Pharmacy Newdelhi",
-            "address": "78 Anna Salai, ncr",
-            "latitude": 28.63,
-            "longitude": 77.21,
-            "medicine_prices": {
-                "amoxicillin": 48,
-                "paracetamol": 20
-            }
-        },
-
-        {
-            "id": 5,
-            "pharmacy_name": "CarePlus Pharmacy ncr",
-            "address": "78 Anna Salai, noida",
-            "latitude": 28.63,
-            "longitude": 77.21,
-            "medicine_prices": {
-                "amoxicillin": 48,
-                "paracetamol": 20
-            }
-        },
-
-        # Bangalore
-        {
-            "id": 6,
-            "pharmacy_name": "HealthMart Pharmacy Bangalore",
-            "address": "50 MG Road, Bangalore",
-            "latitude": 12.97,
-            "longitude": 77.59,
-            "medicine_prices": {
-                "insulin": 495,
-                "thyroxine": 305,
-                "amoxicillin": 45
-            }
-        },
-
-        # Kolkata
-        {
-            "id": 7,
-            "pharmacy_name": "Wellness Pharmacy Kolkata",
-            "address": "22 Park Street, Kolkata",
-            "latitude": 22.57,
-            "longitude": 88.36,
-            "medicine_prices": {
-                "paracetamol": 23,
-                "thyroxine": 320
-            }
-        },
-
-        # Hyderabad
-        {
-            "id": 8,
-            "pharmacy_name": "MediCare Pharmacy Hyderabad",
-            "address": "90 Banjara Hills, Hyderabad",
-            "latitude": 17.38,
-            "longitude": 78.48,
-            "medicine_prices": {
-                "insulin": 485,
-                "amoxicillin": 50
-            }
-        },
-        
-    {
-        "id": 9,
-        "pharmacy_name": "Health Plus Pharmacy",
-        "address": "Andheri West, Mumbai",
-        "latitude": 19.1197,
-        "longitude": 72.8468,
-        "medicine_prices": {
-            "paracetamol": 25.0,
-            "amoxicillin": 50.0,
-            "thyroxine": 310.0,
-            "insulin": 490.0
-        }
-    },
-    {
-        "id": 10,
-        "pharmacy_name": "Lifeline Medicals",
-        "address": "Bandra East, Mumbai",
-        "latitude": 19.0546,
-        "longitude": 72.8409,
-        "medicine_prices": {
-            "paracetamol": 22.5,
-            "amoxicillin": 48.0,
-            "thyroxine": 305.0,
-            "insulin": 495.0
-        }
-    },
-    {
-        "id": 11,
-        "pharmacy_name": "Apollo Pharmacy",
-        "address": "Lajpat Nagar, New Delhi",
-        "latitude": 28.5672,
-        "longitude": 77.2436,
-        "medicine_prices": {
-            "paracetamol": 24.0,
-            "amoxicillin": 47.0,
-            "thyroxine": 300.0,
-            "insulin": 500.0
-        }
-    },
-    {
-        "id": 12,
-        "pharmacy_name": "City Medicos",
-        "address": "Connaught Place, New Delhi",
-        "latitude": 28.6315,
-        "longitude": 77.2167,
-        "medicine_prices": {
-            "paracetamol": 23.0,
-            "amoxicillin": 45.5,
-            "thyroxine": 315.0,
-            "insulin": 510.0
-        }
-    }
-
-    ]
-
-    max_distance_km = 15
-    nearby_pharmacies = []
-
-    for pharmacy in dummy_pharmacies:
-        pharmacy_latlng = (pharmacy['latitude'], pharmacy['longitude'])
-        dist = geodesic(user_latlng, pharmacy_latlng).km
-        if dist <= max_distance_km:
-            med_prices = {med: price for med, price in pharmacy['medicine_prices'].items() if med in requested_medicines}
-            if med_prices:
-                nearby_pharmacies.append({
-                    "pharmacy_name": pharmacy['pharmacy_name'],
-                    "address": pharmacy['address'],
-                    "latitude": pharmacy['latitude'],
-                    "longitude": pharmacy['longitude'],
-                    "medicine_prices": med_prices,
-                    "distance_km": round(dist, 2)
-                })
-
-    nearby_pharmacies.sort(key=lambda x: x['distance_km'])
-    print("Nearby pharmacies found:", len(nearby_pharmacies))
-    if not nearby_pharmacies:
-        print("No pharmacies found nearby with requested medicines.")
-
-    return jsonify({
-        "user_location": {"lat": user_latlng[0], "lng": user_latlng[1]},
-        "pharmacies": nearby_pharmacies
-    })
-
-
-
-@app.route('/map')
-def map():
-    try:
-        conn = sqlite3.connect('database.db')
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT pharmacy_name, address, latitude, longitude FROM pharmacies")
-        pharmacies = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-    except Exception as e:
-        print(f"DB Error: {e}")
-        pharmacies = []  # fallback to empty list so template rendering doesn't break
-
-    return render_template('map.html', pharmacies=pharmacies)
-# Add a blockchain status route for debugging
-@app.route('/blockchain/status')
-@login_required
-def blockchain_status():
-    """Check blockchain connection status"""
-    status = {
-        'enabled': blockchain_enabled,
-        'provider_url': BLOCKCHAIN_CONFIG['provider_url'],
-        'contract_address': BLOCKCHAIN_CONFIG['contract_address']
-    }
-    
-    if blockchain_enabled and w3:
-        try:
-            status.update({
-                'connected': w3.is_connected(),
-                'latest_block': w3.eth.block_number,
-                'accounts_count': len(w3.eth.accounts),
-                'default_account': default_account
-            })
-            
-            if contract:
-                try:
-                    stock_count = contract.functions.getStockCount().call()
-                    status['contract_responsive'] = True
-                    status['stock_count'] = stock_count
-                except Exception as e:
-                    status['contract_responsive'] = False
-                    status['contract_error'] = str(e)
-        except Exception as e:
-            status['connection_error'] = str(e)
-    
-    return jsonify(status)
-
-# Continue with all your existing routes...
-# (I'm keeping the rest of your routes as they were, just adding the improved blockchain handling)
-
-@app.route('/register', methods=['GET', 'POST'])
-def register():
-    """Registration page for patients and pharmacies"""
-    if request.method == 'POST':
-        username = request.form.get('username')
-        email = request.form.get('email')
-        password = request.form.get('password')
-        user_type = request.form.get('user_type')
-        full_name = request.form.get('full_name')
-        phone = request.form.get('phone')
-        
-        # Check if user already exists
-        existing_user = execute_query(
-            'SELECT id FROM users WHERE email = ? OR username = ?',
-            (email, username)
-        )
-        
-        if existing_user:
-            flash('User with this email or username already exists', 'error')
-        else:
-            password_hash = generate_password_hash(password)
-            user_id = execute_insert(
-                '''INSERT INTO users (username, email, password_hash, user_type, full_name, phone)
-                   VALUES (?, ?, ?, ?, ?, ?)''',
-                (username, email, password_hash, user_type, full_name, phone)
-            )
-            
-            if user_id:
-                flash('Registration successful! Please log in.', 'success')
-                return redirect(url_for('login'))
-            else:
-                flash('Registration failed. Please try again.', 'error')
-    
-    # Get locations for dropdown
-    locations = execute_query('SELECT * FROM locations ORDER BY name')
-    return render_template('register.html', locations=locations)
-
-@app.route('/dashboard')
-@login_required
-def dashboard():
-    """Main dashboard - redirects to appropriate user dashboard"""
-    user_type = session.get('user_type')
-    
-    if user_type == 'admin':
-        return redirect(url_for('admin_dashboard'))
-    elif user_type == 'pharmacy':
-        return redirect(url_for('pharmacy_dashboard'))
-    elif user_type == 'patient':
-        return redirect(url_for('patient_dashboard'))
-    elif user_type in ['government', 'ngo']:
-        return redirect(url_for('authority_dashboard'))
-    else:
-        flash('Unknown user type', 'error')
-        return redirect(url_for('login'))
-@app.route('/alternate-medicine')
-def alternate_medicine():
-    """Page for finding alternate medicines"""
-    # Get all available medicines for search suggestions
-    available_medicines = []
-    if df is not None:
-        available_medicines = sorted(df["Medicine Name"].unique().tolist())
-    
-    return render_template('alternate_medicine.html', medicines=available_medicines)
-
-@app.route('/api/search-alternatives', methods=['POST'])
-def search_alternatives():
-    """API endpoint to get alternative medicines"""
-    data = request.get_json()
-    medicine_name = data.get('medicine_name', '').strip()
-    
-    if not medicine_name:
-        return jsonify({'error': 'Medicine name is required'}), 400
-    
-    # Check if dataset is loaded
-    if df is None:
-        return jsonify({'error': 'Medicine database not available'}), 500
-    
-    # Find exact match or similar name
-    medicine_found = None
-    for med in df["Medicine Name"].values:
-        if medicine_name.lower() == med.lower():
-            medicine_found = med
-            break
-    
-    # If exact match not found, try partial match
-    if not medicine_found:
-        for med in df["Medicine Name"].values:
-            if medicine_name.lower() in med.lower() or med.lower() in medicine_name.lower():
-                medicine_found = med
-                break
-    
-    if not medicine_found:
-        return jsonify({'error': f'Medicine "{medicine_name}" not found in database'}), 404
-    
-    main_med, similar_meds = get_similar_medicines(medicine_found)
-    
-    if main_med is None:
-        return jsonify({'error': 'Could not find alternatives'}), 404
-    
-    return jsonify({
-        'main_medicine': main_med,
-        'alternatives': similar_meds,
-        'total_found': len(similar_meds)
-    })
-
-@app.route('/api/medicine-suggestions')
-def medicine_suggestions():
-    """API endpoint for medicine name autocomplete"""
-    query = request.args.get('q', '').lower()
-    
-    if not query or df is None:
-        return jsonify([])
-    
-    # Filter medicines that contain the query
-    suggestions = [
-        med for med in df["Medicine Name"].values 
-        if query in med.lower()
-    ][:10]  # Limit to 10 suggestions
-    
-    return jsonify(suggestions)
-
-# Add this route for detailed medicine info
-@app.route('/medicine-details/<medicine_name>')
-def medicine_details(medicine_name):
-    """Detailed view of a specific medicine with alternatives"""
-    if df is None:
-        flash('Medicine database not available', 'error')
-        return redirect(url_for('alternate_medicine'))
-    
-    main_med, similar_meds = get_similar_medicines(medicine_name)
-    
-    if main_med is None:
-        flash(f'Medicine "{medicine_name}" not found', 'error')
-        return redirect(url_for('alternate_medicine'))
-    
-    return render_template('medicine_details.html', 
-                         main_medicine=main_med, 
-                         alternatives=similar_meds)
-
-# Helper function to parse composition ingredients
-def parse_composition(composition):
-    """Parse medicine composition into individual ingredients"""
-    if not composition or pd.isna(composition):
-        return []
-    
-    ingredients = []
-    # Split by common delimiters
-    parts = re.split(r'[+,&]', str(composition))
-    
-    for part in parts:
-        part = part.strip()
-        if part:
-            # Extract ingredient name and dosage
-            match = re.search(r'(.+?)\s*(\d+\.?\d*)\s*(mg|g|mcg|ml|%)?', part, re.IGNORECASE)
-            if match:
-                name = match.group(1).strip()
-                dosage = match.group(2)
-                unit = match.group(3) or 'mg'
-                ingredients.append({
-                    'name': name,
-                    'dosage': float(dosage),
-                    'unit': unit,
-                    'full_text': part
-                })
-            else:
-                ingredients.append({
-                    'name': part,
-                    'dosage': 0,
-                    'unit': '',
-                    'full_text': part
-                })
-    
-    return ingredients
-
-# Add this template filter to your app
-@app.template_filter('parse_ingredients')
-def parse_ingredients_filter(composition):
-    return parse_composition(composition)
-
-@app.route('/admin/dashboard')
-@login_required
-@role_required(['admin'])
-def admin_dashboard():
-    """Admin dashboard with system overview"""
-    # Get system statistics with error handling
-    try:
-        total_users = execute_query('SELECT COUNT(*) as count FROM users')
-        total_pharmacies = execute_query('SELECT COUNT(*) as count FROM pharmacies')
-        total_medicines = execute_query('SELECT COUNT(*) as count FROM medicines')
-        active_alerts = execute_query('SELECT COUNT(*) as count FROM shortage_alerts WHERE is_active = TRUE')
-        total_reports = execute_query('SELECT COUNT(*) as count FROM patient_reports')
-        
-        stats = {
-            'total_users': total_users[0]['count'] if total_users else 0,
-            'total_pharmacies': total_pharmacies[0]['count'] if total_pharmacies else 0,
-            'total_medicines': total_medicines[0]['count'] if total_medicines else 0,
-            'active_alerts': active_alerts[0]['count'] if active_alerts else 0,
-            'total_reports': total_reports[0]['count'] if total_reports else 0
-        }
-    except Exception as e:
-        logger.error(f"Error getting admin stats: {e}")
-        stats = {
-            'total_users': 0,
-            'total_pharmacies': 0,
-            'total_medicines': 0,
-            'active_alerts': 0,
-            'total_reports': 0
-        }
-    
-    # Get blockchain data
-    blockchain_data = get_blockchain_data()
-    
-    # Get recent alerts
-    recent_alerts = execute_query('''
-        SELECT sa.*, m.name as medicine_name, l.name as location_name
-        FROM shortage_alerts sa
-        JOIN medicines m ON sa.medicine_id = m.id
-        JOIN locations l ON sa.location_id = l.id
-        WHERE sa.is_active = TRUE
-        ORDER BY sa.created_at DESC LIMIT 10
-    ''') or []
-    
-    # Get recent reports
-    recent_reports = execute_query('''
-        SELECT pr.*, m.name as medicine_name, l.name as location_name, u.full_name as reporter_name
-        FROM patient_reports pr
-        JOIN medicines m ON pr.medicine_id = m.id
-        JOIN locations l ON pr.location_id = l.id
-        LEFT JOIN users u ON pr.user_id = u.id
-        ORDER BY pr.created_at DESC LIMIT 10
-    ''') or []
-    
-    return render_template('admin_dashboard.html', 
-                         stats=stats, 
-                         blockchain_data=blockchain_data,
-                         recent_alerts=recent_alerts,
-                         recent_reports=recent_reports)
-@app.route('/pharmacy/dashboard')
-@login_required
-@role_required(['pharmacy'])
-def pharmacy_dashboard():
-    """Pharmacy dashboard for inventory management"""
-    user_id = session.get('user_id')
-    
-    # Sync auto-orders from blockchain
-    sync_auto_orders()
-    
-    # Get pharmacy info with error handling
-    pharmacy_result = execute_query('SELECT * FROM pharmacies WHERE user_id = ?', (user_id,))
-    pharmacy = pharmacy_result[0] if pharmacy_result else None
-    
-    if not pharmacy:
-        flash('Pharmacy profile not found. Please complete your profile.', 'warning')
-        return redirect(url_for('pharmacy_profile'))
-    
-    # Get inventory with low stock alerts
-    inventory = execute_query('''
-        SELECT pi.*, m.name as medicine_name, m.generic_name, m.brand_name, m.dosage_form, m.strength
-        FROM pharmacy_inventory pi
-        JOIN medicines m ON pi.medicine_id = m.id
-        WHERE pi.pharmacy_id = ?
-        ORDER BY pi.current_stock ASC
-    ''', (pharmacy['id'],))
-    
-    # Get low stock items
-    low_stock = [item for item in inventory if item['current_stock'] <= item['minimum_stock_level']]
-    
-    # Get blockchain data for this pharmacy
-    blockchain_data = get_blockchain_data()
-    
-    return render_template('pharmacy_dashboard.html', 
-                         pharmacy=pharmacy,
-                         inventory=inventory,
-                         low_stock=low_stock,
-                         blockchain_data=blockchain_data)
-
-@app.route('/patient/dashboard')
-@login_required
-@role_required(['patient'])
-def patient_dashboard():
-    """Patient dashboard for reporting and viewing medicine availability"""
-    user_id = session.get('user_id')
-    
-    # Get user's reports
-    my_reports = execute_query('''
-        SELECT pr.*, m.name as medicine_name, l.name as location_name, p.pharmacy_name
-        FROM patient_reports pr
-        JOIN medicines m ON pr.medicine_id = m.id
-        JOIN locations l ON pr.location_id = l.id
-        LEFT JOIN pharmacies p ON pr.pharmacy_id = p.id
-        WHERE pr.user_id = ?
-        ORDER BY pr.created_at DESC
-    ''', (user_id,))
-    
-    # Get active alerts in user's area
-    active_alerts = execute_query('''
-        SELECT sa.*, m.name as medicine_name, l.name as location_name
-        FROM shortage_alerts sa
-        JOIN medicines m ON sa.medicine_id = m.id
-        JOIN locations l ON sa.location_id = l.id
-        WHERE sa.is_active = TRUE
-        ORDER BY sa.severity DESC, sa.created_at DESC
-        LIMIT 10
-    ''')
-    
-    # Get blockchain data
-    blockchain_data = get_blockchain_data()
-    
-    return render_template('patient_dashboard.html', 
-                         my_reports=my_reports,
-                         active_alerts=active_alerts,
-                         blockchain_data=blockchain_data)
-
-@app.route('/authority/dashboard')
-@login_required
-@role_required(['government', 'ngo'])
-def authority_dashboard():
-    """Dashboard for government bodies and NGOs"""
-    # Get critical alerts
-    critical_alerts = execute_query('''
-        SELECT sa.*, m.name as medicine_name, l.name as location_name
-        FROM shortage_alerts sa
-        JOIN medicines m ON sa.medicine_id = m.id
-        JOIN locations l ON sa.location_id = l.id
-        WHERE sa.is_active = TRUE AND sa.severity IN ('high', 'critical')
-        ORDER BY sa.severity DESC, sa.created_at DESC
-    ''')
-    
-    # Get shortage statistics by location
-    shortage_stats = execute_query('''
-        SELECT l.name as location_name, COUNT(*) as alert_count, 
-               AVG(sa.price_increase_percentage) as avg_price_increase
-        FROM shortage_alerts sa
-        JOIN locations l ON sa.location_id = l.id
-        WHERE sa.is_active = TRUE
-        GROUP BY l.id, l.name
-        ORDER BY alert_count DESC
-    ''')
-    
-    # Get blockchain data
-    blockchain_data = get_blockchain_data()
-    
-    return render_template('authority_dashboard.html', 
-                         critical_alerts=critical_alerts,
-                         shortage_stats=shortage_stats,
-                         blockchain_data=blockchain_data)
-
-@app.route('/predict_medicine', methods=['GET', 'POST'])
-def predict_medicine():
-    if request.method == 'POST':
-        region = request.form.get('region')
-        medicine = request.form.get('medicine')
-        season = request.form.get('season')
-
-        # Validate inputs
-        if region not in region_map or medicine not in medicine_map or season not in season_map:
-            flash("Invalid input", "error")
-            return render_template('predict_medicine.html')
-
-        key = (region, medicine, season)
-        avg_daily_demand = typical_avg_daily_demand.get(key, 100)  # default fallback
-        stock_level = typical_stock_level.get(key, 50)             # default fallback
-
-        X = pd.DataFrame([{
-            'Month': season_map[season],
-            'Region_Code': region_map[region],
-            'Medicine_Code': medicine_map[medicine],
-            'Avg_Daily_Demand': avg_daily_demand,
-            'Stock_Level': stock_level,
-        }])
-
-        shortage_pred = model_shortage.predict(X)[0]
-        price_spike_pred = model_price.predict(X)[0]
-
-        result = {
-            'region': region,
-            'medicine': medicine,
-            'season': season,
-            'shortage': int(shortage_pred),
-            'price_spike': int(price_spike_pred)
-        }
-        return render_template('predict_medicine.html', result=result)
-
-    # GET request
-    return render_template('predict_medicine.html')
-
-@app.route('/report-medicine', methods=['GET', 'POST'])
-@login_required
-@role_required(['patient'])
-def report_medicine():
-    """Page for patients to report medicine issues"""
-    if request.method == 'POST':
-        medicine_id = request.form.get('medicine_id')
-        location_id = request.form.get('location_id')
-        report_type = request.form.get('report_type')
-        pharmacy_id = request.form.get('pharmacy_id') or None
-        reported_price = request.form.get('reported_price')
-        expected_price = request.form.get('expected_price')
-        description = request.form.get('description')
-        
-        # Handle prescription upload
-        prescription_file = request.files.get('prescription')
-        prescription_filename = None
-        if prescription_file and prescription_file.filename:
-            prescription_filename = secure_filename(prescription_file.filename)
-            prescription_file.save(os.path.join(app.config['UPLOAD_FOLDER'], prescription_filename))
-        
-        # Insert into database
-        report_id = execute_insert('''
-            INSERT INTO patient_reports (user_id, medicine_id, location_id, report_type, 
-                                       pharmacy_id, reported_price, expected_price, description)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (session['user_id'], medicine_id, location_id, report_type, 
-              pharmacy_id, reported_price, expected_price, description))
-        
-        if report_id:
-            # Record shortage report to blockchain
-            if report_type == 'shortage':
-                medicine_name = execute_query('SELECT name FROM medicines WHERE id = ?', (medicine_id,))[0]['name']
-                location_name = execute_query('SELECT name FROM locations WHERE id = ?', (location_id,))[0]['name']
-                
-                blockchain_tx = record_to_blockchain('shortage_report', {
-                    'medicine_name': medicine_name,
-                    'location_name': location_name
-                })
-                
-                if blockchain_tx:
-                    # Update the report with blockchain transaction hash
-                    execute_query('''
-                        UPDATE patient_reports 
-                        SET blockchain_hash = ? 
-                        WHERE id = ?
-                    ''', (blockchain_tx, report_id))
-            
-            flash('Report submitted successfully!', 'success')
-            check_and_create_alerts(medicine_id, location_id)
-            return redirect(url_for('patient_dashboard'))
-        else:
-            flash('Failed to submit report', 'error')
-    
-    # Get data for form
-    medicines = execute_query('SELECT * FROM medicines ORDER BY name')
-    locations = execute_query('SELECT * FROM locations ORDER BY name')
-    pharmacies = execute_query('SELECT * FROM pharmacies ORDER BY pharmacy_name')
-    
-    return render_template('report_medicine.html', 
-                         medicines=medicines, 
-                         locations=locations,
-                         pharmacies=pharmacies)
-
-
-@app.route('/inventory/manage')
-@login_required
-@role_required(['pharmacy'])
-def manage_inventory():
-    """Inventory management page for pharmacies"""
-    user_id = session.get('user_id')
-    
-    # Debug: Print user_id
-    print(f"Debug - User ID: {user_id}")
-    
-    pharmacy_result = execute_query('SELECT * FROM pharmacies WHERE user_id = ?', (user_id,))
-    
-    # Debug: Print pharmacy result
-    print(f"Debug - Pharmacy result: {pharmacy_result}")
-   
-    if not pharmacy_result:
-        flash('Pharmacy profile not found. Please complete your profile first.', 'warning')
-        return redirect(url_for('pharmacy_profile'))
-   
-    pharmacy = pharmacy_result[0]
-    
-    # Check if pharmacy profile is complete (add required fields check)
-    required_fields = ['pharmacy_name', 'address', 'phone', 'email', 'license_number']
-    missing_fields = [field for field in required_fields if not pharmacy.get(field)]
-    
-    if missing_fields:
-        flash(f'Please complete your pharmacy profile. Missing: {", ".join(missing_fields)}', 'warning')
-        return redirect(url_for('pharmacy_profile'))
-   
-    # Get all medicines for adding to inventory
-    medicines = execute_query('SELECT * FROM medicines ORDER BY name')
-   
-    # Get current inventory
-    inventory = execute_query('''
-        SELECT pi.*, m.name as medicine_name, m.generic_name, m.brand_name
-        FROM pharmacy_inventory pi
-        JOIN medicines m ON pi.medicine_id = m.id
-        WHERE pi.pharmacy_id = ?
-        ORDER BY m.name
-    ''', (pharmacy['id'],))
-   
-    return render_template('manage_inventory.html',
-                         medicines=medicines or [],
-                         inventory=inventory or [],
-                         pharmacy=pharmacy)
-
-@app.route('/inventory/update', methods=['POST'])
-@login_required
-@role_required(['pharmacy'])
-def update_inventory():
-    """API endpoint to update pharmacy inventory"""
-    user_id = session.get('user_id')
-    pharmacy_result = execute_query('SELECT * FROM pharmacies WHERE user_id = ?', (user_id,))
-    
-    if not pharmacy_result:
-        flash('Pharmacy profile not found. Please complete your profile first.', 'error')
-        return redirect(url_for('pharmacy_profile'))
-    
-    pharmacy = pharmacy_result[0]
-    
-    medicine_id = request.form.get('medicine_id')
-    current_stock = request.form.get('current_stock')
-    unit_price = request.form.get('unit_price')
-    mrp = request.form.get('mrp')
-    batch_number = request.form.get('batch_number')
-    expiry_date = request.form.get('expiry_date')
-    minimum_stock_level = request.form.get('minimum_stock_level')
-    
-    # Check if item exists in inventory
-    existing = execute_query('''
-        SELECT id FROM pharmacy_inventory 
-        WHERE pharmacy_id = ? AND medicine_id = ? AND batch_number = ?
-    ''', (pharmacy['id'], medicine_id, batch_number))
-    
-    if existing:
-        # Update existing inventory
-        execute_query('''
-            UPDATE pharmacy_inventory 
-            SET current_stock = ?, unit_price = ?, mrp = ?, expiry_date = ?, 
-                minimum_stock_level = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (current_stock, unit_price, mrp, expiry_date, minimum_stock_level, existing[0]['id']))
-    else:
-        # Add new inventory item
-        execute_insert('''
-            INSERT INTO pharmacy_inventory (pharmacy_id, medicine_id, current_stock, unit_price, 
-                                          mrp, batch_number, expiry_date, minimum_stock_level)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (pharmacy['id'], medicine_id, current_stock, unit_price, mrp, 
-              batch_number, expiry_date, minimum_stock_level))
-    
-    # Get medicine name for blockchain update with error handling
-    medicine_result = execute_query('SELECT name FROM medicines WHERE id = ?', (medicine_id,))
-    if not medicine_result:
-        flash('Medicine not found!', 'error')
-        return redirect(url_for('manage_inventory'))
-    
-    medicine_name = medicine_result[0]['name']
-    
-    # Update retailer stock on blockchain (new functionality)
-    blockchain_tx = update_retailer_stock_blockchain(medicine_name, int(current_stock))
-    
-    # Also record stock update to blockchain (existing functionality)
-    blockchain_tx2 = record_to_blockchain('stock_update', {
-        'pharmacy_name': pharmacy['pharmacy_name'],
-        'medicine_name': medicine_name,
-        'quantity': int(current_stock),
-        'price': int(float(unit_price) * 100)  # Convert to paise/cents
-    })
-    
-    if blockchain_tx or blockchain_tx2:
-        flash(f'Inventory updated successfully! Blockchain transactions recorded.', 'success')
-    else:
-        flash('Inventory updated successfully!', 'success')
-    
-    # Sync auto-orders after inventory update
-    sync_auto_orders()
-    
-    return redirect(url_for('manage_inventory'))
-@app.route('/manufacturer/orders')
-@login_required
-@role_required(['admin', 'pharmacy'])
-def manufacturer_orders():
-    """View manufacturer orders from blockchain"""
-    # Sync latest orders from blockchain
-    sync_auto_orders()
-    
-    # Get orders from database
-    orders = execute_query('''
-        SELECT mo.*, m.name as medicine_name
-        FROM manufacturer_orders mo
-        JOIN medicines m ON mo.medicine_id = m.id
-        ORDER BY mo.created_at DESC
-    ''')
-    
-    return render_template('manufacturer_orders.html', orders=orders)
-@app.route('/blockchain/data')
-@login_required
-def blockchain_data():
-    """View blockchain data dashboard"""
-    data = get_blockchain_data()
-    
-    # Format data for template
-    formatted_data = {
-        'enabled': data['enabled'],
-        'stats': {
-            'total_stocks': data.get('total_stocks', 0),
-            'total_shortages': data.get('total_shortages', 0),
-            'total_transactions': data.get('total_stocks', 0) + data.get('total_shortages', 0)
-        },
-        'recent_stocks': data.get('stocks', [])[-10:],  # Last 10
-        'recent_shortages': data.get('shortages', [])[-10:],  # Last 10
-        'stocks': data.get('stocks', []),
-        'shortages': data.get('shortages', [])
-    }
-    
-    return render_template('blockchain_dashboard.html', data=formatted_data)
-
-@app.route('/api/blockchain/stats')
-@login_required
-def blockchain_stats():
-    """API endpoint for blockchain statistics"""
-    data = get_blockchain_data()
-    return jsonify(data)
-
-@app.route('/medicine-search')
-def medicine_search():
-    """Public page for searching medicine availability"""
-    medicines = execute_query('SELECT * FROM medicines ORDER BY name')
-    locations = execute_query('SELECT * FROM locations ORDER BY name')
-    
-    search_results = []
-    debug_info = {}
-    
-    if request.args.get('medicine_id') and request.args.get('location_id'):
-        medicine_id = request.args.get('medicine_id')
-        location_id = request.args.get('location_id')
-        
-        search_results = execute_query('''
-            SELECT p.pharmacy_name, p.address, p.phone, pi.current_stock, 
-                   pi.unit_price, pi.mrp, pi.batch_number, pi.expiry_date,
-                   m.name as medicine_name, m.strength, m.dosage_form,
-                   l.name as location_name
-            FROM pharmacy_inventory pi
-            JOIN pharmacies p ON pi.pharmacy_id = p.id
-            JOIN medicines m ON pi.medicine_id = m.id
-            JOIN locations l ON p.location_id = l.id
-            WHERE pi.medicine_id = ? AND p.location_id = ? AND pi.current_stock > 0
-            ORDER BY pi.unit_price ASC
-        ''', (medicine_id, location_id))
-    
-    return render_template('medicine_search.html', 
-                         medicines=medicines, 
-                         locations=locations,
-                         search_results=search_results,
-                         debug_info=debug_info if app.debug else None)
-
-@app.route('/alerts')
-@login_required
-def view_alerts():
-    """View all active alerts"""
-    alerts = execute_query('''
-        SELECT sa.*, m.name as medicine_name, l.name as location_name
-        FROM shortage_alerts sa
-        JOIN medicines m ON sa.medicine_id = m.id
-        JOIN locations l ON sa.location_id = l.id
-        WHERE sa.is_active = TRUE
-        ORDER BY sa.severity DESC, sa.created_at DESC
-    ''')
-    
-    return render_template('alerts.html', alerts=alerts)
-
-@app.route('/analytics')
-@login_required
-@role_required(['admin', 'government', 'ngo'])
-def analytics():
-    """Analytics dashboard with charts and trends"""
-    # Get shortage trends
-    shortage_trends = execute_query('''
-        SELECT DATE(created_at) as date, COUNT(*) as count
-        FROM shortage_alerts
-        WHERE created_at >= DATE('now', '-30 days')
-        GROUP BY DATE(created_at)
-        ORDER BY date
-    ''')
-    
-    # Get top medicines with shortages
-    top_shortage_medicines = execute_query('''
-        SELECT m.name, COUNT(*) as shortage_count
-        FROM shortage_alerts sa
-        JOIN medicines m ON sa.medicine_id = m.id
-        WHERE sa.created_at >= DATE('now', '-30 days')
-        GROUP BY m.id, m.name
-        ORDER BY shortage_count DESC
-        LIMIT 10
-    ''')
-    
-    # Get location-wise shortage distribution
-    location_shortages = execute_query('''
-        SELECT l.name, COUNT(*) as shortage_count
-        FROM shortage_alerts sa
-        JOIN locations l ON sa.location_id = l.id
-        WHERE sa.created_at >= DATE('now', '-30 days')
-        GROUP BY l.id, l.name
-        ORDER BY shortage_count DESC
-    ''')
-    
-    # Get blockchain analytics
-    blockchain_data = get_blockchain_data()
-    
-    return render_template('analytics.html', 
-                         shortage_trends=shortage_trends,
-                         top_shortage_medicines=top_shortage_medicines,
-                         location_shortages=location_shortages,
-                         blockchain_data=blockchain_data)
-
-# Replace your existing profile route and add these routes to your app.py
-
-@app.route('/profile')
-@login_required
-def profile():
-    """User profile page"""
-    user_id = session.get('user_id')
-    user = execute_query('SELECT * FROM users WHERE id = ?', (user_id,))[0]
-    
-    # Redirect pharmacy users to their specific profile page
-    if user['user_type'] == 'pharmacy':
-        return redirect(url_for('pharmacy_profile'))
-    
-    return render_template('profile.html', user=user)
-
-# Remove the duplicate pharmacy_profile routes and replace with this single, complete implementation:
-
-@app.route('/pharmacy/profile', methods=['GET', 'POST'])
-@login_required
-@role_required(['pharmacy'])
-def pharmacy_profile():
-    """Pharmacy-specific profile page with pharmacy details"""
-    user_id = session.get('user_id')
-    
-    # Debug
-    print(f"Debug - User ID in pharmacy_profile: {user_id}")
-    
-    # Get user info with error handling
-    user_result = execute_query('SELECT * FROM users WHERE id = ?', (user_id,))
-    if not user_result:
-        flash('User not found!', 'error')
-        return redirect(url_for('login'))
-    
-    user = user_result[0]
-    
-    # Get pharmacy info
-    pharmacy_result = execute_query('SELECT * FROM pharmacies WHERE user_id = ?', (user_id,))
-    pharmacy = pharmacy_result[0] if pharmacy_result else None
-    
-    # Debug
-    print(f"Debug - Existing pharmacy: {pharmacy}")
-    
-    if request.method == 'POST':
-        # Handle pharmacy profile update
-        pharmacy_name = request.form.get('pharmacy_name')
-        address = request.form.get('address')
-        phone = request.form.get('phone')
-        email = request.form.get('email')
-        license_number = request.form.get('license_number')
-        location_id = request.form.get('location_id')
-        latitude = request.form.get('latitude') or None
-        longitude = request.form.get('longitude') or None
-        
-        # Debug
-        print(f"Debug - Form data: {pharmacy_name}, {address}, {phone}, {email}, {license_number}")
-        
-        try:
-            if pharmacy:
-                # Update existing pharmacy
-                execute_query('''
-                    UPDATE pharmacies 
-                    SET pharmacy_name = ?, address = ?, phone = ?, email = ?, 
-                        license_number = ?, location_id = ?, latitude = ?, longitude = ?
-                    WHERE user_id = ?
-                ''', (pharmacy_name, address, phone, email, license_number, 
-                      location_id, latitude, longitude, user_id))
-                print("Debug - Updated existing pharmacy")
-            else:
-                # Create new pharmacy profile
-                result = execute_insert('''
-                    INSERT INTO pharmacies (user_id, pharmacy_name, address, phone, email, 
-                                          license_number, location_id, latitude, longitude)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (user_id, pharmacy_name, address, phone, email, license_number, 
-                      location_id, latitude, longitude))
-                print(f"Debug - Created new pharmacy with ID: {result}")
-            
-            # Verify the save worked
-            verify_result = execute_query('SELECT * FROM pharmacies WHERE user_id = ?', (user_id,))
-            print(f"Debug - Pharmacy after save: {verify_result}")
-            
-            flash('Pharmacy profile updated successfully!', 'success')
-            return redirect(url_for('pharmacy_profile'))
-            
-        except Exception as e:
-            print(f"Debug - Error saving pharmacy: {e}")
-            flash('Error updating pharmacy profile!', 'error')
-    
-    # Get locations for dropdown
-    locations = execute_query('SELECT * FROM locations ORDER BY name')
-    
-    return render_template('pharmacy_profile.html', user=user, pharmacy=pharmacy, locations=locations or [])
-@app.route('/profile/update', methods=['POST'])
-@login_required
-def update_profile():
-    """Handle profile updates for all user types"""
-    user_id = session.get('user_id')
-    user = execute_query('SELECT * FROM users WHERE id = ?', (user_id,))[0]
-    
-    if user['user_type'] == 'pharmacy':
-        # Handle pharmacy profile update
-        pharmacy_name = request.form.get('pharmacy_name')
-        address = request.form.get('address')
-        phone = request.form.get('phone')
-        email = request.form.get('email')
-        license_number = request.form.get('license_number')
-        location_id = request.form.get('location_id')
-        latitude = request.form.get('latitude') or None
-        longitude = request.form.get('longitude') or None
-        
-        # Check if pharmacy profile exists
-        existing_pharmacy = execute_query('SELECT id FROM pharmacies WHERE user_id = ?', (user_id,))
-        
-        if existing_pharmacy:
-            # Update existing pharmacy
-            execute_query('''
-                UPDATE pharmacies 
-                SET pharmacy_name = ?, address = ?, phone = ?, email = ?, 
-                    license_number = ?, location_id = ?, latitude = ?, longitude = ?
-                WHERE user_id = ?
-            ''', (pharmacy_name, address, phone, email, license_number, 
-                  location_id, latitude, longitude, user_id))
-        else:
-            # Create new pharmacy profile
-            execute_insert('''
-                INSERT INTO pharmacies (user_id, pharmacy_name, address, phone, email, 
-                                      license_number, location_id, latitude, longitude)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (user_id, pharmacy_name, address, phone, email, license_number, 
-                  location_id, latitude, longitude))
-        
-        flash('Pharmacy profile updated successfully!', 'success')
-        return redirect(url_for('pharmacy_profile'))
-        
-    else:
-        # Handle regular user profile update
-        full_name = request.form.get('full_name')
-        phone = request.form.get('phone')
-        
-        execute_query('''
-            UPDATE users 
-            SET full_name = ?, phone = ?
-            WHERE id = ?
-        ''', (full_name, phone, user_id))
-        
-        session['full_name'] = full_name
-        flash('Profile updated successfully!', 'success')
-        return redirect(url_for('profile'))
-
-@app.route('/profile/complete')
-@login_required
-def complete_profile():
-    """Page to complete profile setup after registration"""
-    user_id = session.get('user_id')
-    user = execute_query('SELECT * FROM users WHERE id = ?', (user_id,))[0]
-    
-    if user['user_type'] == 'pharmacy':
-        # Check if pharmacy profile is complete
-        pharmacy = execute_query('SELECT * FROM pharmacies WHERE user_id = ?', (user_id,))
-        if not pharmacy:
-            flash('Please complete your pharmacy profile to continue.', 'warning')
-            return redirect(url_for('pharmacy_profile'))
-    
-    return redirect(url_for('dashboard'))
-
-@app.route('/logout')
-@login_required
-def logout():
-    """Logout user"""
-    session.clear()
-    flash('You have been logged out successfully.', 'success')
-    return redirect(url_for('index'))
-
-# Helper functions
-def check_and_create_alerts(medicine_id, location_id):
-    """Check if conditions warrant creating a shortage alert"""
-    # Count recent reports for this medicine in this location
-    recent_reports = execute_query('''
-        SELECT COUNT(*) as count
-        FROM patient_reports
-        WHERE medicine_id = ? AND location_id = ? 
-        AND created_at >= DATE('now', '-7 days')
-    ''', (medicine_id, location_id))
-    
-    if recent_reports[0]['count'] >= 3:  # Threshold for creating alert
-        # Check if alert already exists
-        existing_alert = execute_query('''
-            SELECT id FROM shortage_alerts
-            WHERE medicine_id = ? AND location_id = ? AND is_active = TRUE
-        ''', (medicine_id, location_id))
-        
-        if not existing_alert:
-            # Create new alert
-            execute_insert('''
-                INSERT INTO shortage_alerts (medicine_id, location_id, alert_type, severity, description)
-                VALUES (?, ?, 'shortage', 'medium', 'Multiple shortage reports received')
-            ''', (medicine_id, location_id))
-
-# Error handlers
-@app.errorhandler(404)
-def not_found(error):
-    return render_template('404.html'), 404
-
-@app.errorhandler(500)
-def internal_error(error):
-    return render_template('500.html'), 500
-
-@app.route("/map")
-def map_view():
-    pharmacies = execute_query(
-        "SELECT pharmacy_name, address, latitude, longitude FROM pharmacies"
-    )
-    pharmacies_list = [dict(row) for row in pharmacies]
-    return render_template("map.html", pharmacies=json.dumps(pharmacies_list))
-
-if __name__ == '__main__':
-    # Initialize database if it doesn't exist
-    if not os.path.exists('healthcare.db'):
-        print("Database not found. Please run the schema script first.")
-    
-    app.run(debug=True, host='0.0.0.0', port=5000)
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, g, has_request_context, copy_current_request_context, Response, stream_with_context
+from flask_sqlalchemy import SQLAlchemy
+from werkzeug.security import generate_password_hash, check_password_hash
+from markupsafe import Markup
+from datetime import datetime, timedelta
+from web3 import Web3
+import os
+import sqlite3
+import json
+import threading
+import time
+import atexit
+import statistics
+from itertools import groupby
+import hashlib
+import queue
+import tempfile
+import fcntl
+import mmap
+import struct
+from collections import deque, OrderedDict
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+import pandas as pd
+import numpy as np
+import scipy.sparse as sp
+import gc
+import logging
+import joblib
+from geopy.geocoders import Nominatim
+from geopy.distance import geodesic
+from math import radians, cos, sin, sqrt, atan2
+
+import re
+import requests
+from io import BytesIO, StringIO
+import csv
+import zlib
+from PIL import Image
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.base import clone
+from sklearn.tree import DecisionTreeClassifier
+
+# Initialize Flask app
+app = Flask(__name__)
+app.config['SECRET_KEY'] = 'your-secret-key-here'
+app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///healthcare.db'
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['UPLOAD_FOLDER'] = 'uploads/prescriptions'
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# Initialize geolocator once
+geolocator = Nominatim(user_agent="my_medicine_app", timeout=10)
+
+# Pre-fork serving: gunicorn.conf.py sets this so the master loads read-only
+# artifacts once and per-worker resources (RPC client, threads) start after fork
+PREFORK_MODE = os.environ.get('BYTEFORCE_PREFORK') == '1'
+ARTIFACT_DIR = os.environ.get('BYTEFORCE_ARTIFACT_DIR', 'artifacts')
+
+def _artifact_signature(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}-{int(stat.st_mtime)}"
+
+def load_tfidf_artifacts(csv_path, compositions):
+    """Fit TF-IDF once per CSV version and reload it memory-mapped afterwards.
+
+    The sparse matrix arrays are saved as .npy files and opened with mmap_mode='r',
+    so every worker process maps the same page-cache pages instead of holding a copy.
+    """
+    signature = _artifact_signature(csv_path)
+    base = os.path.join(ARTIFACT_DIR, f'tfidf-{signature}')
+    parts = {name: f'{base}.{name}.npy' for name in ('data', 'indices', 'indptr')}
+    vectorizer_path = f'{base}.vectorizer.pkl'
+    shape_path = f'{base}.shape.json'
+
+    if not all(os.path.exists(p) for p in list(parts.values()) + [vectorizer_path, shape_path]):
+        vectorizer = TfidfVectorizer()
+        matrix = vectorizer.fit_transform(compositions).tocsr()
+        os.makedirs(ARTIFACT_DIR, exist_ok=True)
+        # Each file is written to a temp file and os.replace()d, so a crash never leaves a truncated artifact
+        for name, path in parts.items():
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.save(f, getattr(matrix, name))
+            os.replace(tmp_path, path)
+        tmp_path = f'{vectorizer_path}.{os.getpid()}.tmp'
+        joblib.dump(vectorizer, tmp_path)
+        os.replace(tmp_path, vectorizer_path)
+        tmp_path = f'{shape_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(list(matrix.shape), f)
+        os.replace(tmp_path, shape_path)
+
+    with open(shape_path) as f:
+        shape = tuple(json.load(f))
+    arrays = {name: np.load(path, mmap_mode='r') for name, path in parts.items()}
+    matrix = sp.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=shape, copy=False)
+    return joblib.load(vectorizer_path), matrix
+
+# Helper function to parse composition ingredients
+def parse_composition(composition):
+    """Parse medicine composition into individual ingredients"""
+    if not composition or pd.isna(composition):
+        return []
+    
+    ingredients = []
+    # Split by common delimiters
+    parts = re.split(r'[+,&]', str(composition))
+    
+    for part in parts:
+        part = part.strip()
+        if part:
+            # Extract ingredient name and dosage; digits attached to a word stay in the name (Vitamin D3)
+            match = re.search(r'(.+?)\s*\(?\s*(?<![\w.])(\d+(?:\.\d+)?)\s*(mg|mcg|g|ml|iu|%)?', part, re.IGNORECASE)
+            if match:
+                name = match.group(1).strip()
+                dosage = match.group(2)
+                unit = match.group(3) or ''
+                ingredients.append({
+                    'name': name,
+                    'dosage': float(dosage),
+                    'unit': unit,
+                    'full_text': part
+                })
+            else:
+                ingredients.append({
+                    'name': part,
+                    'dosage': 0,
+                    'unit': '',
+                    'full_text': part
+                })
+    
+    return ingredients
+
+# Mass units are normalised to mg so equal strengths compare equal
+MASS_UNITS_TO_MG = {'mg': 1.0, 'g': 1000.0, 'mcg': 0.001}
+
+class IngredientIndex:
+    """Compositions parsed once into normalised (name, dosage, unit) rows.
+
+    rows[i] holds the ingredients of dataset row i; by_ingredient maps an ingredient
+    name to the rows containing it and by_signature maps the exact ingredient set
+    (names and strengths) to rows, so generic equivalents are a single dict lookup.
+    """
+
+    def __init__(self, compositions=()):
+        self._parsed = {}
+        self.rows = []
+        self.by_ingredient = {}
+        self.by_signature = {}
+        for row, composition in enumerate(compositions):
+            ingredients = self.parse(composition)
+            self.rows.append(ingredients)
+            for item in ingredients:
+                self.by_ingredient.setdefault(item['name'].lower(), set()).add(row)
+            if ingredients:
+                self.by_signature.setdefault(self.signature(ingredients), []).append(row)
+
+    @staticmethod
+    def _normalise(item):
+        name = re.sub(r'\s+', ' ', item['name']).strip(' (-:')
+        unit = (item['unit'] or '').lower()
+        dosage = item['dosage']
+        if unit == 'iu':
+            unit = 'IU'
+        elif unit in MASS_UNITS_TO_MG:
+            dosage, unit = round(dosage * MASS_UNITS_TO_MG[unit], 6), 'mg'
+        return {'name': name, 'dosage': dosage, 'unit': unit, 'full_text': item['full_text']}
+
+    def parse(self, composition):
+        """Parsed ingredients for a composition, memoised per distinct string"""
+        key = str(composition) if composition is not None and not pd.isna(composition) else ''
+        parsed = self._parsed.get(key)
+        if parsed is None:
+            parsed = [self._normalise(item) for item in parse_composition(key)]
+            self._parsed[key] = parsed
+        return parsed
+
+    @staticmethod
+    def signature(ingredients):
+        return tuple(sorted((item['name'].lower(), item['dosage'], item['unit']) for item in ingredients))
+
+    def total_mg(self, row):
+        return sum(item['dosage'] for item in self.rows[row] if item['unit'] == 'mg')
+
+    def equivalents(self, row):
+        """Rows with exactly the same ingredients and strengths, excluding row itself"""
+        if not self.rows[row]:
+            return []
+        return [other for other in self.by_signature.get(self.signature(self.rows[row]), []) if other != row]
+
+    def containing(self, name):
+        return self.by_ingredient.get(re.sub(r'\s+', ' ', name).strip().lower(), set())
+
+ingredient_index = IngredientIndex()
+
+try:
+    # Load dataset
+    df = pd.read_csv("Medicine_Details.csv")
+    # Clean column names
+    df.columns = df.columns.str.strip()
+    
+    # Case-insensitive name -> row lookup (first occurrence wins, like the old linear scan)
+    medicine_name_index = {}
+    for row, name in enumerate(df["Medicine Name"].astype(str)):
+        medicine_name_index.setdefault(name.lower(), row)
+    
+    # Parse every composition once; dosage and equivalents come from the index
+    ingredient_index = IngredientIndex(df["Composition"].tolist())
+    df["Dosage (mg)"] = [ingredient_index.total_mg(row) for row in range(len(df))]
+    
+    # Ensure required columns exist
+    df["Type"] = df.get("Type", "Tablet")
+    df["Manufacturer"] = df.get("Manufacturer", "Unknown")
+    df["Image URL"] = df.get("Image URL", "")
+    
+    # TF-IDF on composition (memory-mapped, shared across workers)
+    tfidf, vectors = load_tfidf_artifacts("Medicine_Details.csv", df['Composition'])
+    
+    print("✅ Medicine dataset loaded successfully!")
+except Exception as e:
+    print(f"❌ Error loading medicine dataset: {e}")
+    df = None
+    tfidf = None
+    vectors = None
+    medicine_name_index = {}
+
+# Helper function to get similar medicines
+def get_similar_medicines(med_name):
+    """Get similar medicines based on composition"""
+    if df is None or med_name not in df["Medicine Name"].values:
+        return None, None
+    
+    idx = df[df["Medicine Name"] == med_name].index[0]
+    with timed('similarity', 'cosine_similarity'):
+        cosine_sim = cosine_similarity(vectors[idx], vectors).flatten()
+    similar_idx = cosine_sim.argsort()[::-1][1:6]  # Top 5 similar
+    
+    main_med = df.loc[idx].to_dict()
+    # Pre-parsed ingredients so templates don't need the parse_ingredients filter
+    main_med['ingredients'] = ingredient_index.rows[idx]
+    main_med['generic_equivalents'] = [df.at[i, "Medicine Name"] for i in ingredient_index.equivalents(idx)]
+    similar_meds = []
+    
+    for i in similar_idx:
+        med = df.loc[i].to_dict()
+        med['ingredients'] = ingredient_index.rows[i]
+        # Calculate similarity percentage
+        med['similarity'] = round(cosine_sim[i] * 100, 2)
+        similar_meds.append(med)
+    
+    return main_med, similar_meds
+
+# Region, medicine and season mappings
+region_map = {'Mumbai': 0, 'Delhi': 1, 'Chennai': 2, 'Kolkata': 3, 'Banglore': 4}
+medicine_map = {
+    'Insulin': 0, 'Thyroxine': 1, 'Metformin': 2, 'Levothyroxine': 3, 'Paracetamol': 4,
+    'Amoxicillin': 5, 'Aspirin': 6, 'Atorvastatin': 7, 'Omeprazole': 8, 'Amlodipine': 9,
+    'Azithromycin': 10, 'Cetrizine': 11, 'Doxycycline': 12, 'Diclofenac': 13, 'Losartan': 14,
+    'Salbutamol': 15, 'Clopidogrel': 16, 'Fluconazole': 17, 'Levocetirizine': 18, 'Metronidazole': 19,
+    'Montelukast': 20, 'Ciprofloxacin': 21, 'Prednisolone': 22, 'Ranitidine': 23, 'Warfarin': 24,
+    'Glimepiride': 25, 'Levamisole': 26, 'Betahistine': 27, 'Norfloxacin': 28, 'Famotidine': 29,
+    'Hydrochlorothiazide': 30, 'Tramadol': 31, 'Cefixime': 32, 'Clindamycin': 33, 'Olmesartan': 34,
+    'Methylprednisolone': 35, 'Tiotropium': 36, 'Enalapril': 37, 'Rifampicin': 38, 'Gabapentin': 39,
+    'Paroxetine': 40, 'Clonazepam': 41, 'Dexamethasone': 42, 'Mefenamic Acid': 43, 'Baclofen': 44,
+    'Ondansetron': 45, 'Tadalafil': 46, 'Valacyclovir': 47, 'Etoricoxib': 48, 'Esomeprazole': 49,
+    'Phenylephrine': 50, 'Mirtazapine': 51, 'Amantadine': 52, 'Azathioprine': 53, 'Betamethasone': 54,
+    'Nifedipine': 55, 'Nortriptyline': 56, 'Diazepam': 57, 'Fluoxetine': 58, 'Levofloxacin': 59,
+    'Nystatin': 60, 'Pregabalin': 61, 'Rosuvastatin': 62, 'Sildenafil': 63
+}
+season_map = {'Winter': 1, 'Summer': 5, 'Monsoon': 8}
+
+typical_avg_daily_demand = {
+    ('Mumbai', 'Insulin', 'Winter'): 50,
+    ('Mumbai', 'Insulin', 'Summer'): 90,
+    ('Mumbai', 'Insulin', 'Monsoon'): 70,
+    ('Mumbai', 'Atorvastatin', 'Winter'): 25,
+    ('Mumbai', 'Atorvastatin', 'Summer'): 35,
+    ('Mumbai', 'Atorvastatin', 'Monsoon'): 30,
+    ('Delhi', 'Paracetamol', 'Winter'): 110,
+    ('Delhi', 'Paracetamol', 'Summer'): 80,
+    ('Delhi', 'Paracetamol', 'Monsoon'): 90,
+    ('Chennai', 'Amoxicillin', 'Winter'): 45,
+    ('Chennai', 'Amoxicillin', 'Summer'): 55,
+    ('Chennai', 'Amoxicillin', 'Monsoon'): 50,
+    ('Kolkata', 'Aspirin', 'Winter'): 40,
+    ('Kolkata', 'Aspirin', 'Summer'): 30,
+    ('Kolkata', 'Aspirin', 'Monsoon'): 35,
+    ('Banglore', 'Metformin', 'Winter'): 70,
+    ('Banglore', 'Metformin', 'Summer'): 65,
+    ('Banglore', 'Metformin', 'Monsoon'): 75,
+}
+typical_stock_level = {
+    ('Mumbai', 'Insulin', 'Winter'): 20,
+    ('Mumbai', 'Insulin', 'Summer'): 14,
+    ('Mumbai', 'Insulin', 'Monsoon'): 3,
+    ('Mumbai', 'Atorvastatin', 'Winter'): 5,
+    ('Mumbai', 'Atorvastatin', 'Summer'): 8,
+    ('Mumbai', 'Atorvastatin', 'Monsoon'): 7,
+    ('Delhi', 'Paracetamol', 'Winter'): 20,
+    ('Delhi', 'Paracetamol', 'Summer'): 12,
+    ('Delhi', 'Paracetamol', 'Monsoon'): 11,
+    ('Chennai', 'Amoxicillin', 'Winter'): 20,
+    ('Chennai', 'Amoxicillin', 'Summer'): 9,
+    ('Chennai', 'Amoxicillin', 'Monsoon'): 22,
+    ('Kolkata', 'Aspirin', 'Winter'): 15,
+    ('Kolkata', 'Aspirin', 'Summer'): 1,
+    ('Kolkata', 'Aspirin', 'Monsoon'): 12,
+    ('Banglore', 'Metformin', 'Winter'): 35,
+    ('Banglore', 'Metformin', 'Summer'): 2,
+    ('Banglore', 'Metformin', 'Monsoon'): 17,
+}
+# Blockchain Configuration - Updated with your new contract address
+BLOCKCHAIN_CONFIG = {
+    'provider_url': 'http://127.0.0.1:8545',
+    'contract_address': "0x8A791620dd6260079BF849Dc5567aDC3F2FdC318",  # Your new deployed address
+    'contract_abi_file': 'MedicineLedger.json',
+    # MedicineLedger v2 (interned name ids, event-only records); address comes from its deployment file
+    'contract_version': int(os.environ.get('LEDGER_CONTRACT_VERSION', '1')),
+    'v2_abi_file': 'MedicineLedgerV2.json'
+}
+LEDGER_VERSION = BLOCKCHAIN_CONFIG['contract_version']
+
+# Configure logging first
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Versioned model registry
+MODEL_REGISTRY_CONFIG = {
+    'dir': os.environ.get('MODEL_REGISTRY_DIR', 'model_registry'),
+    'watch_interval': int(os.environ.get('MODEL_WATCH_INTERVAL', '30')),
+    'retrain_interval': int(os.environ.get('MODEL_RETRAIN_INTERVAL', '86400')),
+    'window_days': 365,
+    'min_samples': 50,       # reports and alerts that labelled a model's target, not grid rows
+    'holdout_fraction': 0.2,
+    'max_score_drop': 0.02,  # candidate may score at most this much below the live model
+    'keep_versions': 5
+}
+MODEL_SEED_FILES = {
+    'shortage': 'medicine_shortage_model.pkl',
+    'price_spike': 'medicine_price_spike_model.pkl'
+}
+MODEL_FEATURES = ['Month', 'Region_Code', 'Medicine_Code', 'Avg_Daily_Demand', 'Stock_Level']
+
+class ModelRegistry:
+    """Versioned model artifacts on disk: <dir>/<name>/v<N>.pkl plus a manifest.json.
+
+    Artifacts and the manifest are written to a temp file and os.replace()d, so a
+    reader never sees a partial file. The manifest's 'current' entry is the live version.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.manifest_path = os.path.join(root, 'manifest.json')
+        self._lock = threading.Lock()
+
+    def manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self, manifest):
+        tmp_path = f'{self.manifest_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def path_for(self, name, version):
+        return os.path.join(self.root, name, f'v{version}.pkl')
+
+    def current_version(self, name):
+        return self.manifest().get(name, {}).get('current')
+
+    def seed(self, name, source_path):
+        """Register a pre-trained .pkl as version 1 if the registry has nothing for this model"""
+        if self.current_version(name) is None and os.path.exists(source_path):
+            self.publish(name, joblib.load(source_path), {'source': source_path})
+
+    def publish(self, name, model, info=None):
+        with self._lock:
+            manifest = self.manifest()
+            entry = manifest.setdefault(name, {'current': None, 'versions': []})
+            version = max([v['version'] for v in entry['versions']], default=0) + 1
+            path = self.path_for(name, version)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            joblib.dump(model, tmp_path)
+            os.replace(tmp_path, path)
+
+            entry['versions'].append({'version': version, 'created_at': datetime.utcnow().isoformat(), **(info or {})})
+            entry['current'] = version
+            for old in entry['versions'][:-MODEL_REGISTRY_CONFIG['keep_versions']]:
+                try:
+                    os.remove(self.path_for(name, old['version']))
+                except OSError:
+                    pass
+            entry['versions'] = entry['versions'][-MODEL_REGISTRY_CONFIG['keep_versions']:]
+            self._write_manifest(manifest)
+            return version
+
+    def load(self, name, version):
+        # Plain numpy arrays come back memory-mapped; sklearn trees copy their node arrays
+        # into their own buffers, so models are shared only copy-on-write from a preloading master
+        return joblib.load(self.path_for(name, version), mmap_mode='r')
+
+def validate_model(model):
+    """Smoke-test a loaded model on a probe row before it is allowed to serve"""
+    probe = pd.DataFrame([{'Month': 1, 'Region_Code': 0, 'Medicine_Code': 0,
+                           'Avg_Daily_Demand': 100, 'Stock_Level': 50}], columns=MODEL_FEATURES)
+    prediction = model.predict(probe)
+    return len(prediction) == 1 and int(prediction[0]) in (0, 1)
+
+class ActiveModels:
+    """The serving model pair, swapped as one immutable tuple.
+
+    Requests call get() once and use that snapshot, so a swap mid-request never
+    mixes versions; the old models stay alive until the last reader drops them.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._current = None  # (versions dict, {name: model})
+
+    def get(self):
+        return self._current
+
+    def refresh(self):
+        """Load and validate newer registry versions off the request path, then swap"""
+        current_versions = self._current[0] if self._current else {}
+        wanted = {name: self.registry.current_version(name) for name in MODEL_SEED_FILES}
+        if wanted == current_versions or None in wanted.values():
+            return False
+
+        models = dict(self._current[1]) if self._current else {}
+        for name, version in wanted.items():
+            if current_versions.get(name) == version:
+                continue
+            candidate = self.registry.load(name, version)
+            if not validate_model(candidate):
+                logger.error(f"Model {name} v{version} failed validation; keeping v{current_versions.get(name)}")
+                wanted[name] = current_versions.get(name)
+                if wanted[name] is None:
+                    return False
+                continue
+            models[name] = candidate
+        if wanted == current_versions:
+            return False
+        self._current = (wanted, models)
+        logger.info(f"Serving models {wanted}")
+        return True
+
+model_registry = ModelRegistry(MODEL_REGISTRY_CONFIG['dir'])
+for _name, _path in MODEL_SEED_FILES.items():
+    model_registry.seed(_name, _path)
+active_models = ActiveModels(model_registry)
+active_models.refresh()
+
+def _model_watch_worker():
+    while True:
+        time.sleep(MODEL_REGISTRY_CONFIG['watch_interval'])
+        try:
+            active_models.refresh()
+        except Exception as e:
+            logger.error(f"Model refresh error: {e}")
+
+def start_model_watcher():
+    thread = threading.Thread(target=_model_watch_worker, name='model-watcher', daemon=True)
+    thread.start()
+    return thread
+
+# Request instrumentation: latency histograms per route and call site
+METRIC_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_CONFIG = {
+    # Prefork workers each write their histograms here and /metrics sums every file;
+    # empty serves this process's histograms only
+    'dir': os.environ.get('METRICS_DIR', 'metrics' if PREFORK_MODE else ''),
+    'flush_interval': 5.0
+}
+
+class Metrics:
+    """Thread-safe counters and histograms rendered in Prometheus text format"""
+
+    def __init__(self, buckets=METRIC_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._help = {}
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = {'buckets': [0] * len(self.buckets), 'count': 0, 'sum': 0.0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist['buckets'][i] += 1
+            hist['count'] += 1
+            hist['sum'] += value
+
+    @staticmethod
+    def _labels(pairs, extra=None):
+        items = list(pairs) + ([extra] if extra else [])
+        if not items:
+            return ''
+        def escape(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in items) + '}'
+
+    def snapshot(self):
+        with self._lock:
+            return {k: {'buckets': list(v['buckets']), 'count': v['count'], 'sum': v['sum']}
+                    for k, v in self._histograms.items()}
+
+    @staticmethod
+    def _worker_path(directory, pid):
+        return os.path.join(directory, f'metrics.{pid}.json')
+
+    def write_snapshot(self, directory):
+        """Publish this process's histograms for the other workers' /metrics"""
+        os.makedirs(directory, exist_ok=True)
+        path = self._worker_path(directory, os.getpid())
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump([[name, labels, hist] for (name, labels), hist in self.snapshot().items()], f)
+        os.replace(tmp_path, path)
+
+    def merged_snapshot(self, directory):
+        """This process's live histograms plus the last snapshot of every other worker.
+
+        Files of exited workers are kept so totals stay monotonic across worker restarts.
+        """
+        merged = self.snapshot()
+        own = os.path.basename(self._worker_path(directory, os.getpid()))
+        try:
+            names = [n for n in os.listdir(directory) if n.startswith('metrics.') and n.endswith('.json') and n != own]
+        except FileNotFoundError:
+            names = []
+        for file_name in names:
+            try:
+                with open(os.path.join(directory, file_name)) as f:
+                    rows = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping metrics snapshot {file_name}: {e}")
+                continue
+            for name, labels, hist in rows:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                total = merged.setdefault(key, {'buckets': [0] * len(self.buckets), 'count': 0, 'sum': 0.0})
+                total['buckets'] = [a + b for a, b in zip(total['buckets'], hist['buckets'])]
+                total['count'] += hist['count']
+                total['sum'] += hist['sum']
+        return merged
+
+    def render(self, directory=None):
+        snapshot = self.merged_snapshot(directory) if directory else self.snapshot()
+        lines = []
+        for name in sorted({key[0] for key in snapshot}):
+            if name in self._help:
+                lines.append(f'# HELP {name} {self._help[name]}')
+            lines.append(f'# TYPE {name} histogram')
+            for (metric, labels), hist in sorted(snapshot.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(self.buckets, hist['buckets']):
+                    lines.append(f"{name}_bucket{self._labels(labels, ('le', bound))} {count}")
+                lines.append(f"{name}_bucket{self._labels(labels, ('le', '+Inf'))} {hist['count']}")
+                lines.append(f"{name}_sum{self._labels(labels)} {hist['sum']:.6f}")
+                lines.append(f"{name}_count{self._labels(labels)} {hist['count']}")
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+metrics.describe('byteforce_request_seconds', 'HTTP request latency by route')
+metrics.describe('byteforce_call_seconds', 'Latency of DB, ledger and model calls by route and call site')
+
+def reset_metrics_dir():
+    """Drop snapshots left by a previous server run; called once in the master before forking"""
+    directory = METRICS_CONFIG['dir']
+    if directory and os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.startswith('metrics.'):
+                os.remove(os.path.join(directory, name))
+
+def _metrics_flush_worker():
+    while True:
+        time.sleep(METRICS_CONFIG['flush_interval'])
+        try:
+            metrics.write_snapshot(METRICS_CONFIG['dir'])
+        except Exception as e:
+            logger.error(f"Metrics snapshot error: {e}")
+
+def start_metrics_flusher():
+    thread = threading.Thread(target=_metrics_flush_worker, name='metrics-flush', daemon=True)
+    thread.start()
+    return thread
+
+def _current_route():
+    if has_request_context() and request.url_rule is not None:
+        return request.url_rule.rule
+    return 'background' if not has_request_context() else 'unmatched'
+
+class timed:
+    """Context manager recording a call's latency under kind (db, ledger, model, similarity) and site"""
+
+    def __init__(self, kind, site):
+        self.kind = kind
+        self.site = site
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        metrics.observe('byteforce_call_seconds',
+                        {'kind': self.kind, 'site': self.site, 'route': _current_route()}, elapsed)
+        if has_request_context():
+            timings = g.setdefault('server_timings', {})
+            total, count = timings.get(self.kind, (0.0, 0))
+            timings[self.kind] = (total + elapsed, count + 1)
+        return False
+
+class _InstrumentedCall:
+    def __init__(self, fn, name):
+        self._fn = fn
+        self._name = name
+
+    def call(self, *args, **kwargs):
+        with timed('ledger', f'{self._name}.call'):
+            return self._fn.call(*args, **kwargs)
+
+    def transact(self, *args, **kwargs):
+        with timed('ledger', f'{self._name}.transact'):
+            return self._fn.transact(*args, **kwargs)
+
+    def estimate_gas(self, *args, **kwargs):
+        with timed('ledger', f'{self._name}.estimate_gas'):
+            return self._fn.estimate_gas(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        return getattr(self._fn, attr)
+
+class _InstrumentedFunctions:
+    def __init__(self, functions):
+        self._functions = functions
+
+    def __getattr__(self, name):
+        factory = getattr(self._functions, name)
+        return lambda *args, **kwargs: _InstrumentedCall(factory(*args, **kwargs), name)
+
+class InstrumentedContract:
+    """Wraps a web3 contract so every call()/transact() is timed per function"""
+
+    def __init__(self, contract):
+        self._contract = contract
+        self.functions = _InstrumentedFunctions(contract.functions)
+
+    def __getattr__(self, attr):
+        return getattr(self._contract, attr)
+
+# Initialize Web3 and contract with better error handling
+def initialize_blockchain():
+    """Initialize blockchain connection with comprehensive error handling"""
+    try:
+        # Test Web3 connection
+        w3 = Web3(Web3.HTTPProvider(BLOCKCHAIN_CONFIG['provider_url']))
+        
+        if not w3.is_connected():
+            raise Exception("Cannot connect to blockchain provider")
+        
+        logger.info(f"Connected to blockchain at {BLOCKCHAIN_CONFIG['provider_url']}")
+        logger.info(f"Latest block: {w3.eth.block_number}")
+        
+        # Check if we have accounts
+        if not w3.eth.accounts:
+            raise Exception("No accounts available from blockchain provider")
+        
+        logger.info(f"Available accounts: {len(w3.eth.accounts)}")
+        
+        # Load contract ABI
+        contract_file = BLOCKCHAIN_CONFIG['v2_abi_file'] if LEDGER_VERSION == 2 else BLOCKCHAIN_CONFIG['contract_abi_file']
+        if not os.path.exists(contract_file):
+            raise Exception(f"Contract ABI file not found: {contract_file}")
+        
+        with open(contract_file) as f:
+            contract_data = json.load(f)
+            contract_abi = contract_data.get('abi')
+            
+        if not contract_abi:
+            raise Exception("ABI not found in contract file")
+        
+        # Initialize contract
+        contract_address = contract_data.get('address') if LEDGER_VERSION == 2 else BLOCKCHAIN_CONFIG['contract_address']
+        contract = w3.eth.contract(
+            address=w3.to_checksum_address(contract_address), 
+            abi=contract_abi
+        )
+        if LEDGER_VERSION == 2:
+            # v2 records live in logs from the deployment block onwards
+            ledger_names.reset(contract_data.get('deployBlock', 0))
+        logger.info(f"Using MedicineLedger v{LEDGER_VERSION} at {contract_address}")
+        
+        # Test contract connection by calling a simple function
+        try:
+            # Try to call a view function to test the contract
+            stock_count = contract.functions.getStockCount().call()
+            logger.info(f"Contract connection successful. Stock count: {stock_count}")
+        except Exception as e:
+            logger.warning(f"Contract function test failed: {e}")
+            # Continue anyway as contract might be deployed but empty
+        
+        # Use the first Hardhat account
+        default_account = w3.eth.accounts[0]
+        logger.info(f"Using default account: {default_account}")
+        
+        return w3, contract, default_account, True
+        
+    except FileNotFoundError as e:
+        logger.error(f"Blockchain file not found: {e}")
+        return None, None, None, False
+    except Exception as e:
+        logger.error(f"Blockchain connection failed: {e}")
+        return None, None, None, False
+
+# Blockchain components are per-process; see connect_ledger()
+w3, contract, default_account, blockchain_enabled = None, None, None, False
+tx_manager = None
+
+class LedgerTransactionManager:
+    """Submits contract transactions with locally tracked nonces and cached gas estimates"""
+
+    DEFAULT_GAS = 300000
+    GAS_MARGIN = 1.3
+
+    def __init__(self, w3, contract, max_workers=8):
+        self.w3 = w3
+        self.contract = contract
+        self.max_workers = max_workers
+        self._accounts = None
+        self._accounts_lock = threading.Lock()
+        self._nonces = {}
+        self._account_locks = {}
+        self._nonce_lock = threading.Lock()
+        self._gas_cache = {}
+
+    @property
+    def accounts(self):
+        """Account list fetched once over RPC and reused afterwards"""
+        if self._accounts is None:
+            with self._accounts_lock:
+                if self._accounts is None:
+                    self._accounts = list(self.w3.eth.accounts)
+        return self._accounts
+
+    def refresh_accounts(self):
+        with self._accounts_lock:
+            self._accounts = None
+        return self.accounts
+
+    def account_for_user(self, user_id):
+        accounts = self.accounts
+        if not accounts:
+            return None
+        return accounts[(user_id or 0) % len(accounts)]
+
+    def _account_lock(self, account):
+        with self._nonce_lock:
+            lock = self._account_locks.get(account)
+            if lock is None:
+                lock = self._account_locks[account] = threading.Lock()
+            return lock
+
+    def _next_nonce(self, account):
+        # Caller holds the account lock
+        if account not in self._nonces:
+            self._nonces[account] = self.w3.eth.get_transaction_count(account, 'pending')
+        nonce = self._nonces[account]
+        self._nonces[account] = nonce + 1
+        return nonce
+
+    def _resync_nonce(self, account):
+        self._nonces[account] = self.w3.eth.get_transaction_count(account, 'pending')
+
+    @staticmethod
+    def _signature(fn):
+        return getattr(fn, 'abi_element_identifier', None) or getattr(fn, 'fn_name', None) or str(fn)
+
+    @staticmethod
+    def _payload_size(fn):
+        """Bytes of string/bytes/array arguments, the part of a call whose gas varies with its input"""
+        def size(value):
+            if isinstance(value, str):
+                return len(value.encode('utf-8'))
+            if isinstance(value, (bytes, bytearray)):
+                return len(value)
+            if isinstance(value, (list, tuple)):
+                return sum(32 + size(item) for item in value)
+            return 0
+        return sum(size(arg) for arg in getattr(fn, 'args', None) or ())
+
+    def _gas_for(self, fn, account):
+        # An estimate is reused only for payloads no larger than the one it was made for,
+        # since longer names cost more calldata and storage gas
+        signature = self._signature(fn)
+        payload = self._payload_size(fn)
+        cached = self._gas_cache.get(signature)
+        if cached and payload <= cached[0]:
+            return cached[1]
+        try:
+            gas = int(fn.estimate_gas({'from': account}) * self.GAS_MARGIN)
+        except Exception as e:
+            logger.warning(f"Gas estimation failed for {signature}: {e}")
+            return cached[1] if cached else self.DEFAULT_GAS
+        if not cached or gas >= cached[1]:
+            self._gas_cache[signature] = (payload, gas)
+        return gas
+
+    def transact(self, fn, account):
+        """Send one transaction from account without waiting for it to be mined"""
+        with self._account_lock(account):
+            for attempt in range(2):
+                nonce = self._next_nonce(account)
+                try:
+                    return fn.transact({'from': account, 'nonce': nonce, 'gas': self._gas_for(fn, account)})
+                except Exception as e:
+                    message = str(e).lower()
+                    if 'nonce' in message:
+                        logger.warning(f"Nonce out of sync for {account}, resyncing: {e}")
+                        self._resync_nonce(account)
+                    else:
+                        # Rejected before broadcast, so the nonce is still free
+                        self._nonces[account] = nonce
+                        if 'gas' in message:
+                            # Cached estimate too low for this payload; re-estimate
+                            self._gas_cache.pop(self._signature(fn), None)
+                        else:
+                            raise
+                    if attempt == 1:
+                        raise
+
+    def wait(self, tx_hash, timeout=60):
+        return self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=timeout)
+
+    def submit_many(self, calls, wait=True, timeout=120):
+        """Submit contract calls in parallel, round-robin across accounts.
+
+        A call may be a bare contract function or a (function, account) pair when
+        the sender matters. Each account gets its own nonce sequence so transactions
+        from different accounts never wait on each other. Returns tx hashes (or None)
+        in order.
+        """
+        accounts = self.accounts
+        if not accounts:
+            return [None] * len(calls)
+
+        by_account = {}
+        for position, call in enumerate(calls):
+            fn, account = call if isinstance(call, tuple) else (call, None)
+            account = account or accounts[position % len(accounts)]
+            by_account.setdefault(account, []).append((position, fn))
+
+        results = [None] * len(calls)
+
+        def send_all(account, items):
+            for position, fn in items:
+                try:
+                    results[position] = self.transact(fn, account)
+                except Exception as e:
+                    logger.error(f"Batched transaction {position} failed: {e}")
+
+        workers = min(self.max_workers, len(by_account)) or 1
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda item: send_all(*item), by_account.items()))
+
+        if wait:
+            def receipt(tx_hash):
+                if tx_hash is None:
+                    return None
+                try:
+                    return self.wait(tx_hash, timeout=timeout).transactionHash.hex()
+                except Exception as e:
+                    logger.error(f"Transaction receipt error: {e}")
+                    return tx_hash.hex() if hasattr(tx_hash, 'hex') else str(tx_hash)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                return list(pool.map(receipt, results))
+
+        return [h.hex() if hasattr(h, 'hex') else h for h in results]
+
+# MedicineLedger v2 client layer: names <-> interned ids, event-only records read back from logs
+LEDGER_NAME_KINDS = {'pharmacy': 0, 'medicine': 1, 'location': 2}
+LEDGER_ORDER_STATUSES = ('pending', 'confirmed', 'shipped', 'delivered', 'cancelled')
+LEDGER_V2_EVENTS = {
+    'NameRegistered': 'NameRegistered(uint8,uint32,string)',
+    'StockAdded': 'StockAdded(uint64,uint32,uint32,uint128,uint128,uint64,address)',
+    'ShortageReported': 'ShortageReported(uint64,uint32,uint32,uint64,address)',
+    'LedgerAnchored': 'LedgerAnchored(bytes32,uint64,address)'
+}
+LEDGER_LOG_BATCH = 100  # sequence numbers OR-ed into one eth_getLogs topic filter
+
+def ledger_topic(value):
+    """Log topic for an event signature or an indexed integer argument"""
+    if isinstance(value, str):
+        return Web3.to_hex(Web3.keccak(text=value))
+    return '0x' + format(value, '064x')
+
+def ledger_logs(event, *topics, from_block=None):
+    """Decoded v2 event logs; each topic is a value or a list of alternatives"""
+    topic_filter = [ledger_topic(LEDGER_V2_EVENTS[event])]
+    for topic in topics:
+        topic_filter.append([ledger_topic(v) for v in topic] if isinstance(topic, (list, tuple, range)) else ledger_topic(topic))
+    logs = w3.eth.get_logs({
+        'address': contract.address,
+        'fromBlock': ledger_names.from_block if from_block is None else from_block,
+        'toBlock': 'latest',
+        'topics': topic_filter
+    })
+    decoder = getattr(contract.events, event)()
+    return [decoder.process_log(log) for log in logs]
+
+class LedgerNames:
+    """Per-process two-way map between names and their MedicineLedger v2 ids"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, from_block=0):
+        with self._lock:
+            self.from_block = from_block
+            self._ids = {}      # (kind, name) -> id
+            self._names = {}    # (kind, id) -> name
+            self._synced_block = from_block - 1
+
+    def _remember(self, kind, name, name_id):
+        self._ids[(kind, name)] = name_id
+        self._names[(kind, name_id)] = name
+
+    def sync(self):
+        """Pull NameRegistered events newer than the last sync"""
+        kinds = {code: kind for kind, code in LEDGER_NAME_KINDS.items()}
+        with self._lock:
+            latest = w3.eth.block_number
+            if latest <= self._synced_block:
+                return
+            for event in ledger_logs('NameRegistered', from_block=self._synced_block + 1):
+                args = event['args']
+                self._remember(kinds[args['kind']], args['name'], args['id'])
+            self._synced_block = latest
+
+    def name(self, kind, name_id):
+        if (kind, name_id) not in self._names:
+            self.sync()
+        return self._names.get((kind, name_id), f'#{name_id}')
+
+    def ids(self, kind, names, register=True):
+        """Ids for names; unknown names are registered (in parallel) unless register is False"""
+        code = LEDGER_NAME_KINDS[kind]
+        missing = [name for name in dict.fromkeys(names) if (kind, name) not in self._ids]
+        if missing:
+            found = {name: contract.functions.nameId(code, name).call() for name in missing}
+            new = [name for name, name_id in found.items() if not name_id]
+            if new and register:
+                tx_manager.submit_many([contract.functions.registerName(code, name) for name in new])
+                found.update({name: contract.functions.nameId(code, name).call() for name in new})
+            with self._lock:
+                for name, name_id in found.items():
+                    if name_id:
+                        self._remember(kind, name, name_id)
+        ids = [self._ids.get((kind, name), 0) for name in names]
+        if register and not all(ids):
+            raise ValueError(f"Could not register ledger {kind} names: {[n for n, i in zip(names, ids) if not i]}")
+        return ids
+
+    def id(self, kind, name, register=True):
+        return self.ids(kind, [name], register)[0]
+
+ledger_names = LedgerNames()
+
+# v1-style call arguments -> v2 arguments (names replaced by ids)
+LEDGER_V2_CALLS = {
+    'addMedicineStock': lambda pharmacy, medicine, quantity, price: (
+        ledger_names.id('pharmacy', pharmacy), ledger_names.id('medicine', medicine), quantity, price),
+    'reportShortage': lambda medicine, location: (
+        ledger_names.id('medicine', medicine), ledger_names.id('location', location)),
+    'placeOrder': lambda medicine, quantity, manufacturer: (
+        ledger_names.id('medicine', medicine), quantity, manufacturer),
+    'updateRetailerStock': lambda medicine, new_stock: (ledger_names.id('medicine', medicine), new_stock),
+    'retailerStocks': lambda retailer, medicine: (retailer, ledger_names.id('medicine', medicine, register=False))
+}
+
+def ledger_function(name, *args):
+    """Contract function for a v1-style call, with names swapped for interned ids on v2"""
+    if LEDGER_VERSION == 2 and name in LEDGER_V2_CALLS:
+        args = LEDGER_V2_CALLS[name](*args)
+    return getattr(contract.functions, name)(*args)
+
+def connect_ledger():
+    """Create this process's Web3 client, contract wrapper and transaction manager"""
+    global w3, contract, default_account, blockchain_enabled, tx_manager
+    w3, contract, default_account, blockchain_enabled = initialize_blockchain()
+    if contract is not None:
+        contract = InstrumentedContract(contract)
+    tx_manager = LedgerTransactionManager(w3, contract) if blockchain_enabled else None
+
+# Initialize blockchain components (after fork in prefork mode)
+if not PREFORK_MODE:
+    connect_ledger()
+
+# Ensure upload directory exists
+os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+# Initialize database
+db = SQLAlchemy(app)
+
+# Authentication decorator
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return redirect(url_for('login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+def role_required(roles):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if 'user_type' not in session or session['user_type'] not in roles:
+                flash('Access denied. Insufficient permissions.', 'error')
+                return redirect(url_for('dashboard'))
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+def get_db_connection():
+    conn = sqlite3.connect('healthcare.db')
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def execute_query(query, params=None):
+    conn = get_db_connection()
+    try:
+        if params:
+            result = conn.execute(query, params).fetchall()
+        else:
+            result = conn.execute(query).fetchall()
+        conn.commit()
+        return result
+    except Exception as e:
+        logger.error(f"Database error: {e}")
+        return None
+    finally:
+        conn.close()
+
+def execute_insert(query, params):
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(query, params)
+        conn.commit()
+        return cursor.lastrowid
+    except Exception as e:
+        logger.error(f"Database insert error: {e}")
+        return None
+    finally:
+        conn.close()
+
+# Correct haversine distance function
+def haversine(lat1, lon1, lat2, lon2):
+    R = 6371  # Earth radius in kilometers
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+    a = sin(dlat/2)*2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)*2
+    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+    return R * c
+
+# Local ledger backend: a hash-chained, append-only log in a memory-mapped file.
+# Used instead of the EVM contract when LEDGER_BACKEND=local, or with 'auto' while the node is unreachable.
+LOCAL_LEDGER_CONFIG = {
+    'backend': os.environ.get('LEDGER_BACKEND', 'auto'),  # evm | local | auto
+    'path': os.environ.get('LOCAL_LEDGER_PATH', 'ledger.log'),
+    'grow_bytes': 16 * 1024 * 1024,  # the file is extended and remapped in steps of this size
+    'flush_interval': 1.0,           # seconds between msyncs of appended records
+    'anchor_interval': int(os.environ.get('LEDGER_ANCHOR_INTERVAL', '600'))
+}
+LOCAL_LEDGER_KINDS = ('stocks', 'shortages', 'orders', 'retailer_stocks')
+LOCAL_LEDGER_MAGIC = b'BFLEDGR1'
+LOCAL_LEDGER_HEADER = struct.Struct('<8sQ')          # magic, bytes in use (header included)
+LOCAL_LEDGER_PREFIX = struct.Struct('<IBxxxd')       # payload length, kind, timestamp
+LOCAL_LEDGER_RECORD = struct.Struct('<IBxxxd32s')    # prefix + sha256(previous hash + prefix + payload)
+LOCAL_LEDGER_GENESIS = bytes(32)
+
+# record_to_blockchain action -> (kind, payload)
+LOCAL_LEDGER_ACTIONS = {
+    'stock_update': ('stocks', lambda d: {'pharmacy': d['pharmacy_name'], 'medicine': d['medicine_name'],
+                                          'quantity': d['quantity'], 'price': d['price']}),
+    'shortage_report': ('shortages', lambda d: {'medicine': d['medicine_name'], 'location': d['location_name']})
+}
+
+class LedgerTampered(ValueError):
+    pass
+
+class LocalLedger:
+    """Append-only ledger file where each record carries sha256(previous hash + record).
+
+    Editing, dropping or reordering any record changes every later hash, and the head
+    hash can be anchored on-chain. Appends are serialised across processes with flock
+    and cost one copy into the shared mapping; msync happens in the background.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.anchored = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+
+    def _reset(self):
+        self._offsets = {kind: [] for kind in LOCAL_LEDGER_KINDS}
+        self._retailer_stocks = {}
+        self._scanned = LOCAL_LEDGER_HEADER.size
+        self._head = LOCAL_LEDGER_GENESIS
+        self._dirty = False
+
+    def _open(self):
+        # Caller holds _lock. flock belongs to the open file, so each process opens its own.
+        if self._map is not None:
+            if self._pid == os.getpid():
+                return
+            # Inherited across fork: drop the parent's handle and lock scope
+            self._map.close()
+            os.close(self._fd)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size == 0:
+                os.ftruncate(fd, LOCAL_LEDGER_CONFIG['grow_bytes'])
+                os.pwrite(fd, LOCAL_LEDGER_HEADER.pack(LOCAL_LEDGER_MAGIC, LOCAL_LEDGER_HEADER.size), 0)
+            self._map = mmap.mmap(fd, os.fstat(fd).st_size)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        magic, _ = LOCAL_LEDGER_HEADER.unpack_from(self._map, 0)
+        if magic != LOCAL_LEDGER_MAGIC:
+            raise LedgerTampered(f"{self.path} is not a ledger file")
+        self._fd, self._pid = fd, os.getpid()
+        self._reset()
+
+    def _remap(self, size):
+        self._map.close()
+        self._map = mmap.mmap(self._fd, size)
+
+    def _used(self):
+        return LOCAL_LEDGER_HEADER.unpack_from(self._map, 0)[1]
+
+    def _catch_up(self):
+        """Index records appended since the last scan (by this or another process), checking the chain"""
+        used = self._used()
+        if used > len(self._map):
+            self._remap(os.fstat(self._fd).st_size)
+        offset = self._scanned
+        while offset < used:
+            length, code, timestamp, digest = LOCAL_LEDGER_RECORD.unpack_from(self._map, offset)
+            payload_start = offset + LOCAL_LEDGER_RECORD.size
+            payload = self._map[payload_start:payload_start + length]
+            expected = hashlib.sha256(self._head + self._map[offset:offset + LOCAL_LEDGER_PREFIX.size] + payload).digest()
+            if digest != expected:
+                raise LedgerTampered(f"Hash chain broken at byte {offset} of {self.path}")
+            self._index(LOCAL_LEDGER_KINDS[code], offset, payload)
+            self._head = digest
+            offset = payload_start + length
+        self._scanned = offset
+
+    def _index(self, kind, offset, payload):
+        self._offsets[kind].append(offset)
+        if kind == 'retailer_stocks':
+            record = json.loads(payload)
+            self._retailer_stocks[(record['retailer'], record['medicine'])] = record['stock']
+
+    def append(self, kind, record):
+        """Append one record and return its hash"""
+        payload = json.dumps(record, separators=(',', ':')).encode('utf-8')
+        with self._lock:
+            self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                self._catch_up()
+                offset = self._scanned
+                end = offset + LOCAL_LEDGER_RECORD.size + len(payload)
+                if end > len(self._map):
+                    step = LOCAL_LEDGER_CONFIG['grow_bytes']
+                    os.ftruncate(self._fd, (end // step + 1) * step)
+                    self._remap(os.fstat(self._fd).st_size)
+                prefix = LOCAL_LEDGER_PREFIX.pack(len(payload), LOCAL_LEDGER_KINDS.index(kind), time.time())
+                digest = hashlib.sha256(self._head + prefix + payload).digest()
+                LOCAL_LEDGER_RECORD.pack_into(self._map, offset, *LOCAL_LEDGER_PREFIX.unpack(prefix), digest)
+                self._map[offset + LOCAL_LEDGER_RECORD.size:end] = payload
+                # Publish the record only once it is fully written
+                LOCAL_LEDGER_HEADER.pack_into(self._map, 0, LOCAL_LEDGER_MAGIC, end)
+                self._index(kind, offset, payload)
+                self._head, self._scanned, self._dirty = digest, end, True
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return '0x' + digest.hex()
+
+    def record(self, action_type, data, recorded_by=None):
+        if action_type not in LOCAL_LEDGER_ACTIONS:
+            logger.warning(f"Unknown ledger action type: {action_type}")
+            return None
+        kind, to_record = LOCAL_LEDGER_ACTIONS[action_type]
+        record = to_record(data)
+        record['recorded_by'] = recorded_by
+        return self.append(kind, record)
+
+    def count(self, kind):
+        with self._lock:
+            self._open()
+            self._catch_up()
+            return len(self._offsets[kind])
+
+    def entries(self, kind, indices):
+        """Records at the given per-kind indices, shaped like the on-chain entries"""
+        with self._lock:
+            self._open()
+            self._catch_up()
+            offsets = self._offsets[kind]
+            entries = []
+            for index in indices:
+                length, _, timestamp, digest = LOCAL_LEDGER_RECORD.unpack_from(self._map, offsets[index])
+                start = offsets[index] + LOCAL_LEDGER_RECORD.size
+                entry = json.loads(self._map[start:start + length])
+                entry.update(timestamp=int(timestamp), hash='0x' + digest.hex(), index=index)
+                entries.append(entry)
+            return entries
+
+    def retailer_stock(self, retailer, medicine):
+        with self._lock:
+            self._open()
+            self._catch_up()
+            return self._retailer_stocks.get((retailer, medicine), 0)
+
+    def head(self):
+        """(record count, head hash) of the chain as currently indexed"""
+        with self._lock:
+            self._open()
+            self._catch_up()
+            return sum(len(offsets) for offsets in self._offsets.values()), self._head
+
+    def flush(self):
+        with self._lock:
+            if self._map is not None and self._dirty:
+                self._map.flush()
+                self._dirty = False
+
+    def verify(self, anchors=()):
+        """Re-walk the whole file and check it against on-chain anchors [(head hash, record count)]"""
+        wanted = {records: head for head, records in anchors}
+        with self._lock:
+            self._open()
+            used, offset, previous, records = self._used(), LOCAL_LEDGER_HEADER.size, LOCAL_LEDGER_GENESIS, 0
+            mismatched = []
+            while offset < used:
+                length, _, _, digest = LOCAL_LEDGER_RECORD.unpack_from(self._map, offset)
+                payload_start = offset + LOCAL_LEDGER_RECORD.size
+                expected = hashlib.sha256(previous + self._map[offset:offset + LOCAL_LEDGER_PREFIX.size] +
+                                          self._map[payload_start:payload_start + length]).digest()
+                if digest != expected:
+                    return {'ok': False, 'records': records, 'error': f'hash chain broken at byte {offset}'}
+                records += 1
+                if records in wanted and wanted[records] != digest:
+                    mismatched.append(records)
+                previous, offset = digest, payload_start + length
+        result = {'ok': not mismatched, 'records': records, 'head': '0x' + previous.hex(),
+                  'anchors_checked': len(wanted), 'anchored_through': max(wanted, default=0)}
+        if mismatched:
+            result['error'] = f'head hash differs from on-chain anchor at record(s) {mismatched[:10]}'
+        return result
+
+local_ledger = LocalLedger(LOCAL_LEDGER_CONFIG['path'])
+
+def local_ledger_active():
+    """True when ledger reads and writes go to the local log instead of the EVM contract"""
+    backend = LOCAL_LEDGER_CONFIG['backend']
+    return backend == 'local' or (backend == 'auto' and not blockchain_enabled)
+
+def ledger_available():
+    return local_ledger_active() or (blockchain_enabled and contract is not None)
+
+def ledger_anchors():
+    """(head hash, record count) pairs anchored on-chain by the contract owner; needs MedicineLedger v2.
+
+    Logs come back in chain order and the first anchor for a record count wins, so a
+    later anchor cannot rewrite history that was already pinned.
+    """
+    if not blockchain_enabled or LEDGER_VERSION != 2:
+        return []
+    owner = contract.functions.owner().call()
+    anchors = {}
+    for event in ledger_logs('LedgerAnchored'):
+        if event['args']['anchoredBy'] == owner:
+            anchors.setdefault(event['args']['records'], event['args']['headHash'])
+    return [(head, records) for records, head in anchors.items()]
+
+def anchor_local_ledger():
+    """Record the local log's head hash on the EVM contract if it moved since the last anchor"""
+    if not blockchain_enabled or not tx_manager or LEDGER_VERSION != 2:
+        return None
+    records, head = local_ledger.head()
+    if not records or records == local_ledger.anchored:
+        return None
+    receipt = tx_manager.wait(tx_manager.transact(contract.functions.anchorLedger(head, records), default_account))
+    local_ledger.anchored = records
+    logger.info(f"Anchored local ledger head {head.hex()[:16]}… ({records} records) in {receipt.transactionHash.hex()}")
+    return receipt.transactionHash.hex()
+
+def _local_ledger_worker(anchor):
+    last_anchor = time.time()
+    while True:
+        time.sleep(LOCAL_LEDGER_CONFIG['flush_interval'])
+        try:
+            local_ledger.flush()
+            if anchor and time.time() - last_anchor >= LOCAL_LEDGER_CONFIG['anchor_interval']:
+                last_anchor = time.time()
+                anchor_local_ledger()
+        except Exception as e:
+            logger.error(f"Local ledger maintenance error: {e}")
+
+def start_local_ledger_worker(anchor=False):
+    thread = threading.Thread(target=_local_ledger_worker, args=(anchor,), name='local-ledger', daemon=True)
+    thread.start()
+    return thread
+
+# Blockchain helper functions with improved error handling
+def get_user_blockchain_account(user_id):
+    """Get or create a blockchain account for a user"""
+    if not blockchain_enabled or not tx_manager:
+        return None
+    
+    try:
+        return tx_manager.account_for_user(user_id)
+    except Exception as e:
+        logger.error(f"Error getting user blockchain account: {e}")
+        return default_account
+
+def record_to_blockchain(action_type, data):
+    """Record important actions to blockchain with improved error handling"""
+    if local_ledger_active():
+        try:
+            return local_ledger.record(action_type, data, session.get('user_id'))
+        except Exception as e:
+            logger.error(f"Local ledger append failed: {e}")
+            return None
+        finally:
+            data_versions.bump('ledger')
+            _ledger_index_wakeup.set()
+
+    if not blockchain_enabled or not contract:
+        logger.warning("Blockchain disabled - action not recorded to blockchain")
+        return None
+    
+    try:
+        user_account = get_user_blockchain_account(session.get('user_id', 0))
+        if not user_account:
+            logger.error("No user account available for blockchain transaction")
+            return None
+        
+        if action_type == 'stock_update':
+            tx_hash = tx_manager.transact(ledger_function('addMedicineStock',
+                data['pharmacy_name'],
+                data['medicine_name'],
+                data['quantity'],
+                data['price']
+            ), user_account)
+            
+        elif action_type == 'shortage_report':
+            tx_hash = tx_manager.transact(ledger_function('reportShortage',
+                data['medicine_name'],
+                data['location_name']
+            ), user_account)
+        
+        else:
+            logger.warning(f"Unknown blockchain action type: {action_type}")
+            return None
+        
+        # Wait for transaction receipt with timeout
+        try:
+            receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=60)
+            logger.info(f"Blockchain transaction successful: {receipt.transactionHash.hex()}")
+            return receipt.transactionHash.hex()
+        except Exception as e:
+            logger.error(f"Transaction receipt error: {e}")
+            return tx_hash.hex() if hasattr(tx_hash, 'hex') else str(tx_hash)
+        finally:
+            data_versions.bump('ledger')
+            _ledger_index_wakeup.set()
+        
+    except Exception as e:
+        logger.error(f"Blockchain transaction failed: {e}")
+        return None
+
+# Ledger record kinds: on-chain counter, per-index getter and row -> dict mapping.
+# On v2, stocks and shortages are read from their events and ids are mapped back to names.
+LEDGER_KINDS = {
+    'stocks': {
+        'count': 'getStockCount', 'getter': 'stockUpdates', 'event': 'StockAdded',
+        'parse': lambda r: {"pharmacy": r[0], "medicine": r[1], "quantity": r[2], "price": r[3], "timestamp": r[4]},
+        'parse_v2': lambda a: {"pharmacy": ledger_names.name('pharmacy', a['pharmacyId']),
+                               "medicine": ledger_names.name('medicine', a['medicineId']),
+                               "quantity": a['quantity'], "price": a['price'], "timestamp": a['timestamp']}
+    },
+    'shortages': {
+        'count': 'getShortageCount', 'getter': 'shortageReports', 'event': 'ShortageReported',
+        'parse': lambda r: {"medicine": r[0], "location": r[1], "timestamp": r[2]},
+        'parse_v2': lambda a: {"medicine": ledger_names.name('medicine', a['medicineId']),
+                               "location": ledger_names.name('location', a['locationId']),
+                               "timestamp": a['timestamp']}
+    },
+    'orders': {
+        'count': 'getOrderCount', 'getter': 'getOrder',
+        'parse': lambda r: {"medicine": r[0], "quantity": r[1], "retailer": r[2], "manufacturer": r[3], "status": r[4]},
+        'parse_v2': lambda r: {"medicine": ledger_names.name('medicine', r[0]), "quantity": r[1], "retailer": r[2],
+                               "manufacturer": r[3], "status": LEDGER_ORDER_STATUSES[r[4]]}
+    }
+}
+LEDGER_RECENT_LIMIT = 100
+
+def ledger_count(kind):
+    if local_ledger_active():
+        return local_ledger.count(kind)
+    return getattr(contract.functions, LEDGER_KINDS[kind]['count'])().call()
+
+def ledger_entries(kind, indices):
+    """Entries at the given indices, in order; v2 event records come from batched log queries"""
+    spec = LEDGER_KINDS[kind]
+    indices = list(indices)
+    if local_ledger_active():
+        return local_ledger.entries(kind, indices)
+    if LEDGER_VERSION == 2 and 'event' in spec:
+        found = {}
+        for start in range(0, len(indices), LEDGER_LOG_BATCH):
+            for event in ledger_logs(spec['event'], indices[start:start + LEDGER_LOG_BATCH]):
+                found[event['args']['seq']] = spec['parse_v2'](event['args'])
+        missing = [i for i in indices if i not in found]
+        if missing:
+            raise LookupError(f"{kind} {missing[:5]} not found in ledger logs")
+        entries = [found[i] for i in indices]
+    else:
+        parse = spec['parse_v2'] if LEDGER_VERSION == 2 else spec['parse']
+        entries = [parse(getattr(contract.functions, spec['getter'])(i).call()) for i in indices]
+    for index, entry in zip(indices, entries):
+        entry['index'] = index
+    return entries
+
+def ledger_entry(kind, index):
+    return ledger_entries(kind, [index])[0]
+
+def ledger_recent(kind, count, limit=LEDGER_RECENT_LIMIT):
+    """The newest `limit` entries in chronological order"""
+    indices = range(max(count - limit, 0), count)
+    try:
+        return ledger_entries(kind, indices)
+    except Exception as e:
+        logger.warning(f"Error fetching recent {kind}, retrying one by one: {e}")
+    entries = []
+    for i in indices:
+        try:
+            entries.append(ledger_entry(kind, i))
+        except Exception as e:
+            logger.warning(f"Error fetching {kind} {i}: {e}")
+    return entries
+
+def get_blockchain_data():
+    """Fetch data from blockchain with improved error handling"""
+    if not ledger_available():
+        return {'stocks': [], 'shortages': [], 'orders': [], 'enabled': False, 'error': 'Blockchain not available'}
+    
+    try:
+        # Test contract connection first
+        try:
+            stock_count = ledger_count('stocks')
+        except Exception as e:
+            logger.error(f"Cannot call getStockCount: {e}")
+            return {'stocks': [], 'shortages': [], 'orders': [], 'enabled': False, 'error': 'Contract call failed'}
+        
+        # Get shortage and order counts
+        try:
+            shortage_count = ledger_count('shortages')
+        except Exception as e:
+            logger.warning(f"Cannot call getShortageCount: {e}")
+            shortage_count = 0
+            
+        try:
+            order_count = ledger_count('orders')
+        except Exception as e:
+            logger.warning(f"Cannot call getOrderCount: {e}")
+            order_count = 0
+        
+        # Newest entries only (bounded to prevent timeouts); older ones are paged via /api/ledger/<kind>
+        stock_list = ledger_recent('stocks', stock_count)
+        shortage_list = ledger_recent('shortages', shortage_count)
+        order_list = ledger_recent('orders', order_count)
+        
+        logger.info(f"Successfully fetched blockchain data: {len(stock_list)} stocks, {len(shortage_list)} shortages, {len(order_list)} orders")
+        
+        return {
+            'stocks': stock_list,
+            'shortages': shortage_list,
+            'orders': order_list,
+            'enabled': True,
+            'backend': 'local' if local_ledger_active() else 'evm',
+            'total_stocks': stock_count,
+            'total_shortages': shortage_count,
+            'total_orders': order_count
+        }
+        
+    except Exception as e:
+        logger.error(f"Failed to fetch blockchain data: {e}")
+        return {
+            'stocks': [], 
+            'shortages': [], 
+            'orders': [], 
+            'enabled': False,
+            'error': str(e)
+        }
+
+def update_retailer_stock_blockchain(medicine_name, new_stock):
+    """Update retailer stock on blockchain"""
+    if local_ledger_active():
+        try:
+            return local_ledger.append('retailer_stocks', {
+                'retailer': f"user:{session.get('user_id', 0)}", 'medicine': medicine_name, 'stock': new_stock})
+        except Exception as e:
+            logger.error(f"Local ledger retailer stock update failed: {e}")
+            return None
+
+    if not blockchain_enabled or not contract:
+        return None
+    
+    try:
+        user_account = get_user_blockchain_account(session.get('user_id', 0))
+        if not user_account:
+            return None
+        
+        # Call the updateRetailerStock function
+        tx_hash = tx_manager.transact(ledger_function('updateRetailerStock',
+            medicine_name,
+            new_stock
+        ), user_account)
+        
+        # Wait for transaction receipt
+        receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=60)
+        logger.info(f"Retailer stock update successful: {receipt.transactionHash.hex()}")
+        return receipt.transactionHash.hex()
+        
+    except Exception as e:
+        logger.error(f"Blockchain retailer stock update failed: {e}")
+        return None
+
+def get_retailer_stock_from_blockchain(retailer_address, medicine_name):
+    """Get retailer stock from blockchain"""
+    if local_ledger_active():
+        return local_ledger.retailer_stock(retailer_address, medicine_name)
+    if not blockchain_enabled or not contract:
+        return 0
+    
+    try:
+        stock = ledger_function('retailerStocks', retailer_address, medicine_name).call()
+        return stock
+    except Exception as e:
+        logger.error(f"Failed to get retailer stock from blockchain: {e}")
+        return 0
+
+def sync_auto_orders():
+    """Sync new auto-orders from blockchain into SQLite"""
+    if not blockchain_enabled or not contract:
+        return
+
+    try:
+        order_count = ledger_count('orders')
+        conn = get_db_connection()
+
+        for i in range(min(order_count, 100)):  # Limit to prevent timeouts
+            try:
+                order = ledger_entry('orders', i)
+                medicine_name, quantity, retailer_addr, manufacturer_addr, status = (
+                    order['medicine'], order['quantity'], order['retailer'], order['manufacturer'], order['status'])
+
+                blockchain_order_id = f"{retailer_addr}_{medicine_name}_{i}"
+                existing = conn.execute(
+                    "SELECT id FROM manufacturer_orders WHERE blockchain_order_id = ?",
+                    (blockchain_order_id,)
+                ).fetchone()
+
+                if not existing:
+                    # Get medicine ID with error handling
+                    med = conn.execute("SELECT id FROM medicines WHERE name = ?", (medicine_name,)).fetchone()
+                    if not med:
+                        logger.warning(f"Medicine '{medicine_name}' not found in database")
+                        continue
+
+                    # Orders placed by the reorder engine already have a local row; attach the chain id to it.
+                    # A restock may have closed the row locally before the order showed up on chain.
+                    claimed = conn.execute("""
+                        UPDATE manufacturer_orders SET blockchain_order_id = ?,
+                            status = CASE WHEN status IN ('delivered', 'cancelled') THEN status ELSE ? END
+                        WHERE id = (
+                            SELECT id FROM manufacturer_orders
+                            WHERE blockchain_order_id LIKE 'reorder:%' AND tx_hash IS NOT NULL
+                              AND retailer_address = ? AND medicine_id = ?
+                            ORDER BY id LIMIT 1
+                        )
+                    """, (blockchain_order_id, status, retailer_addr, med["id"]))
+                    if claimed.rowcount:
+                        continue
+
+                    conn.execute("""
+                        INSERT INTO manufacturer_orders (blockchain_order_id, medicine_id, quantity_ordered, retailer_address, manufacturer_address, status)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    """, (blockchain_order_id, med["id"], quantity, retailer_addr, manufacturer_addr, status))
+            except Exception as e:
+                logger.error(f"Error processing order {i}: {e}")
+                continue
+
+        conn.commit()
+        conn.close()
+
+    except Exception as e:
+        logger.error(f"sync_auto_orders error: {e}")
+
+# Reorder engine: places manufacturer orders for low stock across all pharmacies
+REORDER_CONFIG = {
+    'interval': int(os.environ.get('REORDER_INTERVAL', '900')),
+    'target_multiplier': 5,          # reorder up to minimum_stock_level * multiplier
+    'batch_size': 200,               # placeOrder transactions submitted per batch
+    'max_per_run': 20000,
+    'claim_timeout': 600,            # seconds before an order stuck in 'submitting' is held for review
+    'manufacturer_address': os.environ.get('MANUFACTURER_ADDRESS')
+}
+# Open orders block reordering their (pharmacy, medicine); stock back above its minimum closes them.
+# Queued orders were never sent and are cancelled; sent ones are taken as delivered.
+REORDER_RESTOCK_TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS manufacturer_orders_{event.split()[0].lower()}_restock
+       AFTER {event} ON pharmacy_inventory BEGIN
+        UPDATE manufacturer_orders
+        SET status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE 'delivered' END,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE pharmacy_id = new.pharmacy_id AND medicine_id = new.medicine_id
+          AND status IN ('queued', 'pending', 'confirmed', 'shipped')
+          AND (SELECT SUM(current_stock) > MAX(COALESCE(minimum_stock_level, 10)) FROM pharmacy_inventory
+               WHERE pharmacy_id = new.pharmacy_id AND medicine_id = new.medicine_id);
+    END'''
+    for event in ('INSERT', 'UPDATE OF current_stock, minimum_stock_level')
+]
+
+def ensure_reorder_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS manufacturer_orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            blockchain_order_id VARCHAR(200) UNIQUE,
+            pharmacy_id INTEGER,
+            medicine_id INTEGER NOT NULL,
+            quantity_ordered INTEGER NOT NULL,
+            retailer_address VARCHAR(42),
+            manufacturer_address VARCHAR(42),
+            status VARCHAR(20) DEFAULT 'pending',
+            tx_hash VARCHAR(66),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (pharmacy_id) REFERENCES pharmacies(id),
+            FOREIGN KEY (medicine_id) REFERENCES medicines(id)
+        )
+    ''')
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(manufacturer_orders)')}
+    for column, ddl in (('pharmacy_id', 'INTEGER'), ('tx_hash', 'VARCHAR(66)'),
+                        ('updated_at', 'TIMESTAMP')):
+        if column not in columns:
+            conn.execute(f'ALTER TABLE manufacturer_orders ADD COLUMN {column} {ddl}')
+    # At most one open order per (pharmacy, medicine); INSERT OR IGNORE relies on this to deduplicate.
+    # Orders being submitted or held for review count as open; older databases have the index without them.
+    index_sql = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'idx_manufacturer_orders_open'").fetchone()
+    if index_sql and 'needs_review' not in index_sql[0]:
+        conn.execute('DROP INDEX idx_manufacturer_orders_open')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_manufacturer_orders_open
+        ON manufacturer_orders(pharmacy_id, medicine_id)
+        WHERE status IN ('queued', 'submitting', 'needs_review', 'pending', 'confirmed', 'shipped')
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_manufacturer_orders_status ON manufacturer_orders(status)')
+    for statement in REORDER_RESTOCK_TRIGGERS:
+        conn.execute(statement)
+    conn.commit()
+
+def queue_reorders(conn):
+    """Queue an order for every (pharmacy, medicine) at or below its minimum level in one set-based pass.
+
+    Stock is summed across batches. Pairs that already have an open order are
+    skipped by the partial unique index, so concurrent runs cannot double-order.
+    """
+    cursor = conn.execute('''
+        INSERT OR IGNORE INTO manufacturer_orders
+            (blockchain_order_id, pharmacy_id, medicine_id, quantity_ordered, status)
+        SELECT 'reorder:' || pharmacy_id || ':' || medicine_id || ':' || strftime('%s', 'now'),
+               pharmacy_id, medicine_id, target - stock, 'queued'
+        FROM (
+            SELECT pi.pharmacy_id, pi.medicine_id,
+                   SUM(pi.current_stock) as stock,
+                   MAX(COALESCE(pi.minimum_stock_level, 10)) as minimum,
+                   MAX(COALESCE(pi.minimum_stock_level, 10)) * ? as target
+            FROM pharmacy_inventory pi
+            GROUP BY pi.pharmacy_id, pi.medicine_id
+        )
+        WHERE stock <= minimum AND target > stock
+    ''', (REORDER_CONFIG['target_multiplier'],))
+    conn.commit()
+    return cursor.rowcount
+
+def claim_queued_orders(conn, limit):
+    """Move up to limit queued orders to 'submitting' in one statement and return them.
+
+    Concurrent runs (several workers, or /admin/reorder/run during the background
+    loop) each get disjoint rows, so no order is sent twice.
+    """
+    ids = [row[0] for row in conn.execute('''
+        UPDATE manufacturer_orders SET status = 'submitting', updated_at = CURRENT_TIMESTAMP
+        WHERE id IN (SELECT id FROM manufacturer_orders WHERE status = 'queued' ORDER BY id LIMIT ?)
+        RETURNING id
+    ''', (limit,)).fetchall()]
+    conn.commit()
+    if not ids:
+        return []
+    return conn.execute(f'''
+        SELECT mo.id, mo.quantity_ordered, m.name as medicine_name, p.user_id
+        FROM manufacturer_orders mo
+        LEFT JOIN medicines m ON mo.medicine_id = m.id
+        LEFT JOIN pharmacies p ON mo.pharmacy_id = p.id
+        WHERE mo.id IN ({','.join('?' * len(ids))})
+        ORDER BY mo.id
+    ''', ids).fetchall()
+
+def submit_queued_orders(conn, limit=None):
+    """Send queued orders to the ledger in parallel batches, from each pharmacy's own account"""
+    if not blockchain_enabled or not contract or not tx_manager:
+        return 0, 0
+
+    # A run that died mid-submit leaves its claims behind; whether they reached the chain is unknown,
+    # so they are held (still blocking a new order for the pair) until an admin resends or cancels them
+    conn.execute('''
+        UPDATE manufacturer_orders SET status = 'needs_review', updated_at = CURRENT_TIMESTAMP
+        WHERE status = 'submitting' AND updated_at < DATETIME('now', ?)
+    ''', (f"-{REORDER_CONFIG['claim_timeout']} seconds",))
+    conn.commit()
+
+    manufacturer = REORDER_CONFIG['manufacturer_address'] or default_account
+    submitted = failed = 0
+    remaining = limit or REORDER_CONFIG['max_per_run']
+    while remaining > 0:
+        claimed = claim_queued_orders(conn, min(REORDER_CONFIG['batch_size'], remaining))
+        if not claimed:
+            break
+        remaining -= len(claimed)
+        batch = [row for row in claimed if row['medicine_name'] is not None and row['user_id'] is not None]
+        orphaned = [('failed', None, None, None, row['id']) for row in claimed if row not in batch]
+        failed += len(orphaned)
+        retailers = [tx_manager.account_for_user(row['user_id']) for row in batch]
+        if LEDGER_VERSION == 2:
+            # Register the batch's new medicine names in one parallel round instead of per order
+            ledger_names.ids('medicine', [row['medicine_name'] for row in batch])
+        calls = [(ledger_function('placeOrder', row['medicine_name'], row['quantity_ordered'], manufacturer), retailer)
+                 for row, retailer in zip(batch, retailers)]
+        tx_hashes = tx_manager.submit_many(calls)
+
+        updates = orphaned
+        for row, retailer, tx_hash in zip(batch, retailers, tx_hashes):
+            status = 'pending' if tx_hash else 'failed'
+            updates.append((status, tx_hash, retailer, manufacturer, row['id']))
+            if tx_hash:
+                submitted += 1
+            else:
+                failed += 1
+        conn.executemany('''
+            UPDATE manufacturer_orders
+            SET status = ?, tx_hash = ?, retailer_address = ?, manufacturer_address = ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', updates)
+        conn.commit()
+
+    return submitted, failed
+
+def run_reorder_engine():
+    """One reorder pass: queue low-stock orders, then submit everything queued"""
+    started = time.monotonic()
+    conn = get_db_connection()
+    try:
+        ensure_reorder_schema(conn)
+        queued = queue_reorders(conn)
+        submitted, failed = submit_queued_orders(conn)
+    finally:
+        conn.close()
+    if queued or submitted:
+        data_versions.bump('orders', 'ledger')
+    summary = {'queued': queued, 'submitted': submitted, 'failed': failed,
+               'duration_s': round(time.monotonic() - started, 2)}
+    logger.info(f"Reorder run: {summary}")
+    return summary
+
+def _reorder_worker():
+    while True:
+        try:
+            run_reorder_engine()
+        except Exception as e:
+            logger.error(f"Reorder engine error: {e}")
+        time.sleep(REORDER_CONFIG['interval'])
+
+def start_reorder_engine():
+    thread = threading.Thread(target=_reorder_worker, name='reorder-engine', daemon=True)
+    thread.start()
+    return thread
+
+# Database helper functions
+def get_db_connection():
+    conn = sqlite3.connect('healthcare.db')
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def execute_query(query, params=None):
+    with timed('db', 'execute_query'):
+        conn = get_db_connection()
+        try:
+            if params:
+                result = conn.execute(query, params).fetchall()
+            else:
+                result = conn.execute(query).fetchall()
+            conn.commit()
+            return result
+        except Exception as e:
+            logger.error(f"Database error: {e}")
+            return None
+        finally:
+            conn.close()
+
+def execute_insert(query, params):
+    with timed('db', 'execute_insert'):
+        conn = get_db_connection()
+        try:
+            cursor = conn.execute(query, params)
+            conn.commit()
+            return cursor.lastrowid
+        except Exception as e:
+            logger.error(f"Database insert error: {e}")
+            return None
+        finally:
+            conn.close()
+
+# Read-only snapshot of healthcare.db for public, unauthenticated reads
+SNAPSHOT_CONFIG = {
+    'enabled': os.environ.get('READ_SNAPSHOT', '0') == '1',
+    'path': os.environ.get('READ_SNAPSHOT_PATH', 'healthcare.snapshot.db'),
+    'interval': int(os.environ.get('READ_SNAPSHOT_INTERVAL', '30')),  # max staleness in seconds
+    'mmap_size': 256 * 1024 * 1024
+}
+
+def refresh_read_snapshot(force=False):
+    """Copy healthcare.db into the snapshot file with the SQLite backup API.
+
+    The copy is written to a temp file and os.replace()d, so open readers keep the
+    old inode and new connections see the new one. An flock keeps workers from
+    copying at the same time; whoever gets it second sees a fresh file and skips.
+    """
+    path = SNAPSHOT_CONFIG['path']
+    with open(f'{path}.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if not force and os.path.exists(path) and time.time() - os.path.getmtime(path) < SNAPSHOT_CONFIG['interval']:
+                return False
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            source = get_db_connection()
+            target = sqlite3.connect(tmp_path)
+            try:
+                try:
+                    with timed('snapshot', 'backup'):
+                        # One step under a single read lock: a stepped copy restarts whenever another
+                        # connection writes, so under steady writes it would never finish. Writers wait
+                        # out the copy on their busy timeout instead.
+                        source.backup(target, pages=-1)
+                    target.execute('PRAGMA journal_mode = OFF')
+                finally:
+                    target.close()
+                    source.close()
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            return True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def get_read_connection():
+    """Connection for public reads: the snapshot when enabled, the main file otherwise"""
+    path = SNAPSHOT_CONFIG['path']
+    if SNAPSHOT_CONFIG['enabled'] and os.path.exists(path):
+        conn = sqlite3.connect(f'file:{path}?mode=ro&immutable=1', uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA mmap_size = {SNAPSHOT_CONFIG['mmap_size']}")
+        return conn
+    return get_db_connection()
+
+def execute_read(query, params=None):
+    """execute_query for public pages; reads the snapshot and falls back to the main file"""
+    with timed('db', 'execute_read'):
+        try:
+            conn = get_read_connection()
+            try:
+                return conn.execute(query, params or ()).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            # e.g. a table created after the last snapshot
+            logger.error(f"Snapshot read error, using main database: {e}")
+    return execute_query(query, params)
+
+def _snapshot_worker():
+    while True:
+        try:
+            refresh_read_snapshot()
+        except Exception as e:
+            logger.error(f"Snapshot refresh error: {e}")
+        time.sleep(max(1, SNAPSHOT_CONFIG['interval'] // 2))
+
+def start_snapshot_refresher():
+    thread = threading.Thread(target=_snapshot_worker, name='read-snapshot', daemon=True)
+    thread.start()
+    return thread
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = _current_route()
+    metrics.observe('byteforce_request_seconds',
+                    {'route': route, 'method': request.method, 'status': str(response.status_code)}, elapsed)
+
+    entries = [f'{kind};dur={total * 1000:.2f};desc="{count} calls"'
+               for kind, (total, count) in sorted(g.get('server_timings', {}).items())]
+    entries.append(f'total;dur={elapsed * 1000:.2f}')
+    response.headers['Server-Timing'] = ', '.join(entries)
+    return response
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint, summed over all workers when METRICS_CONFIG['dir'] is set"""
+    return app.response_class(metrics.render(METRICS_CONFIG['dir']), mimetype='text/plain; version=0.0.4')
+
+# Buffered API request logging
+API_LOG_CONFIG = {
+    'buffer_size': 50000,        # ring buffer capacity; oldest entries are dropped when full
+    'flush_interval': 2.0,       # seconds between flushes
+    'flush_batch': 1000,         # flush early once this many entries are waiting
+    'retention_days': 30,
+    'max_rows': 1000000,
+    'retention_interval': 3600,
+    'skip_endpoints': {'static', 'prometheus_metrics'}
+}
+
+def ensure_api_logs_schema(conn):
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(api_logs)')}
+    if columns and 'response_time_ms' not in columns:
+        conn.execute('ALTER TABLE api_logs ADD COLUMN response_time_ms REAL')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_api_logs_created_at ON api_logs(created_at)')
+    conn.commit()
+
+class ApiLogBuffer:
+    """In-memory ring buffer of request log rows, flushed to api_logs by a background thread"""
+
+    INSERT_SQL = '''
+        INSERT INTO api_logs (user_id, endpoint, method, response_status, ip_address,
+                              user_agent, response_time_ms, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+
+    def __init__(self, connect, buffer_size, flush_interval, flush_batch,
+                 retention_days, max_rows, retention_interval):
+        self.connect = connect
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.retention_days = retention_days
+        self.max_rows = max_rows
+        self.retention_interval = retention_interval
+        self._buffer = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._last_retention = 0.0
+        self._thread = None
+        self.dropped = 0
+
+    def append(self, row):
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append(row)
+            waiting = len(self._buffer)
+        if waiting >= self.flush_batch:
+            self._wakeup.set()
+
+    def _drain(self):
+        with self._lock:
+            rows = list(self._buffer)
+            self._buffer.clear()
+        return rows
+
+    def flush(self):
+        rows = self._drain()
+        if not rows:
+            return 0
+        conn = self.connect()
+        try:
+            with conn:
+                conn.executemany(self.INSERT_SQL, rows)
+            return len(rows)
+        except Exception as e:
+            logger.error(f"API log flush failed, {len(rows)} entries lost: {e}")
+            return 0
+        finally:
+            conn.close()
+
+    def enforce_retention(self):
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM api_logs WHERE created_at < DATETIME('now', ?)",
+                             (f'-{self.retention_days} days',))
+                # Roll over by row count too, keeping only the newest max_rows entries
+                conn.execute('''
+                    DELETE FROM api_logs WHERE id <= (
+                        SELECT id FROM api_logs ORDER BY id DESC LIMIT 1 OFFSET ?
+                    )
+                ''', (self.max_rows,))
+        except Exception as e:
+            logger.error(f"API log retention failed: {e}")
+        finally:
+            conn.close()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(timeout=self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            if time.monotonic() - self._last_retention >= self.retention_interval:
+                self._last_retention = time.monotonic()
+                self.enforce_retention()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='api-log-flusher', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+        return self._thread
+
+def _api_log_connect():
+    conn = sqlite3.connect('healthcare.db', timeout=30)
+    return conn
+
+api_log_buffer = ApiLogBuffer(
+    _api_log_connect,
+    buffer_size=API_LOG_CONFIG['buffer_size'],
+    flush_interval=API_LOG_CONFIG['flush_interval'],
+    flush_batch=API_LOG_CONFIG['flush_batch'],
+    retention_days=API_LOG_CONFIG['retention_days'],
+    max_rows=API_LOG_CONFIG['max_rows'],
+    retention_interval=API_LOG_CONFIG['retention_interval']
+)
+
+def start_api_logging():
+    try:
+        conn = _api_log_connect()
+        try:
+            ensure_api_logs_schema(conn)
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.error(f"API logging disabled: {e}")
+        return None
+    return api_log_buffer.start()
+
+
+@app.after_request
+def buffer_api_log(response):
+    if request.endpoint in API_LOG_CONFIG['skip_endpoints'] or api_log_buffer._thread is None:
+        return response
+    started = g.get('request_started')
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 2) if started is not None else None
+    api_log_buffer.append((
+        session.get('user_id'),
+        request.path[:100],
+        request.method,
+        response.status_code,
+        request.headers.get('X-Forwarded-For', request.remote_addr or '').split(',')[0].strip()[:45],
+        request.headers.get('User-Agent', ''),
+        elapsed_ms,
+        datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    ))
+    return response
+
+# Data versions and fragment caching
+class DataVersions:
+    """Counters bumped by write paths; cached fragments key on the versions they depend on.
+
+    Each counter is also a 'data_version:<name>' row in system_settings, so a bump in
+    one worker invalidates the fragments of every worker within check_interval.
+    """
+    def __init__(self, check_interval):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._shared = {}  # name -> (shared version, monotonic time it was read)
+
+    @staticmethod
+    def _setting_key(name):
+        return f'data_version:{name}'
+
+    def _read_shared(self, names):
+        keys = [self._setting_key(name) for name in names]
+        rows = execute_query(
+            f"SELECT setting_key, setting_value FROM system_settings WHERE setting_key IN ({', '.join('?' * len(keys))})",
+            keys)
+        if rows is None:
+            return None
+        found = {row['setting_key'].split(':', 1)[1]: int(row['setting_value'] or 0) for row in rows}
+        return {name: found.get(name, 0) for name in names}
+
+    def get(self, *names):
+        now = time.monotonic()
+        with self._lock:
+            stale = [name for name in names
+                     if name not in self._shared or now - self._shared[name][1] >= self.check_interval]
+        shared = self._read_shared(stale) if stale else {}
+        with self._lock:
+            # On a failed read keep the last known versions; the local counters still move
+            for name, version in (shared or {}).items():
+                self._shared[name] = (version, now)
+            return tuple((self._versions.get(name, 0), self._shared.get(name, (0, now))[0]) for name in names)
+
+    def bump(self, *names):
+        """Invalidate in every worker; call after committing a write"""
+        self.bump_local(*names)
+        conn = get_db_connection()
+        try:
+            conn.executemany('''
+                INSERT INTO system_settings (setting_key, setting_value, description)
+                VALUES (?, '1', 'Fragment cache data version')
+                ON CONFLICT(setting_key) DO UPDATE
+                SET setting_value = CAST(setting_value AS INTEGER) + 1, updated_at = CURRENT_TIMESTAMP
+            ''', [(self._setting_key(name),) for name in set(names)])
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Data version bump failed: {e}")
+        finally:
+            conn.close()
+        with self._lock:
+            # Re-read on the next get() in this process
+            for name in names:
+                self._shared.pop(name, None)
+
+    def bump_local(self, *names):
+        """Invalidate in this process only, for changes other workers detect themselves"""
+        with self._lock:
+            for name in names:
+                self._versions[name] = self._versions.get(name, 0) + 1
+data_versions = DataVersions(check_interval=1.0)
+
+# Reference data: rarely-changing tables held as immutable per-process snapshots
+REFERENCE_DATA_CONFIG = {
+    'check_interval': 2.0,  # seconds between reads of the shared version rows
+    'max_age': 300,         # bounds staleness for writes made outside the app
+    'queries': {
+        'medicines': 'SELECT * FROM medicines ORDER BY name',
+        'locations': 'SELECT * FROM locations ORDER BY name',
+        'pharmacies': 'SELECT * FROM pharmacies ORDER BY pharmacy_name'
+    }
+}
+
+class ReferenceSnapshot:
+    """One version of a reference table: ordered rows plus an id -> row map"""
+
+    __slots__ = ('version', 'loaded_at', 'rows', 'by_id')
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.rows = tuple(rows)
+        self.by_id = {row['id']: row for row in self.rows}
+
+class ReferenceData:
+    """Versioned cache of medicines, locations and pharmacies.
+
+    Each table has a version row ('refdata_version:<table>') in system_settings that
+    write paths bump, so every worker sees the change within check_interval and
+    reloads that table once. Readers get whole snapshots and never see a half-swap.
+    """
+
+    def __init__(self, queries, check_interval, max_age):
+        self.queries = queries
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self._shared_versions = {}
+        self._checked_at = 0.0
+
+    @staticmethod
+    def _setting_key(name):
+        return f'refdata_version:{name}'
+
+    def _read_shared_versions(self):
+        rows = execute_query(
+            "SELECT setting_key, setting_value FROM system_settings WHERE setting_key LIKE 'refdata_version:%'")
+        if rows is None:
+            return self._shared_versions
+        return {row['setting_key'].split(':', 1)[1]: int(row['setting_value'] or 0) for row in rows}
+
+    def _check_shared_versions(self, now):
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            shared = self._read_shared_versions()
+            changed = [n for n, v in shared.items() if self._shared_versions.get(n) != v]
+            self._shared_versions = shared
+            if changed:
+                # Fragments that render this data must not outlive it either; every
+                # worker sees the same refdata rows, so a local bump is enough
+                data_versions.bump_local(*changed)
+
+    def versions(self, *names):
+        """Shared versions of some tables, without loading their rows"""
+        self._check_shared_versions(time.monotonic())
+        return tuple(self._shared_versions.get(name, 0) for name in names)
+
+    def get(self, name):
+        now = time.monotonic()
+        self._check_shared_versions(now)
+        version = self._shared_versions.get(name, 0)
+        snapshot = self._snapshots.get(name)
+        if self._is_fresh(snapshot, version, now):
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshots.get(name)
+            if not self._is_fresh(snapshot, version, time.monotonic()):
+                with timed('refdata', name):
+                    rows = execute_query(self.queries[name])
+                if rows is None:
+                    # Keep serving the last good snapshot if the reload failed
+                    return snapshot or ReferenceSnapshot(version, [])
+                snapshot = ReferenceSnapshot(version, rows)
+                self._snapshots[name] = snapshot
+        return snapshot
+
+    def _is_fresh(self, snapshot, version, now):
+        return snapshot is not None and snapshot.version == version and now - snapshot.loaded_at < self.max_age
+
+    def rows(self, name):
+        return self.get(name).rows
+
+    def by_id(self, name):
+        return self.get(name).by_id
+
+    def lookup(self, name, row_id):
+        """One row by id; rows written since the snapshot was taken are read from the database"""
+        row = self.by_id(name).get(row_id)
+        if row is None:
+            rows = execute_query(f'SELECT * FROM {name} WHERE id = ?', (row_id,))
+            row = rows[0] if rows else None
+        return row
+
+    def bump(self, *names):
+        """Invalidate tables in every worker; call after committing a write"""
+        for name in names:
+            execute_query('''
+                INSERT INTO system_settings (setting_key, setting_value, description)
+                VALUES (?, '1', 'Reference data cache version')
+                ON CONFLICT(setting_key) DO UPDATE
+                SET setting_value = CAST(setting_value AS INTEGER) + 1, updated_at = CURRENT_TIMESTAMP
+            ''', (self._setting_key(name),))
+        # Re-read the shared versions on the next get() in this process
+        self._checked_at = 0.0
+        data_versions.bump_local(*names)
+
+reference_data = ReferenceData(REFERENCE_DATA_CONFIG['queries'], REFERENCE_DATA_CONFIG['check_interval'],
+                               REFERENCE_DATA_CONFIG['max_age'])
+
+class FragmentCache:
+    """LRU cache of rendered template fragments keyed by name, data versions and parameters.
+
+    A hit skips both the loader's queries and Jinja rendering. Versions are shared
+    between workers; the TTL bounds staleness for writes that bump none (direct chain
+    writes, edits made outside the app).
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def render(self, name, template, depends_on, loader, ttl=60, **params):
+        key = (name, data_versions.get(*depends_on), tuple(sorted(params.items())))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(key)
+                return entry[0]
+
+        with timed('fragment', name):
+            html = Markup(render_template(template, **loader(**params)))
+
+        with self._lock:
+            self._entries[key] = (html, now + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+fragment_cache = FragmentCache()
+
+def _load_recent_alerts(limit):
+    # Shown on the public landing page; a few seconds of staleness is fine
+    alerts = execute_read('''
+        SELECT sa.*, m.name as medicine_name, l.name as location_name
+        FROM shortage_alerts sa
+        JOIN medicines m ON sa.medicine_id = m.id
+        JOIN locations l ON sa.location_id = l.id
+        WHERE sa.is_active = TRUE
+        ORDER BY sa.created_at DESC LIMIT ?
+    ''', (limit,)) or []
+    return {'recent_alerts': alerts, 'alerts': alerts}
+
+def recent_alerts_fragment(template='fragments/recent_alerts.html', limit=10):
+    return fragment_cache.render(
+        template, template, ('alerts',), _load_recent_alerts, ttl=60, limit=limit)
+
+def _load_inventory(user_id):
+    # Keyed by the owning user so it can load without waiting on the pharmacy lookup
+    inventory = execute_query('''
+        SELECT pi.*, m.name as medicine_name, m.generic_name, m.brand_name, m.dosage_form, m.strength
+        FROM pharmacy_inventory pi
+        JOIN pharmacies p ON pi.pharmacy_id = p.id
+        JOIN medicines m ON pi.medicine_id = m.id
+        WHERE p.user_id = ?
+        ORDER BY pi.current_stock ASC
+    ''', (user_id,)) or []
+    low_stock = [item for item in inventory if item['current_stock'] <= item['minimum_stock_level']]
+    return {'inventory': inventory, 'low_stock': low_stock}
+
+def inventory_version(user_id):
+    """Data version name for one pharmacy's inventory, keyed by its owner like the fragment"""
+    return f'inventory:{user_id}'
+
+def inventory_fragment(user_id):
+    return fragment_cache.render(
+        'inventory', 'fragments/inventory.html', (inventory_version(user_id),), _load_inventory, ttl=60,
+        user_id=user_id)
+
+def unavailable_fragment():
+    return Markup('<p class="text-muted">This section is temporarily unavailable.</p>')
+
+# Concurrent dashboard data loading
+DASHBOARD_CONFIG = {
+    'max_workers': int(os.environ.get('DASHBOARD_WORKERS', '16')),
+    'db_timeout': 2.0,
+    'ledger_timeout': 3.0
+}
+
+# Threads are created lazily on first submit, so a preforked master never starts any
+dashboard_pool = ThreadPoolExecutor(max_workers=DASHBOARD_CONFIG['max_workers'],
+                                    thread_name_prefix='dashboard')
+
+def _with_server_timings(fn):
+    """Return fn's result with the Server-Timing entries it recorded in its copied context's g"""
+    def task():
+        return fn(), g.get('server_timings', {})
+    return copy_current_request_context(task)
+
+def merge_server_timings(timings):
+    merged = g.setdefault('server_timings', {})
+    if timings is merged:
+        return  # the task ran with this request's own g
+    for kind, (total, count) in timings.items():
+        merged_total, merged_count = merged.get(kind, (0.0, 0))
+        merged[kind] = (merged_total + total, merged_count + count)
+
+def gather_dashboard_data(sources):
+    """Run independent dashboard fetches concurrently on the bounded pool.
+
+    sources maps name -> (callable, timeout_seconds, fallback). Each source gets its
+    own deadline measured from submission; a source that fails or misses it yields
+    its fallback (called if callable) and is listed in the returned degraded names.
+    """
+    started = time.monotonic()
+    in_request = has_request_context()
+    futures = {}
+    for name, (fn, _, _) in sources.items():
+        # A copied request context gets its own g, so timings are handed back and merged here
+        task = _with_server_timings(fn) if in_request else fn
+        futures[name] = dashboard_pool.submit(task)
+
+    results, degraded = {}, []
+    for name, (_, timeout, fallback) in sources.items():
+        remaining = max(0.0, started + timeout - time.monotonic())
+        try:
+            results[name] = futures[name].result(timeout=remaining)
+            if in_request:
+                results[name], timings = results[name]
+                merge_server_timings(timings)
+            continue
+        except FuturesTimeoutError:
+            logger.warning(f"Dashboard source '{name}' timed out after {timeout}s")
+            futures[name].cancel()
+        except Exception as e:
+            logger.error(f"Dashboard source '{name}' failed: {e}")
+        degraded.append(name)
+        results[name] = fallback() if callable(fallback) else fallback
+
+    if degraded and has_request_context():
+        flash('Some dashboard data is temporarily unavailable; showing partial results.', 'warning')
+    return results, degraded
+
+# Routes
+
+@app.route('/')
+def index():
+    """Landing page with platform overview"""
+    fragments = {
+        'live_alerts': recent_alerts_fragment('fragments/live_alerts.html', limit=3)
+    }
+    return render_template('index.html', fragments=fragments)
+
+@app.route('/login', methods=['GET', 'POST'])
+def login():
+    """Login page for all user types"""
+    if request.method == 'POST':
+        email = request.form.get('email')
+        password = request.form.get('password')
+        
+        user = execute_query(
+            'SELECT * FROM users WHERE email = ? AND is_active = TRUE',
+            (email,)
+        )
+        
+        if user and check_password_hash(user[0]['password_hash'], password):
+            session['user_id'] = user[0]['id']
+            session['user_type'] = user[0]['user_type']
+            session['full_name'] = user[0]['full_name']
+            
+            flash(f'Welcome back, {user[0]["full_name"]}!', 'success')
+            return redirect(url_for('dashboard'))
+        else:
+            flash('Invalid email or password', 'error')
+    
+    return render_template('login.html')
+
+@app.template_filter('datefmt')
+def datefmt(value, format="%Y-%m-%d"):
+    if not value:
+        return ''
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    return value.strftime(format)
+@app.route('/api/search_pharmacies', methods=['POST'])
+def api_search_pharmacies():
+    data = request.get_json()
+    user_lat = data.get('latitude')
+    user_lon = data.get('longitude')
+    medicines = [m.strip().lower() for m in data.get('medicines', [])]
+
+    conn = get_read_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT p.id, p.pharmacy_name, p.latitude, p.longitude, pm.medicine_name, pm.price
+        FROM pharmacies p
+        JOIN pharmacy_medicines pm ON p.id = pm.pharmacy_id
+    ''')
+
+    rows = cursor.fetchall()
+    conn.close()
+
+    results = {}
+    for pid, pname, plat, plon, med_name, price in rows:
+        if med_name.lower() in medicines:
+            distance = haversine(user_lat, user_lon, plat, plon)
+            if distance <= 20:  # 20 km radius
+                if pid not in results:
+                    results[pid] = {
+                        "pharmacy_name": pname,
+                        "latitude": plat,
+                        "longitude": plon,
+                        "medicines": []
+                    }
+                results[pid]["medicines"].append({
+                    "medicine_name": med_name,
+                    "price": price
+                })
+
+    if not results:
+        return jsonify({"message": "No pharmacies found nearby with requested medicines."}), 404
+
+    return jsonify({"pharmacies": list(results.values())})
+
+
+location_cache = {
+    "Mumbai": (19.0760, 72.8777),
+    "Delhi": (28.6139, 77.2090),
+    "Bangalore":(12.97,77.59),
+    "Kolkata":(22.57, 88.36),
+    "Hyderabad": (17.38, 78.48)
+    # Add more if needed
+}
+
+# Geocoding configuration
+GEOCODE_CONFIG = {
+    'cache_db': os.environ.get('GEOCODE_CACHE_DB', 'geocode_cache.db'),
+    'backend': os.environ.get('GEOCODER_BACKEND', 'nominatim'),  # 'nominatim' or 'static'
+    'min_interval': float(os.environ.get('GEOCODE_MIN_INTERVAL', '1.0')),  # Nominatim policy: 1 req/sec
+    'negative_ttl_days': 7,
+    'backfill_interval': 300,
+    'backfill_batch': 50
+}
+
+class StaticGeocoder:
+    """Local stub geocoder backed by a dict, same interface as geopy geocoders"""
+    class _Location:
+        def __init__(self, latitude, longitude, address):
+            self.latitude = latitude
+            self.longitude = longitude
+            self.address = address
+
+    def __init__(self, places=None):
+        self.places = {k.strip().lower(): v for k, v in (places or {}).items()}
+        self.calls = 0
+
+    def geocode(self, query, **kwargs):
+        self.calls += 1
+        key = query.strip().lower()
+        if key in self.places:
+            lat, lon = self.places[key]
+            return self._Location(lat, lon, query)
+        # Fall back to the last comma-separated component (usually the city)
+        tail = key.split(',')[-1].strip()
+        if tail in self.places:
+            lat, lon = self.places[tail]
+            return self._Location(lat, lon, query)
+        return None
+
+class GeocodingService:
+    """Geocoder front-end with an on-disk cache, request coalescing and a global rate limit.
+
+    The rate limit is kept in the cache database, so every process sharing the cache
+    file shares one request slot per min_interval.
+    """
+
+    def __init__(self, geocoder, cache_path, min_interval=1.0, negative_ttl_days=7):
+        self.geocoder = geocoder
+        self.cache_path = cache_path
+        self.min_interval = min_interval
+        self.negative_ttl_days = negative_ttl_days
+        self._rate_lock = threading.Lock()
+        self._inflight_lock = threading.Lock()
+        self._inflight = {}
+        self._init_cache()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.cache_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_cache(self):
+        conn = self._connect()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS geocode_cache (
+                    query TEXT PRIMARY KEY,
+                    latitude REAL,
+                    longitude REAL,
+                    found INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            # Single row holding the time.time() of the last reserved upstream request slot
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS geocode_rate (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    last_request REAL NOT NULL
+                )
+            ''')
+            conn.execute('INSERT OR IGNORE INTO geocode_rate (id, last_request) VALUES (1, 0)')
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def normalize(query):
+        return re.sub(r'\s+', ' ', str(query or '')).strip().lower()
+
+    def _cache_get(self, key):
+        conn = self._connect()
+        try:
+            row = conn.execute('''
+                SELECT latitude, longitude, found FROM geocode_cache
+                WHERE query = ? AND (found = 1 OR created_at >= DATETIME('now', ?))
+            ''', (key, f'-{self.negative_ttl_days} days')).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return False, None
+        return True, (row['latitude'], row['longitude']) if row['found'] else None
+
+    def _cache_put(self, key, coords):
+        conn = self._connect()
+        try:
+            conn.execute('''
+                INSERT OR REPLACE INTO geocode_cache (query, latitude, longitude, found, created_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (key, coords[0] if coords else None, coords[1] if coords else None, 1 if coords else 0))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _throttle(self):
+        # Called with _rate_lock held so this process has one reservation in flight;
+        # BEGIN IMMEDIATE serializes the reservations of all processes
+        if self.min_interval <= 0:
+            return
+        conn = self._connect()
+        conn.isolation_level = None
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            last = conn.execute('SELECT last_request FROM geocode_rate WHERE id = 1').fetchone()
+            slot = max(time.time(), (last['last_request'] if last else 0) + self.min_interval)
+            conn.execute('INSERT OR REPLACE INTO geocode_rate (id, last_request) VALUES (1, ?)', (slot,))
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        wait = slot - time.time()
+        if wait > 0:
+            time.sleep(wait)
+
+    def _lookup_upstream(self, query):
+        with self._rate_lock:
+            self._throttle()
+            try:
+                location = self.geocoder.geocode(query)
+            except Exception as e:
+                logger.warning(f"Geocoding failed for '{query}': {e}")
+                return False, None
+        if location is None:
+            return True, None
+        return True, (float(location.latitude), float(location.longitude))
+
+    def geocode(self, query):
+        """Return (lat, lon) for an address or None; concurrent callers for the same address share one lookup"""
+        key = self.normalize(query)
+        if not key:
+            return None
+
+        hit, coords = self._cache_get(key)
+        if hit:
+            return coords
+
+        with self._inflight_lock:
+            pending = self._inflight.get(key)
+            owner = pending is None
+            if owner:
+                pending = {'event': threading.Event(), 'result': None}
+                self._inflight[key] = pending
+
+        if not owner:
+            pending['event'].wait(timeout=60)
+            return pending['result']
+
+        try:
+            ok, coords = self._lookup_upstream(query)
+            if ok:
+                self._cache_put(key, coords)
+            pending['result'] = coords
+            return coords
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            pending['event'].set()
+
+def create_geocoding_service(backend=None):
+    backend = backend or GEOCODE_CONFIG['backend']
+    if backend == 'static':
+        geocoder = StaticGeocoder(location_cache)
+    else:
+        geocoder = geolocator
+    return GeocodingService(
+        geocoder,
+        GEOCODE_CONFIG['cache_db'],
+        min_interval=GEOCODE_CONFIG['min_interval'] if backend != 'static' else 0,
+        negative_ttl_days=GEOCODE_CONFIG['negative_ttl_days']
+    )
+
+geocoding_service = create_geocoding_service()
+
+def ensure_geocode_backfill_schema(conn):
+    # Rows the geocoder could not resolve, so the next pass skips them until their retry time
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS geocode_failures (
+            entity VARCHAR(20) NOT NULL,
+            entity_id INTEGER NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 1,
+            next_attempt TIMESTAMP NOT NULL,
+            PRIMARY KEY (entity, entity_id)
+        )
+    ''')
+    conn.commit()
+
+def geocode_retry_hours(attempts):
+    """Backoff after a failed lookup: 1h, 2h, 4h, ... capped at the negative cache TTL"""
+    return min(2 ** (attempts - 1), GEOCODE_CONFIG['negative_ttl_days'] * 24)
+
+def backfill_missing_coordinates(service=None, batch_size=None):
+    """Fill null latitude/longitude on pharmacies and locations from the geocoding service"""
+    service = service or geocoding_service
+    batch_size = batch_size or GEOCODE_CONFIG['backfill_batch']
+    updated = 0
+
+    conn = get_db_connection()
+    try:
+        ensure_geocode_backfill_schema(conn)
+        locations = conn.execute('''
+            SELECT l.id, l.name, parent.name as parent_name, f.attempts
+            FROM locations l
+            LEFT JOIN locations parent ON l.parent_id = parent.id
+            LEFT JOIN geocode_failures f ON f.entity = 'locations' AND f.entity_id = l.id
+            WHERE (l.latitude IS NULL OR l.longitude IS NULL)
+              AND (f.next_attempt IS NULL OR f.next_attempt <= CURRENT_TIMESTAMP)
+            LIMIT ?
+        ''', (batch_size,)).fetchall()
+        pharmacies = conn.execute('''
+            SELECT p.id, p.address, l.name as location_name, f.attempts
+            FROM pharmacies p
+            LEFT JOIN locations l ON p.location_id = l.id
+            LEFT JOIN geocode_failures f ON f.entity = 'pharmacies' AND f.entity_id = p.id
+            WHERE (p.latitude IS NULL OR p.longitude IS NULL)
+              AND (f.next_attempt IS NULL OR f.next_attempt <= CURRENT_TIMESTAMP)
+            LIMIT ?
+        ''', (batch_size,)).fetchall()
+    finally:
+        conn.close()
+
+    failures = []
+    location_updates = []
+    for loc in locations:
+        query = ', '.join(part for part in (loc['name'], loc['parent_name'], 'India') if part)
+        coords = service.geocode(query)
+        if coords:
+            location_updates.append((coords[0], coords[1], loc['id']))
+        else:
+            failures.append(('locations', loc['id'], (loc['attempts'] or 0) + 1))
+
+    pharmacy_updates = []
+    for pharmacy in pharmacies:
+        query = ', '.join(part for part in (pharmacy['address'], pharmacy['location_name']) if part)
+        coords = service.geocode(query)
+        if coords:
+            pharmacy_updates.append((coords[0], coords[1], pharmacy['id']))
+        else:
+            failures.append(('pharmacies', pharmacy['id'], (pharmacy['attempts'] or 0) + 1))
+
+    if location_updates or pharmacy_updates or failures:
+        conn = get_db_connection()
+        try:
+            conn.executemany('UPDATE locations SET latitude = ?, longitude = ? WHERE id = ?', location_updates)
+            conn.executemany('UPDATE pharmacies SET latitude = ?, longitude = ? WHERE id = ?', pharmacy_updates)
+            conn.executemany('''
+                INSERT OR REPLACE INTO geocode_failures (entity, entity_id, attempts, next_attempt)
+                VALUES (?, ?, ?, DATETIME('now', ?))
+            ''', [(entity, entity_id, attempts, f'+{geocode_retry_hours(attempts)} hours')
+                  for entity, entity_id, attempts in failures])
+            conn.executemany("DELETE FROM geocode_failures WHERE entity = ? AND entity_id = ?",
+                             [('locations', row[2]) for row in location_updates] +
+                             [('pharmacies', row[2]) for row in pharmacy_updates])
+            conn.commit()
+            updated = len(location_updates) + len(pharmacy_updates)
+        finally:
+            conn.close()
+        reference_data.bump(*[name for name, updates in (('locations', location_updates),
+                                                          ('pharmacies', pharmacy_updates)) if updates])
+
+    if updated:
+        logger.info(f"Geocode backfill updated {len(location_updates)} locations, {len(pharmacy_updates)} pharmacies")
+    if failures:
+        logger.info(f"Geocode backfill could not resolve {len(failures)} rows; they will be retried later")
+    return updated
+
+_geocode_backfill_wakeup = threading.Event()
+
+def request_geocode_backfill(pharmacy_id=None):
+    """Wake the backfill worker, e.g. after a pharmacy is saved without coordinates"""
+    if pharmacy_id is not None:
+        # The address may have changed, so retry it now rather than after its backoff
+        conn = get_db_connection()
+        try:
+            ensure_geocode_backfill_schema(conn)
+            conn.execute("DELETE FROM geocode_failures WHERE entity = 'pharmacies' AND entity_id = ?", (pharmacy_id,))
+            conn.commit()
+        finally:
+            conn.close()
+    _geocode_backfill_wakeup.set()
+
+def _geocode_backfill_worker():
+    while True:
+        try:
+            backfill_missing_coordinates()
+        except Exception as e:
+            logger.error(f"Geocode backfill error: {e}")
+        _geocode_backfill_wakeup.wait(timeout=GEOCODE_CONFIG['backfill_interval'])
+        _geocode_backfill_wakeup.clear()
+
+def start_geocode_backfill():
+    thread = threading.Thread(target=_geocode_backfill_worker, name='geocode-backfill', daemon=True)
+    thread.start()
+    return thread
+
+
+@app.route('/search_pharmacies')
+def search_pharmacies():
+    user_location_str = request.args.get('location')
+    user_location_str = user_location_str.strip().lower()
+    user_latlng = location_cache.get(user_location_str)
+    medicines_str = request.args.get('medicines')
+    
+    
+    if not user_location_str or not medicines_str:
+        return jsonify({"error": "Missing parameters"}), 400
+
+    user_location_str = user_location_str.strip().title()
+
+    user_latlng = location_cache.get(user_location_str) or geocoding_service.geocode(user_location_str)
+    if not user_latlng:
+        return jsonify({"error": "Invalid location"}), 400
+
+    requested_medicines = [m.strip().lower() for m in medicines_str.split(',')]
+
+    # Expanded dummy pharmacy data
+    dummy_pharmacies = [
+        # Mumbai
+        {
+            "id": 1,
+            "pharmacy_name": "Test Pharmacy Mumbai",
+            "address": "123 Test St, Mumbai",
+            "latitude": 19.07,
+            "longitude": 72.88,
+            "medicine_prices": {
+                "insulin": 500,
+                "thyroxine": 300,
+                "paracetamol": 20
+            }
+        },
+        {
+            "id": 4,
+            "pharmacy_name": "mumb Care Pharmacy",
+            "address": "78 Shahdara, Delhi",
+            "latitude": 19.07,
+            "longitude": 72.88,
+            "medicine_prices": {
+                "thyroxine": 310,
+                "paracetamol": 25
+            }
+        },
+        {
+            "id": 2,
+            "pharmacy_name": "Another Pharmacy Mumbai",
+            "address": "456 Sample Rd, Mumbai",
+            "latitude": 19.09,
+            "longitude": 72.86,
+            "medicine_prices": {
+                "insulin": 520,
+                "amoxicillin": 40
+            }
+        },
+        {
+            "id": 6,
+            "pharmacy_name": "HealthMart Pharmacy mira bhayandar",
+            "address": "50 MG Road, mmr",
+            "latitude": 19.07,
+            "longitude": 72.88,
+            "medicine_prices": {
+                "insulin": 495,
+                "thyroxine": 305,
+                "amoxicillin": 45
+            }
+        },
+
+        {
+            "id": 7,
+            "pharmacy_name": "Wellness Pharmacy navi mumbai",
+            "address": "22 Park Street, mmr",
+            "latitude": 19.07,
+            "longitude": 72.88,
+            "medicine_prices": {
+                "paracetamol": 23,
+                "thyroxine": 320
+            }
+        },
+
+        # Delhi
+        {
+            "id": 3,
+            "pharmacy_name": "Fortis Pharmacy Delhi",
+            "address": "45 Connaught Place, Delhi",
+            "latitude": 28.63,
+            "longitude": 77.21,
+            "medicine_prices": {
+                "insulin": 510,
+                "amoxicillin": 42,
+                "paracetamol": 22
+            }
+        },
+        
+        {
+            "id": 4,
+            "pharmacy_name": "Delhi Care Pharmacy",
+            "address": "78 Shahdara, Delhi",
+            "latitude": 28.66,
+            "longitude": 77.25,
+            "medicine_prices": {
+                "thyroxine": 310,
+                "paracetamol": 25
+            }
+        },
+        {
+            "id": 5,
+            "pharmacy_name": "CarePlus Pharmacy Newdelhi",
+            "address": "78 Anna Salai, ncr",
+            "latitude": 28.63,
+            "longitude": 77.21,
+            "medicine_prices": {
+                "amoxicillin": 48,
+                "paracetamol": 20
+            }
+        },
+
+        {
+            "id": 5,
+            "pharmacy_name": "CarePlus Pharmacy ncr",
+            "address": "78 Anna Salai, noida",
+            "latitude": 28.63,
+            "longitude": 77.21,
+            "medicine_prices": {
+                "amoxicillin": 48,
+                "paracetamol": 20
+            }
+        },
+
+        # Bangalore
+        {
+            "id": 6,
+            "pharmacy_name": "HealthMart Pharmacy Bangalore",
+            "address": "50 MG Road, Bangalore",
+            "latitude": 12.97,
+            "longitude": 77.59,
+            "medicine_prices": {
+                "insulin": 495,
+                "thyroxine": 305,
+                "amoxicillin": 45
+            }
+        },
+
+        # Kolkata
+        {
+            "id": 7,
+            "pharmacy_name": "Wellness Pharmacy Kolkata",
+            "address": "22 Park Street, Kolkata",
+            "latitude": 22.57,
+            "longitude": 88.36,
+            "medicine_prices": {
+                "paracetamol": 23,
+                "thyroxine": 320
+            }
+        },
+
+        # Hyderabad
+        {
+            "id": 8,
+            "pharmacy_name": "MediCare Pharmacy Hyderabad",
+            "address": "90 Banjara Hills, Hyderabad",
+            "latitude": 17.38,
+            "longitude": 78.48,
+            "medicine_prices": {
+                "insulin": 485,
+                "amoxicillin": 50
+            }
+        },
+        
+    {
+        "id": 9,
+        "pharmacy_name": "Health Plus Pharmacy",
+        "address": "Andheri West, Mumbai",
+        "latitude": 19.1197,
+        "longitude": 72.8468,
+        "medicine_prices": {
+            "paracetamol": 25.0,
+            "amoxicillin": 50.0,
+            "thyroxine": 310.0,
+            "insulin": 490.0
+        }
+    },
+    {
+        "id": 10,
+        "pharmacy_name": "Lifeline Medicals",
+        "address": "Bandra East, Mumbai",
+        "latitude": 19.0546,
+        "longitude": 72.8409,
+        "medicine_prices": {
+            "paracetamol": 22.5,
+            "amoxicillin": 48.0,
+            "thyroxine": 305.0,
+            "insulin": 495.0
+        }
+    },
+    {
+        "id": 11,
+        "pharmacy_name": "Apollo Pharmacy",
+        "address": "Lajpat Nagar, New Delhi",
+        "latitude": 28.5672,
+        "longitude": 77.2436,
+        "medicine_prices": {
+            "paracetamol": 24.0,
+            "amoxicillin": 47.0,
+            "thyroxine": 300.0,
+            "insulin": 500.0
+        }
+    },
+    {
+        "id": 12,
+        "pharmacy_name": "City Medicos",
+        "address": "Connaught Place, New Delhi",
+        "latitude": 28.6315,
+        "longitude": 77.2167,
+        "medicine_prices": {
+            "paracetamol": 23.0,
+            "amoxicillin": 45.5,
+            "thyroxine": 315.0,
+            "insulin": 510.0
+        }
+    }
+
+    ]
+
+    max_distance_km = 15
+    nearby_pharmacies = []
+
+    for pharmacy in dummy_pharmacies:
+        pharmacy_latlng = (pharmacy['latitude'], pharmacy['longitude'])
+        dist = geodesic(user_latlng, pharmacy_latlng).km
+        if dist <= max_distance_km:
+            med_prices = {med: price for med, price in pharmacy['medicine_prices'].items() if med in requested_medicines}
+            if med_prices:
+                nearby_pharmacies.append({
+                    "pharmacy_name": pharmacy['pharmacy_name'],
+                    "address": pharmacy['address'],
+                    "latitude": pharmacy['latitude'],
+                    "longitude": pharmacy['longitude'],
+                    "medicine_prices": med_prices,
+                    "distance_km": round(dist, 2)
+                })
+
+    nearby_pharmacies.sort(key=lambda x: x['distance_km'])
+    print("Nearby pharmacies found:", len(nearby_pharmacies))
+    if not nearby_pharmacies:
+        print("No pharmacies found nearby with requested medicines.")
+
+    return jsonify({
+        "user_location": {"lat": user_latlng[0], "lng": user_latlng[1]},
+        "pharmacies": nearby_pharmacies
+    })
+
+
+
+# Pharmacy map: R*Tree spatial index, grid clusters at low zoom, pins at high zoom
+MAP_CONFIG = {
+    'pin_zoom': 13,        # at or above this zoom, return individual pharmacies
+    'max_pins': 500,       # more pins than this in view falls back to clusters
+    'cells_per_tile': 4,   # grid cells per 256px map tile, i.e. ~64px clusters
+    'max_zoom': 20
+}
+PHARMACY_RTREE_SCHEMA = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS pharmacy_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)''',
+    '''CREATE TRIGGER IF NOT EXISTS pharmacy_rtree_insert AFTER INSERT ON pharmacies
+       WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN
+        INSERT INTO pharmacy_rtree VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS pharmacy_rtree_update AFTER UPDATE OF latitude, longitude ON pharmacies BEGIN
+        DELETE FROM pharmacy_rtree WHERE id = old.id;
+        INSERT INTO pharmacy_rtree
+        SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude
+        WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS pharmacy_rtree_delete AFTER DELETE ON pharmacies BEGIN
+        DELETE FROM pharmacy_rtree WHERE id = old.id;
+    END'''
+]
+
+def ensure_map_schema(conn):
+    for statement in PHARMACY_RTREE_SCHEMA:
+        conn.execute(statement)
+    # Repopulate when pharmacies were written without the triggers (first run, bulk loads, restores)
+    indexed = conn.execute('SELECT COUNT(*) FROM pharmacy_rtree').fetchone()[0]
+    located = conn.execute(
+        'SELECT COUNT(*) FROM pharmacies WHERE latitude IS NOT NULL AND longitude IS NOT NULL').fetchone()[0]
+    if indexed != located:
+        conn.execute('DELETE FROM pharmacy_rtree')
+        conn.execute('''
+            INSERT INTO pharmacy_rtree
+            SELECT id, latitude, latitude, longitude, longitude FROM pharmacies
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+        ''')
+    conn.commit()
+
+_map_schema_ready = False
+
+def ensure_map_schema_once():
+    global _map_schema_ready
+    if not _map_schema_ready:
+        conn = get_db_connection()
+        try:
+            ensure_map_schema(conn)
+        finally:
+            conn.close()
+        _map_schema_ready = True
+
+def map_clusters(south, west, north, east, zoom):
+    """Pharmacy counts per grid cell in the viewport; the grid is global so clusters stay put while panning"""
+    cell = 360.0 / (2 ** zoom) / MAP_CONFIG['cells_per_tile']
+    rows = execute_read('''
+        SELECT CAST(min_lat / :cell AS INTEGER) - (min_lat < 0) as gy,
+               CAST(min_lon / :cell AS INTEGER) - (min_lon < 0) as gx,
+               COUNT(*) as count, AVG(min_lat) as latitude, AVG(min_lon) as longitude, MIN(id) as id
+        FROM pharmacy_rtree
+        WHERE min_lat >= :south AND max_lat <= :north AND min_lon >= :west AND max_lon <= :east
+        GROUP BY gy, gx
+    ''', {'cell': cell, 'south': south, 'north': north, 'west': west, 'east': east}) or []
+    return [{'count': row['count'], 'latitude': row['latitude'], 'longitude': row['longitude'],
+             'id': row['id'] if row['count'] == 1 else None} for row in rows]
+
+def map_pins(south, west, north, east, limit):
+    return execute_read('''
+        SELECT p.id, p.pharmacy_name, p.address, p.latitude, p.longitude
+        FROM pharmacy_rtree r
+        JOIN pharmacies p ON p.id = r.id
+        WHERE r.min_lat >= ? AND r.max_lat <= ? AND r.min_lon >= ? AND r.max_lon <= ?
+        LIMIT ?
+    ''', (south, north, west, east, limit))
+
+@app.route('/api/map/pharmacies')
+def api_map_pharmacies():
+    """Pharmacies in a bounding box: clusters at low zoom, pins at high zoom"""
+    try:
+        south, west, north, east = (float(request.args[name]) for name in ('south', 'west', 'north', 'east'))
+        zoom = max(0, min(int(request.args.get('zoom', 5)), MAP_CONFIG['max_zoom']))
+    except (KeyError, ValueError):
+        return jsonify({'error': 'south, west, north, east and zoom are required numbers'}), 400
+    if south > north:
+        return jsonify({'error': 'south must not exceed north'}), 400
+    # Leaflet can report longitudes past +/-180 after wrapping; clamp to the real world
+    west, east = max(west, -180.0), min(east, 180.0)
+    
+    ensure_map_schema_once()
+    if zoom >= MAP_CONFIG['pin_zoom']:
+        pins = map_pins(south, west, north, east, MAP_CONFIG['max_pins'] + 1)
+        if pins is not None and len(pins) <= MAP_CONFIG['max_pins']:
+            return jsonify({'type': 'pins', 'pharmacies': [dict(row) for row in pins]})
+    return jsonify({'type': 'clusters', 'clusters': map_clusters(south, west, north, east, zoom)})
+
+@app.route('/map')
+def map():
+    # Markers are loaded per viewport from /api/map/pharmacies
+    return render_template('map.html')
+# Add a blockchain status route for debugging
+@app.route('/blockchain/status')
+@login_required
+def blockchain_status():
+    """Check blockchain connection status"""
+    status = {
+        'enabled': blockchain_enabled,
+        'provider_url': BLOCKCHAIN_CONFIG['provider_url'],
+        'contract_address': BLOCKCHAIN_CONFIG['contract_address'] if LEDGER_VERSION == 1 else getattr(contract, 'address', None),
+        'contract_version': LEDGER_VERSION,
+        'ledger_backend': 'local' if local_ledger_active() else 'evm'
+    }
+    
+    if blockchain_enabled and w3:
+        try:
+            status.update({
+                'connected': w3.is_connected(),
+                'latest_block': w3.eth.block_number,
+                'accounts_count': len(tx_manager.accounts) if tx_manager else 0,
+                'default_account': default_account
+            })
+            
+            if contract:
+                try:
+                    stock_count = contract.functions.getStockCount().call()
+                    status['contract_responsive'] = True
+                    status['stock_count'] = stock_count
+                except Exception as e:
+                    status['contract_responsive'] = False
+                    status['contract_error'] = str(e)
+        except Exception as e:
+            status['connection_error'] = str(e)
+    
+    return jsonify(status)
+
+# Continue with all your existing routes...
+# (I'm keeping the rest of your routes as they were, just adding the improved blockchain handling)
+
+@app.route('/register', methods=['GET', 'POST'])
+def register():
+    """Registration page for patients and pharmacies"""
+    if request.method == 'POST':
+        username = request.form.get('username')
+        email = request.form.get('email')
+        password = request.form.get('password')
+        user_type = request.form.get('user_type')
+        full_name = request.form.get('full_name')
+        phone = request.form.get('phone')
+        
+        # Check if user already exists
+        existing_user = execute_query(
+            'SELECT id FROM users WHERE email = ? OR username = ?',
+            (email, username)
+        )
+        
+        if existing_user:
+            flash('User with this email or username already exists', 'error')
+        else:
+            password_hash = generate_password_hash(password)
+            user_id = execute_insert(
+                '''INSERT INTO users (username, email, password_hash, user_type, full_name, phone)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                (username, email, password_hash, user_type, full_name, phone)
+            )
+            
+            if user_id:
+                flash('Registration successful! Please log in.', 'success')
+                return redirect(url_for('login'))
+            else:
+                flash('Registration failed. Please try again.', 'error')
+    
+    # Get locations for dropdown
+    locations = reference_data.rows('locations')
+    return render_template('register.html', locations=locations)
+
+@app.route('/dashboard')
+@login_required
+def dashboard():
+    """Main dashboard - redirects to appropriate user dashboard"""
+    user_type = session.get('user_type')
+    
+    if user_type == 'admin':
+        return redirect(url_for('admin_dashboard'))
+    elif user_type == 'pharmacy':
+        return redirect(url_for('pharmacy_dashboard'))
+    elif user_type == 'patient':
+        return redirect(url_for('patient_dashboard'))
+    elif user_type in ['government', 'ngo']:
+        return redirect(url_for('authority_dashboard'))
+    else:
+        flash('Unknown user type', 'error')
+        return redirect(url_for('login'))
+@app.route('/alternate-medicine')
+def alternate_medicine():
+    """Page for finding alternate medicines"""
+    # Get all available medicines for search suggestions
+    available_medicines = []
+    if df is not None:
+        available_medicines = sorted(df["Medicine Name"].unique().tolist())
+    
+    return render_template('alternate_medicine.html', medicines=available_medicines)
+
+BATCH_ALTERNATIVES_CONFIG = {
+    'max_items': 50,
+    'max_top_k': 20
+}
+
+def resolve_medicine_name(medicine_name):
+    """Dataset name for a query: exact (case-insensitive) match first, then partial match"""
+    query = medicine_name.lower()
+    idx = medicine_name_index.get(query)
+    if idx is not None:
+        return df.at[idx, "Medicine Name"]
+    for med in df["Medicine Name"].values:
+        if query in med.lower() or med.lower() in query:
+            return med
+    return None
+
+def batch_alternatives(rows, top_k):
+    """Top-k alternatives for several dataset rows from one sparse matrix product.
+
+    TF-IDF rows are L2-normalised, so vectors[rows] @ vectors.T is the cosine
+    similarity block for the whole batch.
+    """
+    with timed('similarity', 'batch_similarity'):
+        block = (vectors[rows] @ vectors.T).toarray()
+    results = []
+    for position, row in enumerate(rows):
+        scores = block[position]
+        scores[row] = -1  # never suggest the medicine itself
+        k = min(top_k, len(scores) - 1)
+        top = np.argpartition(-scores, k)[:k]
+        top = top[np.argsort(-scores[top])]
+        results.append([(int(i), round(float(scores[i]) * 100, 2)) for i in top])
+    return results
+
+def alternatives_availability(names, location_id):
+    """Stock of the given medicine names at pharmacies in one location, in one query"""
+    if not names:
+        return {}
+    placeholders = ','.join('?' * len(names))
+    rows = execute_read(f'''
+        SELECT m.name as medicine_name,
+               COUNT(DISTINCT pi.pharmacy_id) as pharmacy_count,
+               SUM(pi.current_stock) as total_stock,
+               MIN(pi.unit_price) as min_price
+        FROM pharmacy_inventory pi
+        JOIN medicines m ON pi.medicine_id = m.id
+        JOIN pharmacies p ON pi.pharmacy_id = p.id
+        WHERE p.location_id = ? AND pi.is_available = TRUE AND pi.current_stock > 0
+          AND m.name IN ({placeholders})
+        GROUP BY m.name
+    ''', [location_id] + list(names)) or []
+    return {row['medicine_name']: dict(row) for row in rows}
+
+@app.route('/api/search-alternatives/batch', methods=['POST'])
+def search_alternatives_batch():
+    """Alternatives for every medicine on a prescription in one round trip"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    medicine_names = data.get('medicine_names')
+    if not isinstance(medicine_names, list) or not all(isinstance(name, str) for name in medicine_names):
+        return jsonify({'error': 'medicine_names must be a list of strings'}), 400
+    names = [name.strip() for name in medicine_names if name.strip()]
+    location_id = data.get('location_id')
+    if location_id is not None and (isinstance(location_id, bool) or not isinstance(location_id, int)):
+        return jsonify({'error': 'location_id must be an integer'}), 400
+    try:
+        top_k = max(1, min(int(data.get('top_k', 5)), BATCH_ALTERNATIVES_CONFIG['max_top_k']))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'top_k must be an integer'}), 400
+    
+    if not names:
+        return jsonify({'error': 'medicine_names is required'}), 400
+    if len(names) > BATCH_ALTERNATIVES_CONFIG['max_items']:
+        return jsonify({'error': f"At most {BATCH_ALTERNATIVES_CONFIG['max_items']} medicines per request"}), 400
+    if df is None:
+        return jsonify({'error': 'Medicine database not available'}), 500
+    
+    resolved = {name: resolve_medicine_name(name) for name in names}
+    rows = [int(medicine_name_index[found.lower()]) for found in resolved.values() if found]
+    ranked = dict(zip(rows, batch_alternatives(rows, top_k))) if rows else {}
+    
+    availability = {}
+    if location_id is not None:
+        wanted = {df.at[i, "Medicine Name"] for alternatives in ranked.values() for i, _ in alternatives}
+        wanted.update(df.at[row, "Medicine Name"] for row in ranked)
+        availability = alternatives_availability(sorted(wanted), location_id)
+    
+    def describe(i, similarity=None):
+        med = {
+            'name': df.at[i, "Medicine Name"],
+            'composition': df.at[i, "Composition"],
+            'manufacturer': df.at[i, "Manufacturer"],
+            'ingredients': ingredient_index.rows[i]
+        }
+        if similarity is not None:
+            med['similarity'] = similarity
+        if location_id is not None:
+            med['availability'] = availability.get(med['name'])
+        return med
+    
+    items = []
+    for name, found in resolved.items():
+        if not found:
+            items.append({'query': name, 'error': f'Medicine "{name}" not found in database'})
+            continue
+        row = int(medicine_name_index[found.lower()])
+        items.append({
+            'query': name,
+            'main_medicine': describe(row),
+            'alternatives': [describe(i, similarity) for i, similarity in ranked[row]]
+        })
+    
+    return jsonify({'items': items, 'total_found': sum(1 for item in items if 'error' not in item)})
+
+@app.route('/api/search-alternatives', methods=['POST'])
+def search_alternatives():
+    """API endpoint to get alternative medicines"""
+    data = request.get_json()
+    medicine_name = data.get('medicine_name', '').strip()
+    
+    if not medicine_name:
+        return jsonify({'error': 'Medicine name is required'}), 400
+    
+    # Check if dataset is loaded
+    if df is None:
+        return jsonify({'error': 'Medicine database not available'}), 500
+    
+    medicine_found = resolve_medicine_name(medicine_name)
+    
+    if not medicine_found:
+        return jsonify({'error': f'Medicine "{medicine_name}" not found in database'}), 404
+    
+    main_med, similar_meds = get_similar_medicines(medicine_found)
+    
+    if main_med is None:
+        return jsonify({'error': 'Could not find alternatives'}), 404
+    
+    return jsonify({
+        'main_medicine': main_med,
+        'alternatives': similar_meds,
+        'total_found': len(similar_meds)
+    })
+
+@app.route('/api/generic-equivalents')
+def generic_equivalents():
+    """Medicines with exactly the same ingredients and strengths"""
+    medicine_name = request.args.get('name', '').strip()
+    if df is None:
+        return jsonify({'error': 'Medicine database not available'}), 500
+    
+    matches = df.index[df["Medicine Name"].str.lower() == medicine_name.lower()]
+    if len(matches) == 0:
+        return jsonify({'error': f'Medicine "{medicine_name}" not found in database'}), 404
+    
+    idx = matches[0]
+    equivalents = [
+        {'name': df.at[i, "Medicine Name"], 'manufacturer': df.at[i, "Manufacturer"]}
+        for i in ingredient_index.equivalents(idx)
+    ]
+    return jsonify({
+        'medicine': df.at[idx, "Medicine Name"],
+        'ingredients': ingredient_index.rows[idx],
+        'equivalents': equivalents,
+        'total_found': len(equivalents)
+    })
+
+@app.route('/api/medicine-suggestions')
+def medicine_suggestions():
+    """API endpoint for medicine name autocomplete"""
+    query = request.args.get('q', '').lower()
+    
+    if not query or df is None:
+        return jsonify([])
+    
+    # Filter medicines that contain the query
+    suggestions = [
+        med for med in df["Medicine Name"].values 
+        if query in med.lower()
+    ][:10]  # Limit to 10 suggestions
+    
+    return jsonify(suggestions)
+
+# Add this route for detailed medicine info
+@app.route('/medicine-details/<medicine_name>')
+def medicine_details(medicine_name):
+    """Detailed view of a specific medicine with alternatives"""
+    if df is None:
+        flash('Medicine database not available', 'error')
+        return redirect(url_for('alternate_medicine'))
+    
+    main_med, similar_meds = get_similar_medicines(medicine_name)
+    
+    if main_med is None:
+        flash(f'Medicine "{medicine_name}" not found', 'error')
+        return redirect(url_for('alternate_medicine'))
+    
+    return render_template('medicine_details.html', 
+                         main_medicine=main_med, 
+                         alternatives=similar_meds)
+
+# Add this template filter to your app
+@app.template_filter('parse_ingredients')
+def parse_ingredients_filter(composition):
+    # Dataset compositions are pre-parsed at load; this is a dict lookup for them
+    return ingredient_index.parse(composition)
+
+@app.route('/admin/dashboard')
+@login_required
+@role_required(['admin'])
+def admin_dashboard():
+    """Admin dashboard with system overview"""
+    empty_stats = {
+        'total_users': 0,
+        'total_pharmacies': 0,
+        'total_medicines': 0,
+        'active_alerts': 0,
+        'total_reports': 0
+    }
+    
+    def load_stats():
+        # One round trip for all counters
+        result = execute_query('''
+            SELECT (SELECT COUNT(*) FROM users) as total_users,
+                   (SELECT COUNT(*) FROM pharmacies) as total_pharmacies,
+                   (SELECT COUNT(*) FROM medicines) as total_medicines,
+                   (SELECT COUNT(*) FROM shortage_alerts WHERE is_active = TRUE) as active_alerts,
+                   (SELECT COUNT(*) FROM patient_reports) as total_reports
+        ''')
+        return dict(result[0]) if result else empty_stats
+    
+    def load_recent_reports():
+        return execute_query('''
+            SELECT pr.*, m.name as medicine_name, l.name as location_name, u.full_name as reporter_name
+            FROM patient_reports pr
+            JOIN medicines m ON pr.medicine_id = m.id
+            JOIN locations l ON pr.location_id = l.id
+            LEFT JOIN users u ON pr.user_id = u.id
+            ORDER BY pr.created_at DESC LIMIT 10
+        ''') or []
+    
+    # Independent sources run concurrently; recent alerts are a cached fragment
+    data, degraded = gather_dashboard_data({
+        'stats': (load_stats, DASHBOARD_CONFIG['db_timeout'], empty_stats),
+        'recent_reports': (load_recent_reports, DASHBOARD_CONFIG['db_timeout'], []),
+        'recent_alerts': (recent_alerts_fragment, DASHBOARD_CONFIG['db_timeout'], unavailable_fragment)
+    })
+    
+    return render_template('admin_dashboard.html', 
+                         stats=data['stats'], 
+                         fragments={'recent_alerts': data['recent_alerts']},
+                         recent_reports=data['recent_reports'])
+@app.route('/pharmacy/dashboard')
+@login_required
+@role_required(['pharmacy'])
+def pharmacy_dashboard():
+    """Pharmacy dashboard for inventory management"""
+    user_id = session.get('user_id')
+    
+    def load_pharmacy():
+        pharmacy_result = execute_query('SELECT * FROM pharmacies WHERE user_id = ?', (user_id,))
+        return pharmacy_result[0] if pharmacy_result else None
+    
+    # Order sync, profile and inventory are independent; fetch them concurrently
+    data, degraded = gather_dashboard_data({
+        'sync_orders': (sync_auto_orders, DASHBOARD_CONFIG['ledger_timeout'], None),
+        'pharmacy': (load_pharmacy, DASHBOARD_CONFIG['db_timeout'], None),
+        'inventory': (lambda: inventory_fragment(user_id), DASHBOARD_CONFIG['db_timeout'], unavailable_fragment)
+    })
+    pharmacy = data['pharmacy']
+    
+    if not pharmacy:
+        if 'pharmacy' in degraded:
+            flash('Pharmacy profile is temporarily unavailable. Please try again.', 'warning')
+            return redirect(url_for('dashboard'))
+        flash('Pharmacy profile not found. Please complete your profile.', 'warning')
+        return redirect(url_for('pharmacy_profile'))
+    
+    return render_template('pharmacy_dashboard.html', 
+                         pharmacy=pharmacy,
+                         fragments={'inventory': data['inventory']})
+
+@app.route('/patient/dashboard')
+@login_required
+@role_required(['patient'])
+def patient_dashboard():
+    """Patient dashboard for reporting and viewing medicine availability"""
+    user_id = session.get('user_id')
+    
+    def load_my_reports():
+        return execute_query('''
+            SELECT pr.*, m.name as medicine_name, l.name as location_name, p.pharmacy_name
+            FROM patient_reports pr
+            JOIN medicines m ON pr.medicine_id = m.id
+            JOIN locations l ON pr.location_id = l.id
+            LEFT JOIN pharmacies p ON pr.pharmacy_id = p.id
+            WHERE pr.user_id = ?
+            ORDER BY pr.created_at DESC
+        ''', (user_id,)) or []
+    
+    def load_active_alerts():
+        return execute_query('''
+            SELECT sa.*, m.name as medicine_name, l.name as location_name
+            FROM shortage_alerts sa
+            JOIN medicines m ON sa.medicine_id = m.id
+            JOIN locations l ON sa.location_id = l.id
+            WHERE sa.is_active = TRUE
+            ORDER BY sa.severity DESC, sa.created_at DESC
+            LIMIT 10
+        ''') or []
+    
+    data, degraded = gather_dashboard_data({
+        'my_reports': (load_my_reports, DASHBOARD_CONFIG['db_timeout'], []),
+        'active_alerts': (load_active_alerts, DASHBOARD_CONFIG['db_timeout'], [])
+    })
+    
+    return render_template('patient_dashboard.html', 
+                         my_reports=data['my_reports'],
+                         active_alerts=data['active_alerts'])
+
+@app.route('/authority/dashboard')
+@login_required
+@role_required(['government', 'ngo'])
+def authority_dashboard():
+    """Dashboard for government bodies and NGOs"""
+    def load_critical_alerts():
+        return execute_query('''
+            SELECT sa.*, m.name as medicine_name, l.name as location_name
+            FROM shortage_alerts sa
+            JOIN medicines m ON sa.medicine_id = m.id
+            JOIN locations l ON sa.location_id = l.id
+            WHERE sa.is_active = TRUE AND sa.severity IN ('high', 'critical')
+            ORDER BY sa.severity DESC, sa.created_at DESC
+        ''') or []
+    
+    def load_shortage_stats():
+        return execute_query('''
+            SELECT l.name as location_name, COUNT(*) as alert_count, 
+                   AVG(sa.price_increase_percentage) as avg_price_increase
+            FROM shortage_alerts sa
+            JOIN locations l ON sa.location_id = l.id
+            WHERE sa.is_active = TRUE
+            GROUP BY l.id, l.name
+            ORDER BY alert_count DESC
+        ''') or []
+    
+    data, degraded = gather_dashboard_data({
+        'critical_alerts': (load_critical_alerts, DASHBOARD_CONFIG['db_timeout'], []),
+        'shortage_stats': (load_shortage_stats, DASHBOARD_CONFIG['db_timeout'], [])
+    })
+    
+    return render_template('authority_dashboard.html', 
+                         critical_alerts=data['critical_alerts'],
+                         shortage_stats=data['shortage_stats'])
+
+# Demand/stock feature store for predict_medicine
+SEASON_BY_MONTH = {
+    11: 'Winter', 12: 'Winter', 1: 'Winter', 2: 'Winter',
+    3: 'Summer', 4: 'Summer', 5: 'Summer', 6: 'Summer',
+    7: 'Monsoon', 8: 'Monsoon', 9: 'Monsoon', 10: 'Monsoon'
+}
+REGION_ALIASES = {'Banglore': ['Bangalore', 'Bengaluru'], 'Delhi': ['New Delhi'], 'Chennai': ['Madras'],
+                  'Kolkata': ['Calcutta'], 'Mumbai': ['Bombay']}
+FEATURE_STORE_CONFIG = {
+    'refresh_interval': 60,
+    'full_refresh_interval': 3600,   # full reload for writes that bypass price_history and refdata versions
+    'window_days': 365
+}
+INVENTORY_PRICE_HISTORY_TRIGGER = '''
+    CREATE TRIGGER inventory_price_history
+    AFTER UPDATE ON pharmacy_inventory
+    FOR EACH ROW
+    WHEN NEW.unit_price != OLD.unit_price OR NEW.current_stock != OLD.current_stock
+    BEGIN
+        INSERT INTO price_history (pharmacy_id, medicine_id, inventory_id, price, mrp, stock_level)
+        VALUES (NEW.pharmacy_id, NEW.medicine_id, NEW.id, NEW.unit_price, NEW.mrp, NEW.current_stock);
+    END
+'''
+
+def ensure_price_history_schema(conn):
+    """Record which inventory row (batch) each price_history stock reading belongs to.
+
+    A pharmacy can hold several batches of one medicine, so only readings of the
+    same batch can be differenced into consumption.
+    """
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(price_history)')}
+    if columns and 'inventory_id' not in columns:
+        conn.execute('ALTER TABLE price_history ADD COLUMN inventory_id INTEGER')
+        # Earlier readings are attributable only where the pharmacy holds a single batch
+        conn.execute('''
+            UPDATE price_history SET inventory_id = (
+                SELECT CASE WHEN COUNT(*) = 1 THEN MIN(pi.id) END
+                FROM pharmacy_inventory pi
+                WHERE pi.pharmacy_id = price_history.pharmacy_id AND pi.medicine_id = price_history.medicine_id
+            )
+        ''')
+    trigger = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'inventory_price_history'").fetchone()
+    if trigger is None or 'inventory_id' not in trigger[0]:
+        conn.execute('DROP TRIGGER IF EXISTS inventory_price_history')
+        conn.execute(INVENTORY_PRICE_HISTORY_TRIGGER)
+    conn.commit()
+
+_price_history_schema_lock = threading.Lock()
+_price_history_schema_ready = False
+
+def ensure_price_history_schema_once():
+    global _price_history_schema_ready
+    if _price_history_schema_ready:
+        return
+    with _price_history_schema_lock:
+        if not _price_history_schema_ready:
+            conn = get_db_connection()
+            try:
+                ensure_price_history_schema(conn)
+            finally:
+                conn.close()
+            _price_history_schema_ready = True
+
+class FeatureStore:
+    """In-memory demand and stock features per (region, medicine, season).
+
+    Demand is derived from stock drops between consecutive price_history rows for
+    the same inventory row (the inventory trigger writes one per change), ingested
+    incrementally past a high-water id; readings not tied to a batch are skipped. District stock is the sum of
+    current_stock, reloaded per (location, medicine) when inventory is written or new history rows show
+    a change. Mappings are reloaded when the reference data versions move.
+    """
+
+    def __init__(self, window_days=365, full_refresh_interval=3600):
+        self.window_days = window_days
+        self.full_refresh_interval = full_refresh_interval
+        self._mapping_versions = None
+        self._full_at = 0.0
+        self._lock = threading.Lock()
+        self._last_history_id = 0
+        self._last_stock = {}          # inventory_id -> last seen stock_level
+        self._pharmacy_location = {}   # pharmacy_id -> location_id
+        self._consumption = {}         # (location_id, medicine_id) -> {date ordinal: units consumed}
+        self._observed_days = {}       # (location_id, season) -> set of date ordinals
+        self._stock = {}               # (location_id, medicine_id) -> units in stock
+        self._region_locations = {}    # region -> set of location ids (incl. children)
+        self._medicine_ids = {}        # model medicine name -> set of medicine ids
+        self.ready = False
+
+    def _load_mappings(self, conn):
+        locations = conn.execute('SELECT id, name, parent_id FROM locations').fetchall()
+        children = {}
+        for loc in locations:
+            children.setdefault(loc['parent_id'], []).append(loc['id'])
+        by_name = {}
+        for loc in locations:
+            by_name.setdefault(loc['name'].strip().lower(), []).append(loc['id'])
+
+        region_locations = {}
+        for region in region_map:
+            ids = set()
+            for name in [region] + REGION_ALIASES.get(region, []):
+                stack = list(by_name.get(name.lower(), []))
+                while stack:
+                    loc_id = stack.pop()
+                    if loc_id not in ids:
+                        ids.add(loc_id)
+                        stack.extend(children.get(loc_id, []))
+            region_locations[region] = ids
+
+        medicine_ids = {}
+        for row in conn.execute('SELECT id, name, generic_name FROM medicines'):
+            haystack = f"{row['name']} {row['generic_name'] or ''}".lower()
+            for medicine in medicine_map:
+                if medicine.lower() in haystack:
+                    medicine_ids.setdefault(medicine, set()).add(row['id'])
+
+        pharmacy_location = {row['id']: row['location_id']
+                             for row in conn.execute('SELECT id, location_id FROM pharmacies')}
+        with self._lock:
+            self._region_locations = region_locations
+            self._medicine_ids = medicine_ids
+            self._pharmacy_location = pharmacy_location
+
+    def _load_stock(self, conn):
+        stock = {}
+        for row in conn.execute('''
+            SELECT p.location_id, pi.medicine_id, SUM(pi.current_stock) as stock
+            FROM pharmacy_inventory pi
+            JOIN pharmacies p ON pi.pharmacy_id = p.id
+            GROUP BY p.location_id, pi.medicine_id
+        '''):
+            stock[(row['location_id'], row['medicine_id'])] = row['stock'] or 0
+        with self._lock:
+            self._stock = stock
+
+    def _load_stock_pairs(self, conn, pairs):
+        stock = {}
+        for location_id, medicine_id in pairs:
+            row = conn.execute('''
+                SELECT SUM(pi.current_stock) as stock
+                FROM pharmacy_inventory pi
+                JOIN pharmacies p ON pi.pharmacy_id = p.id
+                WHERE p.location_id = ? AND pi.medicine_id = ?
+            ''', (location_id, medicine_id)).fetchone()
+            stock[(location_id, medicine_id)] = row['stock'] or 0
+        with self._lock:
+            self._stock.update(stock)
+
+    def ingest_history(self, conn):
+        """Fold price_history rows newer than the high-water mark into the demand buckets.
+
+        Returns the (location, medicine) pairs whose stock the new rows changed.
+        """
+        cutoff = (datetime.utcnow() - timedelta(days=self.window_days)).date().toordinal()
+        rows = conn.execute('''
+            SELECT id, pharmacy_id, medicine_id, inventory_id, stock_level, recorded_at
+            FROM price_history
+            WHERE id > ? AND stock_level IS NOT NULL
+            ORDER BY id
+        ''', (self._last_history_id,)).fetchall()
+        changed = set()
+        if not rows:
+            return changed
+
+        with self._lock:
+            for row in rows:
+                self._last_history_id = row['id']
+                previous = self._last_stock.get(row['inventory_id'])
+                if row['inventory_id'] is not None:
+                    self._last_stock[row['inventory_id']] = row['stock_level']
+                location_id = self._pharmacy_location.get(row['pharmacy_id'])
+                if location_id is None:
+                    continue
+                changed.add((location_id, row['medicine_id']))
+                try:
+                    recorded = datetime.fromisoformat(str(row['recorded_at']))
+                except ValueError:
+                    continue
+                day = recorded.date().toordinal()
+                if day < cutoff:
+                    continue
+                self._observed_days.setdefault((location_id, SEASON_BY_MONTH[recorded.month]), set()).add(day)
+                if previous is not None and row['stock_level'] < previous:
+                    daily = self._consumption.setdefault((location_id, row['medicine_id']), {})
+                    daily[day] = daily.get(day, 0) + previous - row['stock_level']
+            self._trim(cutoff)
+        return changed
+
+    def _trim(self, cutoff):
+        # Caller holds the lock
+        for daily in self._consumption.values():
+            for day in [d for d in daily if d < cutoff]:
+                del daily[day]
+        for key, days in self._observed_days.items():
+            stale = {d for d in days if d < cutoff}
+            if stale:
+                days -= stale
+
+    def refresh(self):
+        """Reload what changed since the last pass; everything once per full_refresh_interval"""
+        ensure_price_history_schema_once()
+        now = time.monotonic()
+        versions = reference_data.versions('locations', 'medicines', 'pharmacies')
+        full = not self.ready or now - self._full_at >= self.full_refresh_interval
+        conn = get_db_connection()
+        try:
+            if full or versions != self._mapping_versions:
+                self._load_mappings(conn)
+                self._mapping_versions = versions
+                # A pharmacy may have moved, so any district total can change
+                full = True
+            if full:
+                self._load_stock(conn)
+                self._full_at = now
+                self.ingest_history(conn)
+            else:
+                self._load_stock_pairs(conn, self.ingest_history(conn))
+        finally:
+            conn.close()
+        self.ready = True
+
+    def refresh_stock(self, location_id, medicine_id):
+        """Reload one district/medicine stock total after an inventory write"""
+        result = execute_query('''
+            SELECT SUM(pi.current_stock) as stock
+            FROM pharmacy_inventory pi
+            JOIN pharmacies p ON pi.pharmacy_id = p.id
+            WHERE p.location_id = ? AND pi.medicine_id = ?
+        ''', (location_id, medicine_id))
+        if result is not None:
+            with self._lock:
+                self._stock[(int(location_id), int(medicine_id))] = result[0]['stock'] or 0
+
+    def key_maps(self):
+        """Return (location_id -> region, medicine_id -> model medicine names) for labelling"""
+        with self._lock:
+            region_of = {loc: region for region, locs in self._region_locations.items() for loc in locs}
+            names_of = {}
+            for medicine, ids in self._medicine_ids.items():
+                for med_id in ids:
+                    names_of.setdefault(med_id, set()).add(medicine)
+        return region_of, names_of
+
+    def features(self, region, medicine, season):
+        """Return (avg_daily_demand, stock_level) or (None, None) when there is no live data"""
+        with self._lock:
+            locations = self._region_locations.get(region, set())
+            medicines = self._medicine_ids.get(medicine, set())
+            if not locations or not medicines:
+                return None, None
+
+            stock = sum(self._stock.get((loc, med), 0) for loc in locations for med in medicines)
+            has_stock = any((loc, med) in self._stock for loc in locations for med in medicines)
+
+            days = set()
+            for loc in locations:
+                days |= self._observed_days.get((loc, season), set())
+            consumed = 0
+            for loc in locations:
+                for med in medicines:
+                    daily = self._consumption.get((loc, med))
+                    if daily:
+                        consumed += sum(units for day, units in daily.items() if day in days)
+        demand = round(consumed / len(days), 2) if days and consumed else None
+        return demand, stock if has_stock else None
+
+feature_store = FeatureStore(window_days=FEATURE_STORE_CONFIG['window_days'],
+                             full_refresh_interval=FEATURE_STORE_CONFIG['full_refresh_interval'])
+def _feature_store_worker():
+    while True:
+        try:
+            feature_store.refresh()
+        except Exception as e:
+            logger.error(f"Feature store refresh error: {e}")
+        time.sleep(FEATURE_STORE_CONFIG['refresh_interval'])
+
+def start_feature_store():
+    thread = threading.Thread(target=_feature_store_worker, name='feature-store', daemon=True)
+    thread.start()
+    return thread
+
+def prediction_features(region, medicine, season):
+    """Model input row; live feature-store values with the typical_* tables covering gaps"""
+    key = (region, medicine, season)
+    live_demand, live_stock = feature_store.features(region, medicine, season)
+    return {
+        'Month': season_map[season],
+        'Region_Code': region_map[region],
+        'Medicine_Code': medicine_map[medicine],
+        'Avg_Daily_Demand': live_demand if live_demand is not None else typical_avg_daily_demand.get(key, 100),
+        'Stock_Level': live_stock if live_stock is not None else typical_stock_level.get(key, 50),
+    }
+
+def build_training_set():
+    """One row per (region, medicine, season) labelled from reports and alerts in the window.
+
+    shortage: a 'shortage'/'unavailable' patient report or alert was raised.
+    price_spike: an 'overpriced' report or 'price_spike' alert was raised.
+    Also returns how many reports and alerts labelled each target; the grid itself is
+    the same size whatever data exists.
+    """
+    since = (datetime.utcnow() - timedelta(days=MODEL_REGISTRY_CONFIG['window_days'])).strftime('%Y-%m-%d %H:%M:%S')
+    events = execute_query('''
+        SELECT location_id, medicine_id, CAST(strftime('%m', created_at) AS INTEGER) as month, report_type as kind
+        FROM patient_reports WHERE created_at >= ?
+        UNION ALL
+        SELECT location_id, medicine_id, CAST(strftime('%m', created_at) AS INTEGER) as month, alert_type as kind
+        FROM shortage_alerts WHERE created_at >= ?
+    ''', (since, since)) or []
+
+    region_of, names_of = feature_store.key_maps()
+    labels = {'shortage': set(), 'price_spike': set()}
+    observations = {name: 0 for name in labels}
+    for event in events:
+        region = region_of.get(event['location_id'])
+        if region is None or event['month'] not in SEASON_BY_MONTH:
+            continue
+        season = SEASON_BY_MONTH[event['month']]
+        if event['kind'] in ('shortage', 'unavailable'):
+            name = 'shortage'
+        elif event['kind'] in ('overpriced', 'price_spike'):
+            name = 'price_spike'
+        else:
+            continue
+        medicines = names_of.get(event['medicine_id'], ())
+        if medicines:
+            observations[name] += 1
+        for medicine in medicines:
+            labels[name].add((region, medicine, season))
+
+    rows, y = [], {name: [] for name in labels}
+    for region in region_map:
+        for medicine in medicine_map:
+            for season in season_map:
+                rows.append(prediction_features(region, medicine, season))
+                for name, positives in labels.items():
+                    y[name].append(int((region, medicine, season) in positives))
+    return pd.DataFrame(rows, columns=MODEL_FEATURES), {name: np.array(v) for name, v in y.items()}, observations
+
+def retrain_models():
+    """Refit each model on current data and publish it if it holds up on a holdout split"""
+    X, targets, observations = build_training_set()
+    snapshot = active_models.get()
+    holdout = np.random.default_rng(0).permutation(len(X))
+    split = int(len(X) * (1 - MODEL_REGISTRY_CONFIG['holdout_fraction']))
+    train_idx, test_idx = holdout[:split], holdout[split:]
+
+    summary = {}
+    for name, y in targets.items():
+        positives = int(y.sum())
+        # X is the full feature grid; only the reports and alerts behind the labels are real data
+        if observations[name] < MODEL_REGISTRY_CONFIG['min_samples'] or positives == 0 or positives == len(y):
+            summary[name] = {'published': False, 'reason': 'not enough labelled data',
+                             'observations': observations[name], 'positives': positives}
+            continue
+
+        live = snapshot[1][name] if snapshot else None
+        candidate = clone(live) if live is not None else DecisionTreeClassifier(max_depth=6)
+        candidate.fit(X.iloc[train_idx], y[train_idx])
+        if not validate_model(candidate):
+            summary[name] = {'published': False, 'reason': 'validation failed'}
+            continue
+
+        X_test, y_test = X.iloc[test_idx], y[test_idx]
+        score = float((candidate.predict(X_test) == y_test).mean())
+        live_score = float((live.predict(X_test) == y_test).mean()) if live is not None else 0.0
+        if score < live_score - MODEL_REGISTRY_CONFIG['max_score_drop']:
+            summary[name] = {'published': False, 'reason': 'worse than live model',
+                             'score': score, 'live_score': live_score}
+            continue
+
+        candidate.fit(X, y)
+        version = model_registry.publish(name, candidate, {
+            'samples': len(X), 'observations': observations[name], 'positives': positives, 'holdout_accuracy': score, 'live_holdout_accuracy': live_score
+        })
+        summary[name] = {'published': True, 'version': version, 'score': score, 'live_score': live_score}
+
+    active_models.refresh()
+    logger.info(f"Model retraining: {summary}")
+    return summary
+
+def _model_retrain_worker():
+    while True:
+        time.sleep(MODEL_REGISTRY_CONFIG['retrain_interval'])
+        try:
+            retrain_models()
+        except Exception as e:
+            logger.error(f"Model retraining error: {e}")
+
+def start_model_retrainer():
+    thread = threading.Thread(target=_model_retrain_worker, name='model-retrainer', daemon=True)
+    thread.start()
+    return thread
+
+@app.route('/predict_medicine', methods=['GET', 'POST'])
+def predict_medicine():
+    if request.method == 'POST':
+        region = request.form.get('region')
+        medicine = request.form.get('medicine')
+        season = request.form.get('season')
+
+        # Validate inputs
+        if region not in region_map or medicine not in medicine_map or season not in season_map:
+            flash("Invalid input", "error")
+            return render_template('predict_medicine.html')
+
+        X = pd.DataFrame([prediction_features(region, medicine, season)], columns=MODEL_FEATURES)
+
+        snapshot = active_models.get()
+        if snapshot is None:
+            flash("Prediction models are not available", "error")
+            return render_template('predict_medicine.html')
+        versions, models = snapshot
+        with timed('model', 'shortage.predict'):
+            shortage_pred = models['shortage'].predict(X)[0]
+        with timed('model', 'price_spike.predict'):
+            price_spike_pred = models['price_spike'].predict(X)[0]
+
+        result = {
+            'region': region,
+            'medicine': medicine,
+            'season': season,
+            'shortage': int(shortage_pred),
+            'price_spike': int(price_spike_pred)
+        }
+        return render_template('predict_medicine.html', result=result)
+
+    # GET request
+    return render_template('predict_medicine.html')
+
+# Prescription uploads: stored by content hash, post-processed in the background
+UPLOAD_CONFIG = {
+    'chunk_size': 64 * 1024,
+    'allowed_types': {  # extension -> (content type, magic bytes)
+        'jpg': ('image/jpeg', b'\xff\xd8\xff'),
+        'jpeg': ('image/jpeg', b'\xff\xd8\xff'),
+        'png': ('image/png', b'\x89PNG'),
+        'pdf': ('application/pdf', b'%PDF')
+    },
+    'max_dimension': 2000,   # longer image side after downscaling
+    'jpeg_quality': 85,
+    'thumbnail_size': 256
+}
+
+class UploadRejected(ValueError):
+    pass
+
+def ensure_upload_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS prescription_uploads (
+            sha256 CHAR(64) PRIMARY KEY,
+            path VARCHAR(300) NOT NULL,
+            content_type VARCHAR(50) NOT NULL,
+            original_size INTEGER NOT NULL,
+            stored_size INTEGER,
+            web_path VARCHAR(300),
+            thumbnail_path VARCHAR(300),
+            status VARCHAR(20) DEFAULT 'pending' CHECK (status IN ('pending', 'processed', 'failed')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(prescription_uploads)')}
+    if 'web_path' not in columns:
+        conn.execute('ALTER TABLE prescription_uploads ADD COLUMN web_path VARCHAR(300)')
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(patient_reports)')}
+    if 'prescription_sha256' not in columns:
+        conn.execute('ALTER TABLE patient_reports ADD COLUMN prescription_sha256 CHAR(64)')
+    conn.commit()
+
+_upload_schema_lock = threading.Lock()
+_upload_schema_ready = False
+
+def ensure_upload_schema_once():
+    global _upload_schema_ready
+    if _upload_schema_ready:
+        return
+    with _upload_schema_lock:
+        if not _upload_schema_ready:
+            conn = get_db_connection()
+            try:
+                ensure_upload_schema(conn)
+            finally:
+                conn.close()
+            _upload_schema_ready = True
+
+def upload_path(digest, suffix):
+    # Two-level fan-out keeps directories small
+    return os.path.join(app.config['UPLOAD_FOLDER'], digest[:2], f'{digest}{suffix}')
+
+def store_prescription(file_storage):
+    """Copy an uploaded file into the store in chunks while hashing it; identical content is stored once.
+
+    Werkzeug has already spooled the request body (to a temporary file once it is
+    large), so this bounds memory for the copy, not for receiving the upload.
+    Returns the sha256 hex digest. Raises UploadRejected for unsupported or oversized files.
+    """
+    extension = file_storage.filename.rsplit('.', 1)[-1].lower() if '.' in file_storage.filename else ''
+    if extension not in UPLOAD_CONFIG['allowed_types']:
+        raise UploadRejected('Only JPG, PNG and PDF prescriptions are accepted')
+    content_type, magic = UPLOAD_CONFIG['allowed_types'][extension]
+    max_size = app.config['MAX_CONTENT_LENGTH']
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=app.config['UPLOAD_FOLDER'], suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = file_storage.stream.read(UPLOAD_CONFIG['chunk_size'])
+                if not chunk:
+                    break
+                if size == 0 and not chunk.startswith(magic):
+                    raise UploadRejected('File content does not match its extension')
+                size += len(chunk)
+                if max_size and size > max_size:
+                    raise UploadRejected('Prescription file is too large')
+                digest.update(chunk)
+                out.write(chunk)
+        if size == 0:
+            raise UploadRejected('Prescription file is empty')
+
+        sha256 = digest.hexdigest()
+        suffix = '.jpg' if content_type == 'image/jpeg' else f'.{extension}'
+        final_path = upload_path(sha256, suffix)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    ensure_upload_schema_once()
+    created = execute_insert('''
+        INSERT OR IGNORE INTO prescription_uploads (sha256, path, content_type, original_size)
+        VALUES (?, ?, ?, ?)
+    ''', (sha256, final_path, content_type, size))
+    if created and content_type.startswith('image/'):
+        upload_processor.submit(sha256)
+    return sha256
+
+class UploadProcessor:
+    """Background worker that writes a downscaled/recompressed copy and a thumbnail.
+
+    The original upload is never modified; derived files sit next to it as
+    <sha256>.web.<ext> and <sha256>.thumb.jpg.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def submit(self, sha256):
+        self._queue.put(sha256)
+
+    def process(self, sha256):
+        rows = execute_query('SELECT * FROM prescription_uploads WHERE sha256 = ?', (sha256,))
+        if not rows or rows[0]['status'] != 'pending':
+            return
+        upload = rows[0]
+        path = upload['path']
+        try:
+            with Image.open(path) as img:
+                img.load()
+                image_format = img.format
+                if image_format == 'JPEG' or img.mode not in ('RGB', 'RGBA', 'L', 'P'):
+                    img = img.convert('RGB')
+
+                resized = img.copy()
+                resized.thumbnail((UPLOAD_CONFIG['max_dimension'], UPLOAD_CONFIG['max_dimension']))
+                web_path = upload_path(sha256, '.web.jpg' if image_format == 'JPEG' else '.web.png')
+                tmp_path = f'{web_path}.{os.getpid()}.tmp'
+                if image_format == 'JPEG':
+                    resized.save(tmp_path, 'JPEG', quality=UPLOAD_CONFIG['jpeg_quality'], optimize=True, progressive=True)
+                else:
+                    resized.save(tmp_path, 'PNG', optimize=True)
+                # No web copy when recompression did not help; the original is served as is
+                if os.path.getsize(tmp_path) < upload['original_size'] or resized.size != img.size:
+                    os.replace(tmp_path, web_path)
+                else:
+                    os.remove(tmp_path)
+                    web_path = None
+
+                thumbnail = img.convert('RGB')
+                thumbnail.thumbnail((UPLOAD_CONFIG['thumbnail_size'], UPLOAD_CONFIG['thumbnail_size']))
+                thumbnail_path = upload_path(sha256, '.thumb.jpg')
+                thumbnail.save(thumbnail_path, 'JPEG', quality=UPLOAD_CONFIG['jpeg_quality'])
+
+            execute_query('''
+                UPDATE prescription_uploads
+                SET status = 'processed', stored_size = ?, web_path = ?, thumbnail_path = ?
+                WHERE sha256 = ?
+            ''', (os.path.getsize(web_path or path), web_path, thumbnail_path, sha256))
+        except Exception as e:
+            logger.error(f"Prescription processing failed for {sha256}: {e}")
+            execute_query("UPDATE prescription_uploads SET status = 'failed' WHERE sha256 = ?", (sha256,))
+
+    def _run(self):
+        while True:
+            sha256 = self._queue.get()
+            try:
+                self.process(sha256)
+            except Exception as e:
+                logger.error(f"Upload processor error: {e}")
+
+    def start(self):
+        if self._thread is None:
+            # Pick up anything left pending by a previous process
+            ensure_upload_schema_once()
+            for row in execute_query(
+                    "SELECT sha256 FROM prescription_uploads WHERE status = 'pending' AND content_type LIKE 'image/%'") or []:
+                self.submit(row['sha256'])
+            self._thread = threading.Thread(target=self._run, name='upload-processor', daemon=True)
+            self._thread.start()
+        return self._thread
+
+upload_processor = UploadProcessor()
+
+def start_upload_processor():
+    try:
+        return upload_processor.start()
+    except Exception as e:
+        logger.error(f"Upload processor disabled: {e}")
+        return None
+
+@app.route('/report-medicine', methods=['GET', 'POST'])
+@login_required
+@role_required(['patient'])
+def report_medicine():
+    """Page for patients to report medicine issues"""
+    if request.method == 'POST':
+        medicine_id = request.form.get('medicine_id')
+        location_id = request.form.get('location_id')
+        report_type = request.form.get('report_type')
+        pharmacy_id = request.form.get('pharmacy_id') or None
+        reported_price = request.form.get('reported_price')
+        expected_price = request.form.get('expected_price')
+        description = request.form.get('description')
+        
+        try:
+            medicine = reference_data.lookup('medicines', int(medicine_id))
+            location = reference_data.lookup('locations', int(location_id))
+        except (TypeError, ValueError):
+            medicine = location = None
+        if medicine is None or location is None:
+            flash('Please choose a valid medicine and location', 'error')
+            return redirect(url_for('report_medicine'))
+        
+        # Handle prescription upload
+        ensure_upload_schema_once()
+        prescription_file = request.files.get('prescription')
+        prescription_sha256 = None
+        if prescription_file and prescription_file.filename:
+            try:
+                prescription_sha256 = store_prescription(prescription_file)
+            except UploadRejected as e:
+                flash(str(e), 'error')
+                return redirect(url_for('report_medicine'))
+        
+        # Insert into database
+        report_id = execute_insert('''
+            INSERT INTO patient_reports (user_id, medicine_id, location_id, report_type, 
+                                       pharmacy_id, reported_price, expected_price, description,
+                                       prescription_sha256)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (session['user_id'], medicine_id, location_id, report_type, 
+              pharmacy_id, reported_price, expected_price, description, prescription_sha256))
+        
+        if report_id:
+            data_versions.bump('reports')
+            # Record shortage report to blockchain
+            if report_type == 'shortage':
+                blockchain_tx = record_to_blockchain('shortage_report', {
+                    'medicine_name': medicine['name'],
+                    'location_name': location['name']
+                })
+                
+                if blockchain_tx:
+                    # Update the report with blockchain transaction hash
+                    execute_query('''
+                        UPDATE patient_reports 
+                        SET blockchain_hash = ? 
+                        WHERE id = ?
+                    ''', (blockchain_tx, report_id))
+            
+            flash('Report submitted successfully!', 'success')
+            check_and_create_alerts(medicine_id, location_id)
+            return redirect(url_for('patient_dashboard'))
+        else:
+            flash('Failed to submit report', 'error')
+    
+    # Get data for form; medicines are looked up through the typeahead
+    locations = reference_data.rows('locations')
+    pharmacies = reference_data.rows('pharmacies')
+    
+    return render_template('report_medicine.html', 
+                         locations=locations,
+                         pharmacies=pharmacies)
+
+
+@app.route('/inventory/manage')
+@login_required
+@role_required(['pharmacy'])
+def manage_inventory():
+    """Inventory management page for pharmacies"""
+    user_id = session.get('user_id')
+    
+    # Debug: Print user_id
+    print(f"Debug - User ID: {user_id}")
+    
+    pharmacy_result = execute_query('SELECT * FROM pharmacies WHERE user_id = ?', (user_id,))
+    
+    # Debug: Print pharmacy result
+    print(f"Debug - Pharmacy result: {pharmacy_result}")
+   
+    if not pharmacy_result:
+        flash('Pharmacy profile not found. Please complete your profile first.', 'warning')
+        return redirect(url_for('pharmacy_profile'))
+   
+    pharmacy = pharmacy_result[0]
+    
+    # Check if pharmacy profile is complete (add required fields check)
+    required_fields = ['pharmacy_name', 'address', 'phone', 'email', 'license_number']
+    missing_fields = [field for field in required_fields if not pharmacy.get(field)]
+    
+    if missing_fields:
+        flash(f'Please complete your pharmacy profile. Missing: {", ".join(missing_fields)}', 'warning')
+        return redirect(url_for('pharmacy_profile'))
+   
+    # Get current inventory
+    inventory = execute_query('''
+        SELECT pi.*, m.name as medicine_name, m.generic_name, m.brand_name
+        FROM pharmacy_inventory pi
+        JOIN medicines m ON pi.medicine_id = m.id
+        WHERE pi.pharmacy_id = ?
+        ORDER BY m.name
+    ''', (pharmacy['id'],))
+   
+    return render_template('manage_inventory.html',
+                         inventory=inventory or [],
+                         pharmacy=pharmacy)
+
+# Stock movements: inventory changes are recorded as deltas and pharmacy_inventory.current_stock
+# is their running balance, updated in the same transaction
+STOCK_MOVEMENT_CONFIG = {
+    'max_events': 5000,   # events per POS batch request
+    'max_group': 50000,   # events applied per commit across queued requests
+    'timeout': 30         # seconds a request waits for its batch to commit
+}
+# Sign applied to the event quantity; adjustments carry their own sign (or an absolute count)
+STOCK_MOVEMENT_TYPES = {'sale': -1, 'expiry': -1, 'restock': 1, 'adjustment': 1}
+
+STOCK_MOVEMENTS_TABLE = '''
+    CREATE TABLE {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        pharmacy_id INTEGER NOT NULL,
+        client_event_id VARCHAR(100) NOT NULL,
+        part INTEGER NOT NULL DEFAULT 0,
+        inventory_id INTEGER NOT NULL,
+        medicine_id INTEGER NOT NULL,
+        movement_type VARCHAR(20) NOT NULL CHECK (movement_type IN ('sale', 'restock', 'adjustment', 'expiry')),
+        quantity INTEGER NOT NULL,
+        balance_after INTEGER NOT NULL,
+        occurred_at TIMESTAMP,
+        recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (pharmacy_id) REFERENCES pharmacies(id),
+        FOREIGN KEY (inventory_id) REFERENCES pharmacy_inventory(id),
+        FOREIGN KEY (medicine_id) REFERENCES medicines(id),
+        UNIQUE(pharmacy_id, client_event_id, part)
+    )
+'''
+
+def ensure_stock_movement_schema(conn):
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(stock_movements)')}
+    if not columns:
+        conn.execute(STOCK_MOVEMENTS_TABLE.format(name='stock_movements'))
+    elif 'part' not in columns:
+        # One event can now span several batches (part 0, 1, ...); the unique key has to include the part
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute(STOCK_MOVEMENTS_TABLE.format(name='stock_movements_new'))
+        conn.execute('''
+            INSERT INTO stock_movements_new (id, pharmacy_id, client_event_id, inventory_id, medicine_id, movement_type,
+                                             quantity, balance_after, occurred_at, recorded_at)
+            SELECT id, pharmacy_id, client_event_id, inventory_id, medicine_id, movement_type,
+                   quantity, balance_after, occurred_at, recorded_at
+            FROM stock_movements
+        ''')
+        conn.execute('DROP TABLE stock_movements')
+        conn.execute('ALTER TABLE stock_movements_new RENAME TO stock_movements')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_stock_movements_inventory ON stock_movements(inventory_id, id)')
+    conn.commit()
+    ensure_price_history_schema(conn)
+
+_stock_movement_schema_lock = threading.Lock()
+_stock_movement_schema_ready = False
+
+def ensure_stock_movement_schema_once():
+    global _stock_movement_schema_ready
+    if _stock_movement_schema_ready:
+        return
+    with _stock_movement_schema_lock:
+        if not _stock_movement_schema_ready:
+            conn = get_db_connection()
+            try:
+                ensure_stock_movement_schema(conn)
+            finally:
+                conn.close()
+            _stock_movement_schema_ready = True
+
+def _strict_int(value):
+    """int() for JSON input that refuses bools and fractional numbers instead of truncating them"""
+    if isinstance(value, bool):
+        raise TypeError('bool is not an integer')
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(f'{value} is not an integer')
+        return int(value)
+    if isinstance(value, str) and not re.fullmatch(r'\s*[+-]?\d+\s*', value):
+        raise ValueError(f'{value!r} is not an integer')
+    return int(value)
+
+def parse_stock_movement(event):
+    """Validate one POS event; returns (movement, None) or (None, error message)"""
+    if not isinstance(event, dict):
+        return None, 'event must be an object'
+    event_id = str(event.get('event_id') or '').strip()
+    if not event_id or len(event_id) > 100:
+        return None, 'event_id is required (at most 100 characters)'
+    movement_type = event.get('type')
+    if movement_type not in STOCK_MOVEMENT_TYPES:
+        return None, f"type must be one of {', '.join(STOCK_MOVEMENT_TYPES)}"
+    try:
+        medicine_id = _strict_int(event['medicine_id'])
+    except (KeyError, TypeError, ValueError):
+        return None, 'medicine_id must be an integer'
+    try:
+        if movement_type == 'adjustment' and event.get('counted') is not None:
+            delta, counted = None, _strict_int(event['counted'])
+            if counted < 0:
+                return None, 'counted cannot be negative'
+        else:
+            quantity, counted = _strict_int(event['quantity']), None
+            if movement_type != 'adjustment' and quantity <= 0:
+                return None, 'quantity must be positive'
+            delta = STOCK_MOVEMENT_TYPES[movement_type] * quantity
+    except (KeyError, TypeError, ValueError):
+        return None, 'quantity must be an integer (or counted, for adjustments)'
+    try:
+        unit_price = float(event['unit_price']) if event.get('unit_price') is not None else None
+        mrp = float(event['mrp']) if event.get('mrp') is not None else None
+    except (TypeError, ValueError):
+        return None, 'unit_price and mrp must be numbers'
+    return {
+        'event_id': event_id,
+        'type': movement_type,
+        'medicine_id': medicine_id,
+        'batch_number': event.get('batch_number'),
+        'delta': delta,
+        'counted': counted,
+        'unit_price': unit_price,
+        'mrp': mrp,
+        'expiry_date': event.get('expiry_date'),
+        'occurred_at': event.get('occurred_at')
+    }, None
+
+def _inventory_candidates(conn, cache, balances, pharmacy_id, movement):
+    """Inventory row ids a movement can apply to; without a batch number, earliest expiry first"""
+    key = (pharmacy_id, movement['medicine_id'], movement['batch_number'])
+    if key not in cache:
+        if movement['batch_number'] is None:
+            rows = conn.execute('''
+                SELECT id, current_stock FROM pharmacy_inventory
+                WHERE pharmacy_id = ? AND medicine_id = ?
+                ORDER BY expiry_date IS NULL, expiry_date, id
+            ''', key[:2]).fetchall()
+        else:
+            rows = conn.execute('''
+                SELECT id, current_stock FROM pharmacy_inventory
+                WHERE pharmacy_id = ? AND medicine_id = ? AND batch_number = ?
+            ''', key).fetchall()
+        for row in rows:
+            balances.setdefault(row['id'], [row['current_stock'], False])
+        cache[key] = [row['id'] for row in rows]
+    return cache[key]
+
+def apply_stock_movements(conn, group):
+    """Apply queued batches inside the caller's transaction and fill in each batch's results.
+
+    Returns {inventory_id: (medicine_id, location_id)} for every balance that changed.
+    """
+    cache = {}
+    balances = {}   # inventory id -> [balance, restocked]
+    known_medicines = {}
+    # pharmacy id -> {event id: balance}; shared by every batch in the group, so a retry queued
+    # behind its original request is answered as a duplicate instead of applied twice
+    seen_by_pharmacy = {}
+    rows = []
+    touched = {}
+
+    def medicine_known(medicine_id):
+        if medicine_id not in known_medicines:
+            known_medicines[medicine_id] = conn.execute(
+                'SELECT 1 FROM medicines WHERE id = ?', (medicine_id,)).fetchone() is not None
+        return known_medicines[medicine_id]
+
+    for batch in group:
+        pharmacy = batch['pharmacy']
+        seen = seen_by_pharmacy.setdefault(pharmacy['id'], {})
+        event_ids = list({movement['event_id'] for movement in batch['events']} - seen.keys())
+        for start in range(0, len(event_ids), 500):
+            chunk = event_ids[start:start + 500]
+            # An event split across batches reports the balance of its last part
+            seen.update(conn.execute(f'''
+                SELECT client_event_id, balance_after FROM stock_movements
+                WHERE pharmacy_id = ? AND client_event_id IN ({','.join('?' * len(chunk))})
+                ORDER BY part
+            ''', [pharmacy['id']] + chunk).fetchall())
+
+        results = []
+        for movement in batch['events']:
+            event_id = movement['event_id']
+            if event_id in seen:
+                results.append({'event_id': event_id, 'status': 'duplicate', 'balance': seen[event_id]})
+                continue
+            details = movement.get('details')
+            if details is not None:
+                # Inventory form edit: item details and the counted stock commit together
+                if not medicine_known(movement['medicine_id']):
+                    results.append({'event_id': event_id, 'status': 'rejected',
+                                    'error': f"Unknown medicine_id {movement['medicine_id']}"})
+                    continue
+                conn.execute('''
+                    INSERT INTO pharmacy_inventory (pharmacy_id, medicine_id, current_stock, unit_price,
+                                                    mrp, batch_number, expiry_date, minimum_stock_level)
+                    VALUES (?, ?, 0, ?, ?, ?, ?, ?)
+                    ON CONFLICT(pharmacy_id, medicine_id, batch_number) DO UPDATE
+                    SET unit_price = excluded.unit_price, mrp = excluded.mrp, expiry_date = excluded.expiry_date,
+                        minimum_stock_level = excluded.minimum_stock_level, updated_at = CURRENT_TIMESTAMP
+                ''', (pharmacy['id'], movement['medicine_id'], details['unit_price'], details['mrp'],
+                      movement['batch_number'], details['expiry_date'], details['minimum_stock_level']))
+                # The upsert may have added a row; balances already loaded are kept by setdefault
+                cache.pop((pharmacy['id'], movement['medicine_id'], movement['batch_number']), None)
+                cache.pop((pharmacy['id'], movement['medicine_id'], None), None)
+            candidates = _inventory_candidates(conn, cache, balances, pharmacy['id'], movement)
+            if not candidates:
+                if movement['type'] != 'restock' or movement['unit_price'] is None:
+                    results.append({'event_id': event_id, 'status': 'rejected',
+                                    'error': 'No inventory item for this medicine and batch; restock it with a unit_price first'})
+                    continue
+                if not medicine_known(movement['medicine_id']):
+                    results.append({'event_id': event_id, 'status': 'rejected',
+                                    'error': f"Unknown medicine_id {movement['medicine_id']}"})
+                    continue
+                inventory_id = conn.execute('''
+                    INSERT INTO pharmacy_inventory (pharmacy_id, medicine_id, current_stock, unit_price, mrp,
+                                                    batch_number, expiry_date)
+                    VALUES (?, ?, 0, ?, ?, ?, ?)
+                ''', (pharmacy['id'], movement['medicine_id'], movement['unit_price'], movement['mrp'],
+                      movement['batch_number'], movement['expiry_date'])).lastrowid
+                balances[inventory_id] = [0, False]
+                candidates.append(inventory_id)
+                if (pharmacy['id'], movement['medicine_id'], None) in cache and movement['batch_number'] is not None:
+                    cache[(pharmacy['id'], movement['medicine_id'], None)].append(inventory_id)
+
+            if movement['counted'] is not None:
+                parts = [(candidates[0], movement['counted'] - balances[candidates[0]][0])]
+            elif movement['delta'] >= 0:
+                parts = [(candidates[0], movement['delta'])]
+            else:
+                # Draw down batches in candidate order (earliest expiry first), spilling into the next one
+                on_hand = sum(balances[c][0] for c in candidates)
+                if on_hand < -movement['delta']:
+                    results.append({'event_id': event_id, 'status': 'rejected',
+                                    'error': f'Insufficient stock ({on_hand} on hand)'})
+                    continue
+                parts, remaining = [], -movement['delta']
+                for candidate in candidates:
+                    taken = min(balances[candidate][0], remaining)
+                    if taken > 0:
+                        parts.append((candidate, -taken))
+                        remaining -= taken
+                    if not remaining:
+                        break
+            for part, (inventory_id, delta) in enumerate(parts):
+                balance = balances[inventory_id]
+                balance[0] += delta
+                balance[1] = balance[1] or movement['type'] == 'restock'
+                rows.append((pharmacy['id'], event_id, part, inventory_id, movement['medicine_id'], movement['type'],
+                             delta, balance[0], movement['occurred_at']))
+                touched[inventory_id] = (movement['medicine_id'], pharmacy['location_id'])
+            seen[event_id] = balance[0]
+            results.append({'event_id': event_id, 'status': 'applied', 'balance': balance[0]})
+        batch['results'] = results
+
+    conn.executemany('''
+        INSERT INTO stock_movements (pharmacy_id, client_event_id, part, inventory_id, medicine_id, movement_type,
+                                     quantity, balance_after, occurred_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.executemany('''
+        UPDATE pharmacy_inventory
+        SET current_stock = ?, last_restocked_date = CASE WHEN ? THEN DATE('now') ELSE last_restocked_date END
+        WHERE id = ?
+    ''', [(balances[i][0], balances[i][1], i) for i in touched])
+    return touched
+
+class StockMovementWriter:
+    """Applies stock movement batches from concurrent requests in shared transactions (group commit).
+
+    A single writer thread per process takes every batch queued while the previous
+    commit was running and applies them together, so one fsync covers all of them.
+    """
+
+    def __init__(self, connect, max_group):
+        self.connect = connect
+        self.max_group = max_group
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_running(self):
+        # Started on first use, so each forked worker gets its own writer
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='stock-movements', daemon=True)
+                    self._thread.start()
+
+    def submit(self, pharmacy, movements, timeout):
+        """Queue parsed movements for one pharmacy and wait for their per-event results"""
+        self._ensure_running()
+        batch = {'pharmacy': pharmacy, 'events': movements, 'results': None, 'error': None,
+                 'done': threading.Event()}
+        self._queue.put(batch)
+        if not batch['done'].wait(timeout):
+            raise TimeoutError('Stock movement batch was not committed in time')
+        if batch['error'] is not None:
+            raise batch['error']
+        return batch['results']
+
+    def _run(self):
+        conn = self.connect()
+        while True:
+            group = [self._queue.get()]
+            size = len(group[0]['events'])
+            while size < self.max_group:
+                try:
+                    batch = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                group.append(batch)
+                size += len(batch['events'])
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                touched = apply_stock_movements(conn, group)
+                conn.execute('COMMIT')
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                logger.error(f"Stock movement commit failed: {e}")
+                for batch in group:
+                    batch['error'] = e
+                touched = {}
+            if touched:
+                data_versions.bump(*{inventory_version(batch['pharmacy']['user_id']) for batch in group})
+            for batch in group:
+                batch['done'].set()
+            if touched:
+                after_stock_movements(touched)
+
+def _stock_movement_connect():
+    # Autocommit mode; the writer issues BEGIN IMMEDIATE/COMMIT itself
+    conn = sqlite3.connect('healthcare.db', timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def after_stock_movements(touched):
+    """Refresh derived stock views once per commit rather than once per event"""
+    pairs = set(touched.values())
+    try:
+        refresh_availability(pairs)
+        for medicine_id, location_id in pairs:
+            if location_id is not None:
+                feature_store.refresh_stock(location_id, medicine_id)
+    except Exception as e:
+        logger.error(f"Stock movement refresh error: {e}")
+
+stock_movement_writer = StockMovementWriter(_stock_movement_connect, STOCK_MOVEMENT_CONFIG['max_group'])
+
+@app.route('/api/pos/stock-movements', methods=['POST'])
+@login_required
+@role_required(['pharmacy'])
+def ingest_stock_movements():
+    """POS batch: {"events": [{"event_id", "type", "medicine_id", "quantity" | "counted", "batch_number"?, ...}]}"""
+    payload = request.get_json(silent=True) or {}
+    events = payload.get('events')
+    if not isinstance(events, list) or not events:
+        return jsonify({'error': 'events must be a non-empty list'}), 400
+    if len(events) > STOCK_MOVEMENT_CONFIG['max_events']:
+        return jsonify({'error': f"At most {STOCK_MOVEMENT_CONFIG['max_events']} events per batch"}), 413
+    pharmacy = execute_query('SELECT id, location_id, user_id FROM pharmacies WHERE user_id = ?', (session.get('user_id'),))
+    if not pharmacy:
+        return jsonify({'error': 'Pharmacy profile not found'}), 404
+    ensure_stock_movement_schema_once()
+
+    results = [None] * len(events)
+    valid = []
+    for position, event in enumerate(events):
+        movement, error = parse_stock_movement(event)
+        if error:
+            event_id = event.get('event_id') if isinstance(event, dict) else None
+            results[position] = {'event_id': event_id, 'status': 'rejected', 'error': error}
+        else:
+            valid.append((position, movement))
+    if valid:
+        try:
+            applied = stock_movement_writer.submit(dict(pharmacy[0]), [movement for _, movement in valid],
+                                                   STOCK_MOVEMENT_CONFIG['timeout'])
+        except Exception as e:
+            logger.error(f"Stock movement batch failed: {e}")
+            return jsonify({'error': 'Stock movements not recorded; retry with the same event ids'}), 503
+        for (position, _), result in zip(valid, applied):
+            results[position] = result
+
+    summary = {status: sum(1 for r in results if r['status'] == status) for status in ('applied', 'duplicate', 'rejected')}
+    return jsonify({**summary, 'results': results})
+
+@app.route('/inventory/update', methods=['POST'])
+@login_required
+@role_required(['pharmacy'])
+def update_inventory():
+    """API endpoint to update pharmacy inventory"""
+    user_id = session.get('user_id')
+    pharmacy_result = execute_query('SELECT * FROM pharmacies WHERE user_id = ?', (user_id,))
+    
+    if not pharmacy_result:
+        flash('Pharmacy profile not found. Please complete your profile first.', 'error')
+        return redirect(url_for('pharmacy_profile'))
+    
+    pharmacy = pharmacy_result[0]
+    
+    medicine_id = request.form.get('medicine_id')
+    current_stock = request.form.get('current_stock')
+    unit_price = request.form.get('unit_price')
+    mrp = request.form.get('mrp')
+    batch_number = request.form.get('batch_number')
+    expiry_date = request.form.get('expiry_date')
+    minimum_stock_level = request.form.get('minimum_stock_level')
+    
+    # The form's stock figure becomes a counted adjustment; the writer upserts the item details
+    # and applies it in one transaction, then refreshes the derived stock views
+    movement, error = parse_stock_movement({
+        'event_id': f"web-{os.urandom(8).hex()}", 'type': 'adjustment', 'medicine_id': medicine_id,
+        'counted': current_stock, 'batch_number': batch_number
+    })
+    if error:
+        flash(f'Invalid inventory update: {error}', 'error')
+        return redirect(url_for('manage_inventory'))
+    movement['details'] = {'unit_price': unit_price, 'mrp': mrp, 'expiry_date': expiry_date,
+                           'minimum_stock_level': minimum_stock_level}
+    ensure_stock_movement_schema_once()
+    
+    try:
+        result = stock_movement_writer.submit({'id': pharmacy['id'], 'location_id': pharmacy['location_id'],
+                                               'user_id': user_id},
+                                              [movement], STOCK_MOVEMENT_CONFIG['timeout'])[0]
+    except Exception as e:
+        logger.error(f"Inventory update failed: {e}")
+        flash('Inventory could not be updated. Please try again.', 'error')
+        return redirect(url_for('manage_inventory'))
+    if result['status'] == 'rejected':
+        flash(f"Inventory was not updated: {result['error']}", 'error')
+        return redirect(url_for('manage_inventory'))
+    current_stock = result['balance']
+    
+    # Get medicine name for blockchain update with error handling
+    medicine_result = execute_query('SELECT name FROM medicines WHERE id = ?', (medicine_id,))
+    if not medicine_result:
+        flash('Medicine not found!', 'error')
+        return redirect(url_for('manage_inventory'))
+    
+    medicine_name = medicine_result[0]['name']
+    
+    # Update retailer stock on blockchain (new functionality)
+    blockchain_tx = update_retailer_stock_blockchain(medicine_name, int(current_stock))
+    
+    # Also record stock update to blockchain (existing functionality)
+    blockchain_tx2 = record_to_blockchain('stock_update', {
+        'pharmacy_name': pharmacy['pharmacy_name'],
+        'medicine_name': medicine_name,
+        'quantity': int(current_stock),
+        'price': int(float(unit_price) * 100)  # Convert to paise/cents
+    })
+    
+    if blockchain_tx or blockchain_tx2:
+        flash(f'Inventory updated successfully! Blockchain transactions recorded.', 'success')
+    else:
+        flash('Inventory updated successfully!', 'success')
+    
+    # Sync auto-orders after inventory update
+    sync_auto_orders()
+    
+    return redirect(url_for('manage_inventory'))
+@app.route('/manufacturer/orders')
+@login_required
+@role_required(['admin', 'pharmacy'])
+def manufacturer_orders():
+    """View manufacturer orders from blockchain"""
+    # Sync latest orders from blockchain
+    sync_auto_orders()
+    
+    # Get orders from database
+    orders = execute_query('''
+        SELECT mo.*, m.name as medicine_name
+        FROM manufacturer_orders mo
+        JOIN medicines m ON mo.medicine_id = m.id
+        ORDER BY mo.created_at DESC
+    ''')
+    
+    return render_template('manufacturer_orders.html', orders=orders)
+@app.route('/admin/reorder/run', methods=['POST'])
+@login_required
+@role_required(['admin'])
+def run_reorder():
+    """Trigger a reorder engine pass on demand"""
+    return jsonify(run_reorder_engine())
+
+@app.route('/admin/reorder/orders/<int:order_id>/review', methods=['POST'])
+@login_required
+@role_required(['admin'])
+def review_reorder(order_id):
+    """Resolve an order held for review: action=resend queues it again, action=cancel closes it"""
+    action = (request.get_json(silent=True) or request.form).get('action')
+    statuses = {'resend': 'queued', 'cancel': 'cancelled'}
+    if action not in statuses:
+        return jsonify({'error': 'action must be resend or cancel'}), 400
+    conn = get_db_connection()
+    try:
+        updated = conn.execute('''
+            UPDATE manufacturer_orders SET status = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'needs_review'
+        ''', (statuses[action], order_id)).rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    if not updated:
+        return jsonify({'error': 'No order awaiting review with that id'}), 404
+    data_versions.bump('orders')
+    return jsonify({'id': order_id, 'status': statuses[action]})
+
+@app.route('/admin/models/retrain', methods=['POST'])
+@login_required
+@role_required(['admin'])
+def retrain_models_now():
+    """Trigger a retraining pass on demand"""
+    return jsonify(retrain_models())
+
+@app.route('/admin/models')
+@login_required
+@role_required(['admin'])
+def model_versions():
+    """Registry manifest and the versions this worker is serving"""
+    snapshot = active_models.get()
+    return jsonify({'registry': model_registry.manifest(), 'serving': snapshot[0] if snapshot else {}})
+
+@app.route('/blockchain/data')
+@login_required
+def blockchain_data():
+    """View blockchain data dashboard"""
+    data = get_blockchain_data()
+    
+    # Format data for template
+    formatted_data = {
+        'enabled': data['enabled'],
+        'stats': {
+            'total_stocks': data.get('total_stocks', 0),
+            'total_shortages': data.get('total_shortages', 0),
+            'total_transactions': data.get('total_stocks', 0) + data.get('total_shortages', 0)
+        },
+        'recent_stocks': data.get('stocks', [])[-10:],  # Last 10
+        'recent_shortages': data.get('shortages', [])[-10:],  # Last 10
+        'stocks': data.get('stocks', []),
+        'shortages': data.get('shortages', [])
+    }
+    
+    return render_template('blockchain_dashboard.html', data=formatted_data)
+
+# Paginated ledger history: newest-first index cursors, filters served from a local index
+LEDGER_HISTORY_CONFIG = {
+    'default_limit': 20,
+    'max_limit': 100,           # bounds RPC calls per page
+    'sync_batch': 500,          # entries indexed per kind per sync pass
+    'sync_interval': 15
+}
+LEDGER_FILTERS = {'stocks': ('pharmacy', 'medicine'), 'shortages': ('medicine', 'location'), 'orders': ('medicine',)}
+
+def ensure_ledger_index_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_index (
+            kind VARCHAR(20) NOT NULL,
+            idx INTEGER NOT NULL,
+            pharmacy VARCHAR(200),
+            medicine VARCHAR(200),
+            location VARCHAR(200),
+            timestamp INTEGER,
+            PRIMARY KEY (kind, idx)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ledger_index_medicine ON ledger_index(kind, medicine, idx)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ledger_index_pharmacy ON ledger_index(kind, pharmacy, idx)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ledger_index_location ON ledger_index(kind, location, idx)')
+    conn.commit()
+
+def ledger_source():
+    # v2 migration keeps v1 indexes, so any EVM contract counts as the same source
+    return f"local:{os.path.abspath(local_ledger.path)}" if local_ledger_active() else 'evm'
+
+def ledger_index_current(kind, last, count):
+    """Whether the newest indexed entry of a kind is still on the chain unchanged"""
+    if last['idx'] >= count:
+        return False
+    try:
+        return ledger_entry(kind, last['idx']).get('timestamp') == last['timestamp']
+    except LookupError:
+        # v2 record whose event log is gone; other errors propagate so a flaky RPC never wipes the index
+        return False
+
+def sync_ledger_index():
+    """Index on-chain entries newer than the local high-water mark, a bounded batch per kind"""
+    if not ledger_available():
+        return 0
+    conn = get_db_connection()
+    try:
+        ensure_ledger_index_schema(conn)
+        source = ledger_source()
+        indexed_source = conn.execute(
+            "SELECT setting_value FROM system_settings WHERE setting_key = 'ledger_index_source'").fetchone()
+        if not indexed_source or indexed_source[0] != source:
+            # Indexes from another backend point at different records
+            conn.execute('DELETE FROM ledger_index')
+            conn.execute('''
+                INSERT INTO system_settings (setting_key, setting_value, description)
+                VALUES ('ledger_index_source', ?, 'Ledger backend the history index was built from')
+                ON CONFLICT(setting_key) DO UPDATE
+                SET setting_value = excluded.setting_value, updated_at = CURRENT_TIMESTAMP
+            ''', (source,))
+            conn.commit()
+        indexed = 0
+        for kind in LEDGER_KINDS:
+            last = conn.execute('SELECT idx, timestamp FROM ledger_index WHERE kind = ? ORDER BY idx DESC LIMIT 1',
+                                (kind,)).fetchone()
+            next_index = last['idx'] + 1 if last else 0
+            count = ledger_count(kind)
+            if last and not ledger_index_current(kind, last, count):
+                # The chain was reset (e.g. a redeployed dev chain): the indexed entries no longer exist
+                conn.execute('DELETE FROM ledger_index WHERE kind = ?', (kind,))
+                conn.commit()
+                next_index = 0
+            entries = ledger_entries(kind, range(next_index, min(count, next_index + LEDGER_HISTORY_CONFIG['sync_batch'])))
+            rows = [(kind, entry['index'], entry.get('pharmacy'), entry.get('medicine'),
+                     entry.get('location'), entry.get('timestamp')) for entry in entries]
+            conn.executemany('INSERT OR REPLACE INTO ledger_index VALUES (?, ?, ?, ?, ?, ?)', rows)
+            conn.commit()
+            indexed += len(rows)
+        return indexed
+    finally:
+        conn.close()
+
+_ledger_index_wakeup = threading.Event()
+
+def _ledger_index_worker():
+    while True:
+        try:
+            # Keep going without sleeping while there is a backlog
+            if sync_ledger_index():
+                continue
+        except Exception as e:
+            logger.error(f"Ledger index sync error: {e}")
+        _ledger_index_wakeup.wait(timeout=LEDGER_HISTORY_CONFIG['sync_interval'])
+        _ledger_index_wakeup.clear()
+
+_ledger_index_sync_lock = threading.Lock()
+
+def ledger_indexed_through(kind):
+    rows = execute_query('SELECT COALESCE(MAX(idx), -1) as last FROM ledger_index WHERE kind = ?', (kind,))
+    return rows[0]['last'] if rows else -1
+
+def catch_up_ledger_index(kind, count):
+    """Highest indexed entry of a kind, after one inline sync pass if the index is behind the chain"""
+    indexed_through = ledger_indexed_through(kind)
+    if indexed_through < count - 1:
+        # Concurrent requests wait for one pass instead of each indexing the same batch
+        with _ledger_index_sync_lock:
+            indexed_through = ledger_indexed_through(kind)
+            if indexed_through < count - 1:
+                sync_ledger_index()
+                indexed_through = ledger_indexed_through(kind)
+    return indexed_through
+
+def start_ledger_indexer():
+    thread = threading.Thread(target=_ledger_index_worker, name='ledger-indexer', daemon=True)
+    thread.start()
+    return thread
+
+@app.route('/api/ledger/<kind>')
+@login_required
+def ledger_history(kind):
+    """Newest-first ledger entries (?limit=, ?cursor=, ?pharmacy=, ?medicine=, ?location=)"""
+    if kind not in LEDGER_KINDS:
+        return jsonify({'error': f'Unknown ledger kind "{kind}"'}), 404
+    if not ledger_available():
+        return jsonify({'error': 'Blockchain not available'}), 503
+    try:
+        limit = max(1, min(int(request.args.get('limit', LEDGER_HISTORY_CONFIG['default_limit'])),
+                           LEDGER_HISTORY_CONFIG['max_limit']))
+        cursor = int(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError:
+        return jsonify({'error': 'limit and cursor must be integers'}), 400
+    filters = {name: request.args[name] for name in ('pharmacy', 'medicine', 'location') if request.args.get(name)}
+    unsupported = set(filters) - set(LEDGER_FILTERS[kind])
+    if unsupported:
+        return jsonify({'error': f"{kind} cannot be filtered by {', '.join(sorted(unsupported))}"}), 400
+    
+    try:
+        count = ledger_count(kind)
+        start = count - 1 if cursor is None else min(cursor, count - 1)
+        if filters:
+            indexed_through = catch_up_ledger_index(kind, count)
+            if indexed_through < count - 1:
+                # A partial index would silently drop matches; let the client retry once it has caught up
+                return jsonify({'error': 'Ledger index is catching up, retry shortly',
+                                'index_lag': count - 1 - indexed_through}), 503
+            conditions = ' AND '.join(f'{name} = ?' for name in filters)
+            params = [kind] + list(filters.values())
+            index_rows = execute_query(f'''
+                SELECT idx FROM ledger_index WHERE kind = ? AND {conditions} AND idx <= ?
+                ORDER BY idx DESC LIMIT ?
+            ''', params + [start, limit])
+            total_rows = execute_query(f'SELECT COUNT(*) as total FROM ledger_index WHERE kind = ? AND {conditions}', params)
+            if index_rows is None or total_rows is None:
+                return jsonify({'error': 'Ledger index not available yet'}), 503
+            indices = [row['idx'] for row in index_rows]
+            total = total_rows[0]['total']
+        else:
+            indices = list(range(start, max(start - limit, -1), -1))
+            total = count
+            indexed_through = None
+        entries = ledger_entries(kind, indices)
+    except Exception as e:
+        logger.error(f"Ledger history error: {e}")
+        return jsonify({'error': 'Ledger unavailable'}), 502
+    
+    next_cursor = indices[-1] - 1 if len(indices) == limit and indices[-1] > 0 else None
+    response = {'kind': kind, 'entries': entries, 'total': total, 'next_cursor': next_cursor}
+    if filters:
+        # Filtered pages are only served once the index covers every entry counted above
+        response['index_lag'] = max(count - 1 - indexed_through, 0)
+    return jsonify(response)
+
+@app.route('/admin/ledger/verify')
+@login_required
+@role_required(['admin'])
+def verify_local_ledger():
+    """Re-walk the local ledger's hash chain and compare it with the on-chain anchors"""
+    try:
+        anchors = ledger_anchors()
+    except Exception as e:
+        logger.warning(f"Could not load ledger anchors: {e}")
+        anchors = []
+    try:
+        result = local_ledger.verify(anchors)
+    except Exception as e:
+        logger.error(f"Local ledger verification error: {e}")
+        return jsonify({'ok': False, 'error': str(e)}), 500
+    return jsonify(result), 200 if result['ok'] else 409
+
+# Full-text medicine search (SQLite FTS5, external content kept in sync by triggers)
+MEDICINE_SEARCH_SCHEMA = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS medicines_fts USING fts5(
+        name, generic_name, brand_name, manufacturer,
+        content='medicines', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )''',
+    '''CREATE TRIGGER IF NOT EXISTS medicines_fts_insert AFTER INSERT ON medicines BEGIN
+        INSERT INTO medicines_fts(rowid, name, generic_name, brand_name, manufacturer)
+        VALUES (new.id, new.name, new.generic_name, new.brand_name, new.manufacturer);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS medicines_fts_delete AFTER DELETE ON medicines BEGIN
+        INSERT INTO medicines_fts(medicines_fts, rowid, name, generic_name, brand_name, manufacturer)
+        VALUES ('delete', old.id, old.name, old.generic_name, old.brand_name, old.manufacturer);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS medicines_fts_update AFTER UPDATE ON medicines BEGIN
+        INSERT INTO medicines_fts(medicines_fts, rowid, name, generic_name, brand_name, manufacturer)
+        VALUES ('delete', old.id, old.name, old.generic_name, old.brand_name, old.manufacturer);
+        INSERT INTO medicines_fts(rowid, name, generic_name, brand_name, manufacturer)
+        VALUES (new.id, new.name, new.generic_name, new.brand_name, new.manufacturer);
+    END'''
+]
+TYPEAHEAD_CONFIG = {
+    'default_limit': 10,
+    'max_limit': 50
+}
+
+def ensure_medicine_search_schema(conn):
+    for statement in MEDICINE_SEARCH_SCHEMA:
+        conn.execute(statement)
+    # Index rows written before the triggers existed, or while they were missing (bulk loads, restores).
+    # medicines_fts reads through to medicines, so its docsize shadow table is what counts indexed rows.
+    indexed = conn.execute('SELECT COUNT(*) FROM medicines_fts_docsize').fetchone()[0]
+    if indexed != conn.execute('SELECT COUNT(*) FROM medicines').fetchone()[0]:
+        conn.execute("INSERT INTO medicines_fts(medicines_fts) VALUES ('rebuild')")
+    conn.commit()
+
+_medicine_search_ready = False
+
+def ensure_medicine_search_once():
+    global _medicine_search_ready
+    if not _medicine_search_ready:
+        conn = get_db_connection()
+        try:
+            ensure_medicine_search_schema(conn)
+        finally:
+            conn.close()
+        _medicine_search_ready = True
+
+def fts_prefix_query(text):
+    """Turn free text into an FTS5 query: every word must match as a prefix"""
+    terms = re.findall(r'\w+', text.lower())
+    return ' '.join(f'"{term}"*' for term in terms[:8])
+
+def search_medicines(text, limit):
+    match = fts_prefix_query(text)
+    if not match:
+        return []
+    ensure_medicine_search_once()
+    # Name hits rank above generic/brand hits, manufacturer hits last
+    return execute_query('''
+        SELECT m.id, m.name, m.generic_name, m.brand_name, m.strength, m.dosage_form, m.manufacturer
+        FROM medicines_fts
+        JOIN medicines m ON m.id = medicines_fts.rowid
+        WHERE medicines_fts MATCH ?
+        ORDER BY bm25(medicines_fts, 10.0, 5.0, 5.0, 1.0)
+        LIMIT ?
+    ''', (match, limit)) or []
+
+def medicine_label(medicine):
+    label = medicine['name']
+    if medicine['generic_name']:
+        label += f" - {medicine['generic_name']}"
+    if medicine['strength']:
+        label += f" ({medicine['strength']})"
+    return label
+
+@app.route('/api/medicines/typeahead')
+def medicine_typeahead():
+    """Ranked medicine matches for the dropdown typeahead"""
+    text = request.args.get('q', '').strip()
+    try:
+        limit = min(int(request.args.get('limit', TYPEAHEAD_CONFIG['default_limit'])), TYPEAHEAD_CONFIG['max_limit'])
+    except ValueError:
+        limit = TYPEAHEAD_CONFIG['default_limit']
+    
+    results = [dict(row, label=medicine_label(row)) for row in search_medicines(text, max(limit, 1))]
+    return jsonify(results)
+
+@app.route('/api/blockchain/stats')
+@login_required
+def blockchain_stats():
+    """API endpoint for blockchain statistics"""
+    data = get_blockchain_data()
+    return jsonify(data)
+
+# Per-(medicine, location) availability summary, refreshed for the pairs each inventory write touches
+def ensure_availability_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS medicine_availability (
+            medicine_id INTEGER NOT NULL,
+            location_id INTEGER NOT NULL,
+            total_stock INTEGER NOT NULL DEFAULT 0,
+            pharmacy_count INTEGER NOT NULL DEFAULT 0,
+            min_price DECIMAL(10, 2),
+            median_price DECIMAL(10, 2),
+            nearest_expiry DATE,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (medicine_id, location_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_medicine_availability_location
+        ON medicine_availability(location_id, medicine_id)
+    ''')
+    conn.commit()
+    summary_empty = conn.execute('SELECT 1 FROM medicine_availability LIMIT 1').fetchone() is None
+    inventory_empty = conn.execute('SELECT 1 FROM pharmacy_inventory LIMIT 1').fetchone() is None
+    if summary_empty and not inventory_empty:
+        rebuild_availability(conn)
+
+AVAILABILITY_SOURCE_QUERY = '''
+    SELECT pi.medicine_id, p.location_id, pi.pharmacy_id, pi.current_stock, pi.unit_price, pi.expiry_date
+    FROM pharmacy_inventory pi
+    JOIN pharmacies p ON pi.pharmacy_id = p.id
+    WHERE pi.current_stock > 0 AND pi.is_available = TRUE AND p.location_id IS NOT NULL
+'''
+
+def _summarise_availability(medicine_id, location_id, rows):
+    prices = [float(row['unit_price']) for row in rows if row['unit_price'] is not None]
+    expiries = [row['expiry_date'] for row in rows if row['expiry_date']]
+    return (medicine_id, location_id,
+            sum(row['current_stock'] for row in rows),
+            len({row['pharmacy_id'] for row in rows}),
+            min(prices) if prices else None,
+            statistics.median(prices) if prices else None,
+            min(expiries) if expiries else None)
+
+AVAILABILITY_UPSERT = '''
+    INSERT OR REPLACE INTO medicine_availability
+        (medicine_id, location_id, total_stock, pharmacy_count, min_price, median_price, nearest_expiry, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+'''
+
+def rebuild_availability(conn):
+    """Recompute the whole summary in one pass over in-stock inventory"""
+    rows = conn.execute(AVAILABILITY_SOURCE_QUERY + ' ORDER BY pi.medicine_id, p.location_id').fetchall()
+    summaries = [_summarise_availability(medicine_id, location_id, list(group))
+                 for (medicine_id, location_id), group in groupby(rows, key=lambda r: (r['medicine_id'], r['location_id']))]
+    conn.execute('DELETE FROM medicine_availability')
+    conn.executemany(AVAILABILITY_UPSERT, summaries)
+    conn.commit()
+    return len(summaries)
+
+def refresh_availability(pairs):
+    """Recompute the summary rows for the given (medicine_id, location_id) pairs"""
+    pairs = {(int(medicine_id), int(location_id)) for medicine_id, location_id in pairs
+             if medicine_id is not None and location_id is not None}
+    if not pairs:
+        return
+    ensure_availability_once()
+    conn = get_db_connection()
+    try:
+        for medicine_id, location_id in pairs:
+            rows = conn.execute(AVAILABILITY_SOURCE_QUERY + ' AND pi.medicine_id = ? AND p.location_id = ?',
+                                (medicine_id, location_id)).fetchall()
+            if rows:
+                conn.execute(AVAILABILITY_UPSERT, _summarise_availability(medicine_id, location_id, rows))
+            else:
+                conn.execute('DELETE FROM medicine_availability WHERE medicine_id = ? AND location_id = ?',
+                             (medicine_id, location_id))
+        conn.commit()
+    except Exception as e:
+        logger.error(f"Availability refresh error: {e}")
+    finally:
+        conn.close()
+
+def refresh_pharmacy_availability(pharmacy_id, *location_ids):
+    """A pharmacy moved or changed: refresh all its medicines in the given locations"""
+    medicines = execute_query('SELECT DISTINCT medicine_id FROM pharmacy_inventory WHERE pharmacy_id = ?',
+                              (pharmacy_id,)) or []
+    refresh_availability((row['medicine_id'], location_id)
+                         for row in medicines for location_id in set(location_ids))
+
+_availability_ready = False
+
+def ensure_availability_once():
+    global _availability_ready
+    if not _availability_ready:
+        conn = get_db_connection()
+        try:
+            ensure_availability_schema(conn)
+        finally:
+            conn.close()
+        _availability_ready = True
+
+@app.route('/medicine-search')
+def medicine_search():
+    """Public page for searching medicine availability"""
+    locations = reference_data.rows('locations')
+    # Only the selected medicine is rendered; the rest come from the typeahead
+    selected_medicine = None
+    if request.args.get('medicine_id', '').isdigit():
+        selected_medicine = reference_data.by_id('medicines').get(int(request.args.get('medicine_id')))
+    
+    search_results = []
+    nearby_availability = []
+    debug_info = {}
+    
+    if request.args.get('medicine_id') and request.args.get('location_id'):
+        medicine_id = request.args.get('medicine_id')
+        location_id = request.args.get('location_id')
+        
+        # Pharmacies here straight from inventory, with the summary's filters; the summary can lag a write
+        search_results = execute_read('''
+            SELECT p.pharmacy_name, p.address, p.phone, pi.current_stock, 
+                   pi.unit_price, pi.mrp, pi.batch_number, pi.expiry_date,
+                   m.name as medicine_name, m.strength, m.dosage_form,
+                   l.name as location_name
+            FROM pharmacy_inventory pi
+            JOIN pharmacies p ON pi.pharmacy_id = p.id
+            JOIN medicines m ON pi.medicine_id = m.id
+            JOIN locations l ON p.location_id = l.id
+            WHERE pi.medicine_id = ? AND p.location_id = ? AND pi.current_stock > 0 AND pi.is_available = TRUE
+            ORDER BY pi.unit_price ASC
+        ''', (medicine_id, location_id)) or []
+        
+        if not search_results:
+            # Out of stock locally: availability for every district in one indexed read of the summary,
+            # districts under the same parent region first
+            ensure_availability_once()
+            availability = execute_read('''
+                SELECT ma.*, l.name as location_name, l.parent_id
+                FROM medicine_availability ma
+                JOIN locations l ON ma.location_id = l.id
+                WHERE ma.medicine_id = ?
+                ORDER BY ma.total_stock DESC
+            ''', (medicine_id,)) or []
+            selected_location = reference_data.by_id('locations').get(int(location_id)) if location_id.isdigit() else None
+            parent_id = selected_location['parent_id'] if selected_location else None
+            elsewhere = [row for row in availability if str(row['location_id']) != str(location_id)]
+            nearby_availability = sorted(elsewhere, key=lambda row: row['parent_id'] != parent_id)[:10]
+    
+    return render_template('medicine_search.html', 
+                         selected_medicine=selected_medicine, 
+                         locations=locations,
+                         search_results=search_results,
+                         nearby_availability=nearby_availability,
+                         debug_info=debug_info if app.debug else None)
+
+@app.route('/alerts')
+@login_required
+def view_alerts():
+    """View all active alerts"""
+    alerts = execute_query('''
+        SELECT sa.*, m.name as medicine_name, l.name as location_name
+        FROM shortage_alerts sa
+        JOIN medicines m ON sa.medicine_id = m.id
+        JOIN locations l ON sa.location_id = l.id
+        WHERE sa.is_active = TRUE
+        ORDER BY sa.severity DESC, sa.created_at DESC
+    ''')
+    
+    return render_template('alerts.html', alerts=alerts)
+
+@app.route('/analytics')
+@login_required
+@role_required(['admin', 'government', 'ngo'])
+def analytics():
+    """Analytics dashboard with charts and trends"""
+    # Get shortage trends
+    shortage_trends = execute_query('''
+        SELECT DATE(created_at) as date, COUNT(*) as count
+        FROM shortage_alerts
+        WHERE created_at >= DATE('now', '-30 days')
+        GROUP BY DATE(created_at)
+        ORDER BY date
+    ''')
+    
+    # Get top medicines with shortages
+    top_shortage_medicines = execute_query('''
+        SELECT m.name, COUNT(*) as shortage_count
+        FROM shortage_alerts sa
+        JOIN medicines m ON sa.medicine_id = m.id
+        WHERE sa.created_at >= DATE('now', '-30 days')
+        GROUP BY m.id, m.name
+        ORDER BY shortage_count DESC
+        LIMIT 10
+    ''')
+    
+    # Get location-wise shortage distribution
+    location_shortages = execute_query('''
+        SELECT l.name, COUNT(*) as shortage_count
+        FROM shortage_alerts sa
+        JOIN locations l ON sa.location_id = l.id
+        WHERE sa.created_at >= DATE('now', '-30 days')
+        GROUP BY l.id, l.name
+        ORDER BY shortage_count DESC
+    ''')
+    
+    # Get blockchain analytics
+    blockchain_data = get_blockchain_data()
+    
+    return render_template('analytics.html', 
+                         shortage_trends=shortage_trends,
+                         top_shortage_medicines=top_shortage_medicines,
+                         location_shortages=location_shortages,
+                         blockchain_data=blockchain_data)
+
+# Replace your existing profile route and add these routes to your app.py
+
+@app.route('/profile')
+@login_required
+def profile():
+    """User profile page"""
+    user_id = session.get('user_id')
+    user = execute_query('SELECT * FROM users WHERE id = ?', (user_id,))[0]
+    
+    # Redirect pharmacy users to their specific profile page
+    if user['user_type'] == 'pharmacy':
+        return redirect(url_for('pharmacy_profile'))
+    
+    return render_template('profile.html', user=user)
+
+# Remove the duplicate pharmacy_profile routes and replace with this single, complete implementation:
+
+@app.route('/pharmacy/profile', methods=['GET', 'POST'])
+@login_required
+@role_required(['pharmacy'])
+def pharmacy_profile():
+    """Pharmacy-specific profile page with pharmacy details"""
+    user_id = session.get('user_id')
+    
+    # Debug
+    print(f"Debug - User ID in pharmacy_profile: {user_id}")
+    
+    # Get user info with error handling
+    user_result = execute_query('SELECT * FROM users WHERE id = ?', (user_id,))
+    if not user_result:
+        flash('User not found!', 'error')
+        return redirect(url_for('login'))
+    
+    user = user_result[0]
+    
+    # Get pharmacy info
+    pharmacy_result = execute_query('SELECT * FROM pharmacies WHERE user_id = ?', (user_id,))
+    pharmacy = pharmacy_result[0] if pharmacy_result else None
+    
+    # Debug
+    print(f"Debug - Existing pharmacy: {pharmacy}")
+    
+    if request.method == 'POST':
+        # Handle pharmacy profile update
+        pharmacy_name = request.form.get('pharmacy_name')
+        address = request.form.get('address')
+        phone = request.form.get('phone')
+        email = request.form.get('email')
+        license_number = request.form.get('license_number')
+        location_id = request.form.get('location_id')
+        latitude = request.form.get('latitude') or None
+        longitude = request.form.get('longitude') or None
+        
+        # Debug
+        print(f"Debug - Form data: {pharmacy_name}, {address}, {phone}, {email}, {license_number}")
+        
+        try:
+            if pharmacy:
+                # Update existing pharmacy
+                execute_query('''
+                    UPDATE pharmacies 
+                    SET pharmacy_name = ?, address = ?, phone = ?, email = ?, 
+                        license_number = ?, location_id = ?, latitude = ?, longitude = ?
+                    WHERE user_id = ?
+                ''', (pharmacy_name, address, phone, email, license_number, 
+                      location_id, latitude, longitude, user_id))
+                print("Debug - Updated existing pharmacy")
+            else:
+                # Create new pharmacy profile
+                result = execute_insert('''
+                    INSERT INTO pharmacies (user_id, pharmacy_name, address, phone, email, 
+                                          license_number, location_id, latitude, longitude)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (user_id, pharmacy_name, address, phone, email, license_number, 
+                      location_id, latitude, longitude))
+                print(f"Debug - Created new pharmacy with ID: {result}")
+            
+            reference_data.bump('pharmacies')
+            if pharmacy and str(pharmacy['location_id']) != str(location_id):
+                refresh_pharmacy_availability(pharmacy['id'], pharmacy['location_id'], location_id)
+            if latitude is None or longitude is None:
+                request_geocode_backfill(pharmacy['id'] if pharmacy else None)
+            
+            # Verify the save worked
+            verify_result = execute_query('SELECT * FROM pharmacies WHERE user_id = ?', (user_id,))
+            print(f"Debug - Pharmacy after save: {verify_result}")
+            
+            flash('Pharmacy profile updated successfully!', 'success')
+            return redirect(url_for('pharmacy_profile'))
+            
+        except Exception as e:
+            print(f"Debug - Error saving pharmacy: {e}")
+            flash('Error updating pharmacy profile!', 'error')
+    
+    # Get locations for dropdown
+    locations = reference_data.rows('locations')
+    
+    return render_template('pharmacy_profile.html', user=user, pharmacy=pharmacy, locations=locations)
+@app.route('/profile/update', methods=['POST'])
+@login_required
+def update_profile():
+    """Handle profile updates for all user types"""
+    user_id = session.get('user_id')
+    user = execute_query('SELECT * FROM users WHERE id = ?', (user_id,))[0]
+    
+    if user['user_type'] == 'pharmacy':
+        # Handle pharmacy profile update
+        pharmacy_name = request.form.get('pharmacy_name')
+        address = request.form.get('address')
+        phone = request.form.get('phone')
+        email = request.form.get('email')
+        license_number = request.form.get('license_number')
+        location_id = request.form.get('location_id')
+        latitude = request.form.get('latitude') or None
+        longitude = request.form.get('longitude') or None
+        
+        # Check if pharmacy profile exists
+        existing_pharmacy = execute_query('SELECT id, location_id FROM pharmacies WHERE user_id = ?', (user_id,))
+        
+        if existing_pharmacy:
+            # Update existing pharmacy
+            execute_query('''
+                UPDATE pharmacies 
+                SET pharmacy_name = ?, address = ?, phone = ?, email = ?, 
+                    license_number = ?, location_id = ?, latitude = ?, longitude = ?
+                WHERE user_id = ?
+            ''', (pharmacy_name, address, phone, email, license_number, 
+                  location_id, latitude, longitude, user_id))
+        else:
+            # Create new pharmacy profile
+            execute_insert('''
+                INSERT INTO pharmacies (user_id, pharmacy_name, address, phone, email, 
+                                      license_number, location_id, latitude, longitude)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (user_id, pharmacy_name, address, phone, email, license_number, 
+                  location_id, latitude, longitude))
+        
+        reference_data.bump('pharmacies')
+        if existing_pharmacy and str(existing_pharmacy[0]['location_id']) != str(location_id):
+            refresh_pharmacy_availability(existing_pharmacy[0]['id'], existing_pharmacy[0]['location_id'], location_id)
+        if latitude is None or longitude is None:
+            request_geocode_backfill(existing_pharmacy[0]['id'] if existing_pharmacy else None)
+        
+        flash('Pharmacy profile updated successfully!', 'success')
+        return redirect(url_for('pharmacy_profile'))
+        
+    else:
+        # Handle regular user profile update
+        full_name = request.form.get('full_name')
+        phone = request.form.get('phone')
+        
+        execute_query('''
+            UPDATE users 
+            SET full_name = ?, phone = ?
+            WHERE id = ?
+        ''', (full_name, phone, user_id))
+        
+        session['full_name'] = full_name
+        flash('Profile updated successfully!', 'success')
+        return redirect(url_for('profile'))
+
+@app.route('/profile/complete')
+@login_required
+def complete_profile():
+    """Page to complete profile setup after registration"""
+    user_id = session.get('user_id')
+    user = execute_query('SELECT * FROM users WHERE id = ?', (user_id,))[0]
+    
+    if user['user_type'] == 'pharmacy':
+        # Check if pharmacy profile is complete
+        pharmacy = execute_query('SELECT * FROM pharmacies WHERE user_id = ?', (user_id,))
+        if not pharmacy:
+            flash('Please complete your pharmacy profile to continue.', 'warning')
+            return redirect(url_for('pharmacy_profile'))
+    
+    return redirect(url_for('dashboard'))
+
+@app.route('/logout')
+@login_required
+def logout():
+    """Logout user"""
+    session.clear()
+    flash('You have been logged out successfully.', 'success')
+    return redirect(url_for('index'))
+
+# Streaming exports for authorities
+EXPORT_CONFIG = {
+    'chunk_size': 5000,  # rows per keyset page
+    'formats': {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+}
+EXPORT_DATASETS = {
+    'patient_reports': {
+        'columns': ['id', 'medicine_id', 'medicine_name', 'location_id', 'location_name', 'report_type',
+                    'pharmacy_id', 'reported_price', 'expected_price', 'description', 'is_verified', 'created_at'],
+        'query': '''
+            SELECT pr.id, pr.medicine_id, m.name as medicine_name, pr.location_id, l.name as location_name,
+                   pr.report_type, pr.pharmacy_id, pr.reported_price, pr.expected_price, pr.description,
+                   pr.is_verified, pr.created_at
+            FROM patient_reports pr
+            JOIN medicines m ON pr.medicine_id = m.id
+            JOIN locations l ON pr.location_id = l.id
+        ''',
+        'key': 'pr.id', 'time_column': 'pr.created_at', 'location_column': 'pr.location_id'
+    },
+    'shortage_alerts': {
+        'columns': ['id', 'medicine_id', 'medicine_name', 'location_id', 'location_name', 'alert_type', 'severity',
+                    'description', 'affected_pharmacies_count', 'average_price', 'price_increase_percentage',
+                    'is_active', 'created_at', 'resolved_at'],
+        'query': '''
+            SELECT sa.id, sa.medicine_id, m.name as medicine_name, sa.location_id, l.name as location_name,
+                   sa.alert_type, sa.severity, sa.description, sa.affected_pharmacies_count, sa.average_price,
+                   sa.price_increase_percentage, sa.is_active, sa.created_at, sa.resolved_at
+            FROM shortage_alerts sa
+            JOIN medicines m ON sa.medicine_id = m.id
+            JOIN locations l ON sa.location_id = l.id
+        ''',
+        'key': 'sa.id', 'time_column': 'sa.created_at', 'location_column': 'sa.location_id'
+    },
+    'price_history': {
+        'columns': ['id', 'pharmacy_id', 'pharmacy_name', 'location_id', 'medicine_id', 'medicine_name',
+                    'price', 'mrp', 'stock_level', 'recorded_at'],
+        'query': '''
+            SELECT ph.id, ph.pharmacy_id, p.pharmacy_name, p.location_id, ph.medicine_id, m.name as medicine_name,
+                   ph.price, ph.mrp, ph.stock_level, ph.recorded_at
+            FROM price_history ph
+            JOIN pharmacies p ON ph.pharmacy_id = p.id
+            JOIN medicines m ON ph.medicine_id = m.id
+        ''',
+        'key': 'ph.id', 'time_column': 'ph.recorded_at', 'location_column': 'p.location_id'
+    },
+    'ledger': {
+        'columns': ['kind', 'index', 'pharmacy', 'medicine', 'location', 'quantity', 'price', 'timestamp']
+    }
+}
+
+def iter_table_export(dataset, start=None, end=None, location_id=None):
+    """Yield lists of rows page by page using keyset pagination on the primary key.
+
+    Each page is a short statement on a fresh cursor, so no read lock is held
+    between pages and memory stays at one page however large the table is.
+    """
+    spec = EXPORT_DATASETS[dataset]
+    conditions, params = [f"{spec['key']} > ?"], []
+    if start:
+        conditions.append(f"{spec['time_column']} >= ?")
+        params.append(start)
+    if end:
+        conditions.append(f"{spec['time_column']} < DATE(?, '+1 day')")
+        params.append(end)
+    if location_id:
+        conditions.append(f"{spec['location_column']} = ?")
+        params.append(location_id)
+    query = f"{spec['query']} WHERE {' AND '.join(conditions)} ORDER BY {spec['key']} LIMIT ?"
+
+    last_id = 0
+    while True:
+        conn = get_read_connection()
+        try:
+            cursor = conn.execute(query, [last_id] + params + [EXPORT_CONFIG['chunk_size']])
+            page = cursor.fetchmany(EXPORT_CONFIG['chunk_size'])
+        finally:
+            conn.close()
+        if not page:
+            return
+        yield [tuple(row) for row in page]
+        last_id = page[-1]['id']
+
+def iter_ledger_export(start=None, end=None, location_id=None):
+    """Yield on-chain stock updates and shortage reports in pages, fetched LEDGER_LOG_BATCH at a time"""
+    if location_id:
+        location = reference_data.by_id('locations').get(int(location_id))
+        location_name = location['name'] if location else None
+    start_ts = int(datetime.fromisoformat(start).timestamp()) if start else None
+    end_ts = int((datetime.fromisoformat(end) + timedelta(days=1)).timestamp()) if end else None
+
+    def in_range(timestamp):
+        return (start_ts is None or timestamp >= start_ts) and (end_ts is None or timestamp < end_ts)
+
+    page = []
+    for kind, record_type in (('stocks', 'stock_update'), ('shortages', 'shortage_report')):
+        if kind == 'stocks' and location_id:
+            continue  # stock updates carry no location
+        count = ledger_count(kind)
+        for first in range(0, count, LEDGER_LOG_BATCH):
+            for entry in ledger_entries(kind, range(first, min(first + LEDGER_LOG_BATCH, count))):
+                if in_range(entry['timestamp']) and (not location_id or entry['location'] == location_name):
+                    page.append((record_type, entry['index'], entry.get('pharmacy'), entry['medicine'],
+                                 entry.get('location'), entry.get('quantity'), entry.get('price'), entry['timestamp']))
+            if len(page) >= EXPORT_CONFIG['chunk_size']:
+                yield page
+                page = []
+    if page:
+        yield page
+
+def encode_export(pages, columns, fmt, compress):
+    """Turn row pages into CSV/NDJSON byte chunks, gzip-compressed on the fly if asked"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def emit(text):
+        data = text.encode('utf-8')
+        return compressor.compress(data) if compressor else data
+
+    if fmt == 'csv':
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        yield emit(buffer.getvalue())
+    for page in pages:
+        if fmt == 'csv':
+            buffer = StringIO()
+            csv.writer(buffer).writerows(page)
+            chunk = buffer.getvalue()
+        else:
+            chunk = ''.join(json.dumps(dict(zip(columns, row)), default=str) + '\n' for row in page)
+        data = emit(chunk)
+        if data:
+            yield data
+    if compressor:
+        yield compressor.flush()
+
+@app.route('/export/<dataset>')
+@login_required
+@role_required(['admin', 'government', 'ngo'])
+def export_dataset(dataset):
+    """Stream a full extract as CSV or NDJSON (?format=, ?gzip=1, ?start=, ?end=, ?location_id=)"""
+    if dataset not in EXPORT_DATASETS:
+        return jsonify({'error': f'Unknown dataset "{dataset}"'}), 404
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_CONFIG['formats']:
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    start, end = request.args.get('start'), request.args.get('end')
+    location_id = request.args.get('location_id')
+    try:
+        for value in (start, end):
+            if value:
+                datetime.fromisoformat(value)
+        if location_id:
+            int(location_id)
+    except ValueError:
+        return jsonify({'error': 'start/end must be ISO dates and location_id an integer'}), 400
+    compress = request.args.get('gzip') == '1'
+    
+    if dataset == 'ledger':
+        if not ledger_available():
+            return jsonify({'error': 'Blockchain not available'}), 503
+        pages = iter_ledger_export(start, end, location_id)
+    else:
+        pages = iter_table_export(dataset, start, end, location_id)
+    
+    filename = f"{dataset}-{datetime.utcnow().strftime('%Y%m%d')}.{fmt}" + ('.gz' if compress else '')
+    body = encode_export(pages, EXPORT_DATASETS[dataset]['columns'], fmt, compress)
+    return Response(stream_with_context(body),
+                    mimetype='application/gzip' if compress else EXPORT_CONFIG['formats'][fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+# Helper functions
+def check_and_create_alerts(medicine_id, location_id):
+    """Check if conditions warrant creating a shortage alert"""
+    # Count recent reports for this medicine in this location
+    recent_reports = execute_query('''
+        SELECT COUNT(*) as count
+        FROM patient_reports
+        WHERE medicine_id = ? AND location_id = ? 
+        AND created_at >= DATE('now', '-7 days')
+    ''', (medicine_id, location_id))
+    
+    if recent_reports[0]['count'] >= 3:  # Threshold for creating alert
+        # Check if alert already exists
+        existing_alert = execute_query('''
+            SELECT id FROM shortage_alerts
+            WHERE medicine_id = ? AND location_id = ? AND is_active = TRUE
+        ''', (medicine_id, location_id))
+        
+        if not existing_alert:
+            # Create new alert
+            execute_insert('''
+                INSERT INTO shortage_alerts (medicine_id, location_id, alert_type, severity, description)
+                VALUES (?, ?, 'shortage', 'medium', 'Multiple shortage reports received')
+            ''', (medicine_id, location_id))
+            data_versions.bump('alerts')
+
+# Proactive shortage-risk scan: days of cover = district stock / daily consumption
+SHORTAGE_SCAN_CONFIG = {
+    'interval': int(os.environ.get('SHORTAGE_SCAN_INTERVAL', '900')),
+    'window_days': 30,            # consumption history used for the demand rate
+    'min_daily_demand': 0.1,      # ignore pairs with (almost) no movement
+    'severity_days': [('critical', 3), ('high', 7), ('medium', 14)],
+    'resolve_days': 21,           # hysteresis: resolve only well above the medium threshold
+    'essential_factor': 2.0       # essential medicines (insulin, thyroxine, ...) alert earlier
+}
+SHORTAGE_SCAN_MARKER = 'Projected stock-out'
+
+def load_days_of_cover(conn):
+    """Days of cover for every (medicine, location) pair with recent consumption, as a DataFrame"""
+    cutoff = (datetime.utcnow() - timedelta(days=SHORTAGE_SCAN_CONFIG['window_days'])).strftime('%Y-%m-%d %H:%M:%S')
+    ensure_price_history_schema(conn)
+    history = pd.read_sql_query('''
+        SELECT ph.inventory_id, ph.medicine_id, p.location_id, ph.stock_level
+        FROM price_history ph
+        JOIN pharmacies p ON ph.pharmacy_id = p.id
+        WHERE ph.recorded_at >= ? AND ph.stock_level IS NOT NULL AND ph.inventory_id IS NOT NULL
+          AND p.location_id IS NOT NULL
+        ORDER BY ph.inventory_id, ph.id
+    ''', conn, params=(cutoff,))
+    if history.empty:
+        return history
+
+    # Consumption is every drop between consecutive stock readings of one batch; a pharmacy's
+    # batches of the same medicine are read independently, so differencing across them is noise
+    drops = -history.groupby('inventory_id')['stock_level'].diff()
+    history['consumed'] = drops.clip(lower=0).fillna(0)
+    demand = (history.groupby(['medicine_id', 'location_id'])['consumed'].sum()
+              / SHORTAGE_SCAN_CONFIG['window_days']).rename('daily_demand').reset_index()
+    demand = demand[demand['daily_demand'] >= SHORTAGE_SCAN_CONFIG['min_daily_demand']]
+
+    ensure_availability_schema(conn)
+    stock = pd.read_sql_query(
+        'SELECT medicine_id, location_id, total_stock, pharmacy_count FROM medicine_availability', conn)
+    essential = pd.read_sql_query('SELECT id as medicine_id, is_essential FROM medicines', conn)
+
+    frame = demand.merge(stock, on=['medicine_id', 'location_id'], how='left').merge(essential, on='medicine_id', how='left')
+    frame[['total_stock', 'pharmacy_count']] = frame[['total_stock', 'pharmacy_count']].fillna(0)
+    frame['days_of_cover'] = frame['total_stock'] / frame['daily_demand']
+
+    factor = np.where(frame['is_essential'].fillna(0).astype(bool), SHORTAGE_SCAN_CONFIG['essential_factor'], 1.0)
+    severity_days = SHORTAGE_SCAN_CONFIG['severity_days']
+    frame['severity'] = np.select(
+        [frame['days_of_cover'] < days * factor for _, days in severity_days],
+        [name for name, _ in severity_days],
+        default=''
+    )
+    frame['resolved'] = frame['days_of_cover'] >= SHORTAGE_SCAN_CONFIG['resolve_days'] * factor
+    return frame
+
+def run_shortage_scan():
+    """Raise, escalate and resolve shortage alerts from days of cover for every district"""
+    started = time.monotonic()
+    conn = get_db_connection()
+    try:
+        frame = load_days_of_cover(conn)
+        active = pd.read_sql_query('''
+            SELECT id, medicine_id, location_id, severity, description
+            FROM shortage_alerts
+            WHERE is_active = TRUE AND alert_type = 'shortage'
+        ''', conn)
+        scan_alerts = active[active['description'].fillna('').str.startswith(SHORTAGE_SCAN_MARKER)]
+
+        raised, updated, resolved = [], [], []
+        if not frame.empty:
+            at_risk = frame[frame['severity'] != '']
+            # Any active shortage alert (report-driven or ours) already covers the pair
+            existing = active.drop_duplicates(['medicine_id', 'location_id'])
+            covered = at_risk.merge(existing[['medicine_id', 'location_id', 'id', 'severity', 'description']],
+                                    on=['medicine_id', 'location_id'], how='left', suffixes=('', '_alert'))
+
+            for row in covered.itertuples(index=False):
+                description = (f"{SHORTAGE_SCAN_MARKER} in {row.days_of_cover:.1f} days "
+                               f"({int(row.total_stock)} in stock, {row.daily_demand:.1f}/day)")
+                if pd.isna(row.id):
+                    raised.append((row.medicine_id, row.location_id, row.severity, description, int(row.pharmacy_count)))
+                elif str(row.description).startswith(SHORTAGE_SCAN_MARKER) and row.severity_alert != row.severity:
+                    updated.append((row.severity, description, int(row.pharmacy_count), int(row.id)))
+
+            recovered = frame[frame['resolved']][['medicine_id', 'location_id']]
+            resolved = scan_alerts.merge(recovered, on=['medicine_id', 'location_id'])['id'].astype(int).tolist()
+
+        # Pairs whose consumption stopped entirely drop out of the frame; resolve those too
+        tracked = set(zip(frame['medicine_id'], frame['location_id'])) if not frame.empty else set()
+        resolved += [int(alert.id) for alert in scan_alerts.itertuples(index=False)
+                     if (alert.medicine_id, alert.location_id) not in tracked]
+
+        conn.executemany('''
+            INSERT INTO shortage_alerts (medicine_id, location_id, alert_type, severity, description, affected_pharmacies_count)
+            VALUES (?, ?, 'shortage', ?, ?, ?)
+        ''', [(int(m), int(l), sev, desc, count) for m, l, sev, desc, count in raised])
+        conn.executemany('''
+            UPDATE shortage_alerts SET severity = ?, description = ?, affected_pharmacies_count = ? WHERE id = ?
+        ''', updated)
+        conn.executemany('''
+            UPDATE shortage_alerts SET is_active = FALSE, resolved_at = CURRENT_TIMESTAMP WHERE id = ?
+        ''', [(alert_id,) for alert_id in resolved])
+        conn.commit()
+    finally:
+        conn.close()
+
+    if raised or updated or resolved:
+        data_versions.bump('alerts')
+    summary = {'pairs_scanned': len(frame), 'raised': len(raised), 'escalated': len(updated),
+               'resolved': len(resolved), 'duration_s': round(time.monotonic() - started, 2)}
+    logger.info(f"Shortage scan: {summary}")
+    return summary
+
+def _shortage_scan_worker():
+    while True:
+        try:
+            run_shortage_scan()
+        except Exception as e:
+            logger.error(f"Shortage scan error: {e}")
+        time.sleep(SHORTAGE_SCAN_CONFIG['interval'])
+
+def start_shortage_scan():
+    thread = threading.Thread(target=_shortage_scan_worker, name='shortage-scan', daemon=True)
+    thread.start()
+    return thread
+
+@app.route('/admin/shortage-scan/run', methods=['POST'])
+@login_required
+@role_required(['admin'])
+def run_shortage_scan_now():
+    """Trigger a shortage-risk scan on demand"""
+    return jsonify(run_shortage_scan())
+
+# Error handlers
+@app.errorhandler(404)
+def not_found(error):
+    return render_template('404.html'), 404
+
+@app.errorhandler(500)
+def internal_error(error):
+    return render_template('500.html'), 500
+
+def start_background_workers():
+    """Start this process's daemon threads; threads do not survive fork, so workers call this themselves"""
+    if os.environ.get('API_LOGGING', '1') == '1':
+        start_api_logging()
+    if METRICS_CONFIG['dir']:
+        start_metrics_flusher()
+    # Upstream lookups share one rate limit, so one backfill per deployment is enough
+    if os.environ.get('GEOCODE_BACKFILL', '0') == '1':
+        start_geocode_backfill()
+    if os.environ.get('FEATURE_STORE', '1') == '1':
+        start_feature_store()
+    # Runs in several processes claim disjoint queued orders, but one scheduler per deployment is enough
+    if os.environ.get('REORDER_ENGINE', '0') == '1':
+        start_reorder_engine()
+    if SNAPSHOT_CONFIG['enabled']:
+        start_snapshot_refresher()
+    # The index is shared through the database, so one indexer per deployment is enough;
+    # a single-process server is that one. Filtered history also catches up on demand.
+    if os.environ.get('LEDGER_INDEXER', '0' if PREFORK_MODE else '1') == '1':
+        start_ledger_indexer()
+    # Every process flushes its own local ledger appends; one anchors the head hash on-chain
+    if LOCAL_LEDGER_CONFIG['backend'] != 'evm':
+        start_local_ledger_worker(anchor=os.environ.get('LEDGER_ANCHOR', '0') == '1')
+    if os.environ.get('SHORTAGE_SCAN', '0') == '1':
+        start_shortage_scan()
+    if os.environ.get('UPLOAD_PROCESSOR', '1') == '1':
+        start_upload_processor()
+    if os.environ.get('MODEL_WATCHER', '1') == '1':
+        start_model_watcher()
+    # Retrain in one process only; every worker picks new versions up through its watcher
+    if os.environ.get('MODEL_RETRAIN', '0') == '1':
+        start_model_retrainer()
+
+def init_worker():
+    """Per-worker setup after fork: RPC connections and background threads"""
+    connect_ledger()
+    start_background_workers()
+
+def freeze_shared_state():
+    """Called in the master after preloading so workers share its pages copy-on-write.
+
+    gc.freeze() moves every object allocated so far into a permanent generation the
+    collector never scans, so GC passes in workers stop dirtying the shared pages.
+    """
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Froze {gc.get_freeze_count()} objects for copy-on-write sharing")
+
+if not PREFORK_MODE:
+    start_background_workers()
+
+if __name__ == '__main__':
+    # Initialize database if it doesn't exist
+    if not os.path.exists('healthcare.db'):
+        print("Database not found. Please run the schema script first.")
+    
+    # Development server; for production use: gunicorn -c gunicorn.conf.py app:app
+    app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,286 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.19;
+
+// MedicineLedger v2: pharmacy, medicine and location names are registered once and
+// referenced by uint32 id. Stock updates and shortage reports are recorded as events
+// only; orders keep a packed storage record because their status changes.
+contract MedicineLedgerV2 {
+    // Name kinds
+    uint8 public constant PHARMACY = 0;
+    uint8 public constant MEDICINE = 1;
+    uint8 public constant LOCATION = 2;
+
+    // Order statuses
+    uint8 public constant PENDING = 0;
+    uint8 public constant CONFIRMED = 1;
+    uint8 public constant SHIPPED = 2;
+    uint8 public constant DELIVERED = 3;
+    uint8 public constant CANCELLED = 4;
+
+    // Two storage slots per order
+    struct Order {
+        address retailer;
+        uint32 medicineId;
+        uint64 timestamp;
+        address manufacturer;
+        uint88 quantity;
+        uint8 status;
+    }
+
+    // Migration records (see scripts/migrate_ledger_v2.py)
+    struct StockRecord {
+        uint32 pharmacyId;
+        uint32 medicineId;
+        uint128 quantity;
+        uint128 price;
+        uint64 timestamp;
+        address updatedBy;
+    }
+
+    struct ShortageRecord {
+        uint32 medicineId;
+        uint32 locationId;
+        uint64 timestamp;
+        address reportedBy;
+    }
+
+    struct OrderRecord {
+        uint32 medicineId;
+        uint88 quantity;
+        address retailer;
+        address manufacturer;
+        uint8 status;
+        uint64 timestamp;
+    }
+
+    struct RetailerStockRecord {
+        address retailer;
+        uint32 medicineId;
+        uint256 stock;
+    }
+
+    // State variables
+    address public immutable owner;
+
+    // kind => keccak256(name) => id (ids start at 1; 0 means unregistered)
+    mapping(uint8 => mapping(bytes32 => uint32)) public nameIds;
+    mapping(uint8 => uint32) public nameCount;
+
+    mapping(uint256 => Order) public orders;
+    mapping(address => mapping(uint32 => uint256)) public retailerStocks;
+
+    // Packed into one slot
+    uint64 public stockCount;
+    uint64 public shortageCount;
+    uint64 public orderCount;
+    bool public migrationOpen;
+
+    // Events
+    event NameRegistered(uint8 indexed kind, uint32 indexed id, string name);
+    event StockAdded(uint64 indexed seq, uint32 indexed pharmacyId, uint32 indexed medicineId, uint128 quantity, uint128 price, uint64 timestamp, address updatedBy);
+    event ShortageReported(uint64 indexed seq, uint32 indexed medicineId, uint32 indexed locationId, uint64 timestamp, address reportedBy);
+    event OrderPlaced(uint64 indexed seq, uint32 indexed medicineId, uint256 quantity, address retailer, address manufacturer);
+    event OrderStatusUpdated(uint64 indexed seq, uint8 status);
+    event RetailerStockUpdated(address indexed retailer, uint32 indexed medicineId, uint256 newStock);
+    event MigrationFinished(uint64 stockCount, uint64 shortageCount, uint64 orderCount);
+    event LedgerAnchored(bytes32 indexed headHash, uint64 records, address anchoredBy);
+
+    // Modifiers
+    modifier onlyValidAddress() {
+        require(msg.sender != address(0), "Invalid address");
+        _;
+    }
+
+    modifier onlyOwner() {
+        require(msg.sender == owner, "Only the owner can do this");
+        _;
+    }
+
+    // Imports keep v1 indexes, so live records are only accepted once migration is finished
+    modifier whenLive() {
+        require(!migrationOpen, "Migration in progress");
+        _;
+    }
+
+    modifier duringMigration() {
+        require(migrationOpen, "Migration finished");
+        _;
+    }
+
+    modifier registered(uint8 _kind, uint32 _id) {
+        require(_id != 0 && _id <= nameCount[_kind], "Unregistered name id");
+        _;
+    }
+
+    // Constructor
+    constructor(bool _migrate) {
+        owner = msg.sender;
+        migrationOpen = _migrate;
+    }
+
+    // Name registry
+    function registerName(uint8 _kind, string calldata _name) public onlyValidAddress returns (uint32 id) {
+        require(_kind <= LOCATION, "Unknown name kind");
+        require(bytes(_name).length > 0, "Empty name");
+        bytes32 key = keccak256(bytes(_name));
+        id = nameIds[_kind][key];
+        if (id == 0) {
+            id = ++nameCount[_kind];
+            nameIds[_kind][key] = id;
+            emit NameRegistered(_kind, id, _name);
+        }
+    }
+
+    function registerNames(uint8 _kind, string[] calldata _names) public {
+        for (uint256 i = 0; i < _names.length; i++) {
+            registerName(_kind, _names[i]);
+        }
+    }
+
+    // Ledger records
+    function addMedicineStock(
+        uint32 _pharmacyId,
+        uint32 _medicineId,
+        uint128 _quantity,
+        uint128 _price
+    ) public onlyValidAddress whenLive registered(PHARMACY, _pharmacyId) registered(MEDICINE, _medicineId) {
+        emit StockAdded(stockCount++, _pharmacyId, _medicineId, _quantity, _price, uint64(block.timestamp), msg.sender);
+    }
+
+    function reportShortage(
+        uint32 _medicineId,
+        uint32 _locationId
+    ) public onlyValidAddress whenLive registered(MEDICINE, _medicineId) registered(LOCATION, _locationId) {
+        emit ShortageReported(shortageCount++, _medicineId, _locationId, uint64(block.timestamp), msg.sender);
+    }
+
+    function placeOrder(
+        uint32 _medicineId,
+        uint256 _quantity,
+        address _manufacturer
+    ) public onlyValidAddress whenLive registered(MEDICINE, _medicineId) {
+        require(_quantity <= type(uint88).max, "Quantity too large");
+        uint64 seq = orderCount++;
+        orders[seq] = Order({
+            retailer: msg.sender,
+            medicineId: _medicineId,
+            timestamp: uint64(block.timestamp),
+            manufacturer: _manufacturer,
+            quantity: uint88(_quantity),
+            status: PENDING
+        });
+        emit OrderPlaced(seq, _medicineId, _quantity, msg.sender, _manufacturer);
+    }
+
+    function updateRetailerStock(
+        uint32 _medicineId,
+        uint256 _newStock
+    ) public onlyValidAddress whenLive registered(MEDICINE, _medicineId) {
+        retailerStocks[msg.sender][_medicineId] = _newStock;
+        emit RetailerStockUpdated(msg.sender, _medicineId, _newStock);
+    }
+
+    function updateOrderStatus(
+        uint256 _orderId,
+        uint8 _newStatus
+    ) public onlyValidAddress whenLive {
+        require(_orderId < orderCount, "Order does not exist");
+        require(_newStatus <= CANCELLED, "Unknown order status");
+
+        Order storage order = orders[_orderId];
+        require(
+            msg.sender == order.retailer || msg.sender == order.manufacturer,
+            "Not authorized to update this order"
+        );
+
+        order.status = _newStatus;
+        emit OrderStatusUpdated(uint64(_orderId), _newStatus);
+    }
+
+    // Head hash of an off-chain, hash-chained ledger log (see LocalLedger in app.py).
+    // Only the owner anchors, so readers can ignore anchors emitted by anyone else.
+    function anchorLedger(bytes32 _headHash, uint64 _records) public onlyOwner {
+        emit LedgerAnchored(_headHash, _records, msg.sender);
+    }
+
+    // Migration from v1: records are replayed in v1 order with their original timestamps
+    function importStocks(StockRecord[] calldata _records) public onlyOwner duringMigration {
+        for (uint256 i = 0; i < _records.length; i++) {
+            StockRecord calldata r = _records[i];
+            emit StockAdded(stockCount++, r.pharmacyId, r.medicineId, r.quantity, r.price, r.timestamp, r.updatedBy);
+        }
+    }
+
+    function importShortages(ShortageRecord[] calldata _records) public onlyOwner duringMigration {
+        for (uint256 i = 0; i < _records.length; i++) {
+            ShortageRecord calldata r = _records[i];
+            emit ShortageReported(shortageCount++, r.medicineId, r.locationId, r.timestamp, r.reportedBy);
+        }
+    }
+
+    function importOrders(OrderRecord[] calldata _records) public onlyOwner duringMigration {
+        for (uint256 i = 0; i < _records.length; i++) {
+            OrderRecord calldata r = _records[i];
+            uint64 seq = orderCount++;
+            orders[seq] = Order({
+                retailer: r.retailer,
+                medicineId: r.medicineId,
+                timestamp: r.timestamp,
+                manufacturer: r.manufacturer,
+                quantity: r.quantity,
+                status: r.status
+            });
+            emit OrderPlaced(seq, r.medicineId, r.quantity, r.retailer, r.manufacturer);
+        }
+    }
+
+    function importRetailerStocks(RetailerStockRecord[] calldata _records) public onlyOwner duringMigration {
+        for (uint256 i = 0; i < _records.length; i++) {
+            RetailerStockRecord calldata r = _records[i];
+            retailerStocks[r.retailer][r.medicineId] = r.stock;
+            emit RetailerStockUpdated(r.retailer, r.medicineId, r.stock);
+        }
+    }
+
+    function finishMigration() public onlyOwner duringMigration {
+        migrationOpen = false;
+        emit MigrationFinished(stockCount, shortageCount, orderCount);
+    }
+
+    // View functions
+    function nameId(uint8 _kind, string calldata _name) public view returns (uint32) {
+        return nameIds[_kind][keccak256(bytes(_name))];
+    }
+
+    function getStockCount() public view returns (uint256) {
+        return stockCount;
+    }
+
+    function getShortageCount() public view returns (uint256) {
+        return shortageCount;
+    }
+
+    function getOrderCount() public view returns (uint256) {
+        return orderCount;
+    }
+
+    function getOrder(uint256 _orderId) public view returns (
+        uint32 medicineId,
+        uint256 quantity,
+        address retailer,
+        address manufacturer,
+        uint8 status
+    ) {
+        require(_orderId < orderCount, "Order does not exist");
+        Order memory order = orders[_orderId];
+        return (order.medicineId, order.quantity, order.retailer, order.manufacturer, order.status);
+    }
+
+    function getRetailerStock(address _retailer, uint32 _medicineId) public view returns (uint256) {
+        return retailerStocks[_retailer][_medicineId];
+    }
+
+    function getContractInfo() public pure returns (string memory) {
+        return "MedicineLedger v2.0 - Healthcare Supply Chain Management";
+    }
+}
\ No newline at end of file
@@ -0,0 +1,41 @@
+# Gunicorn configuration for production serving
+#
+#   gunicorn -c gunicorn.conf.py app:app
+#
+# The app is imported once in the master (preload_app), so the medicine dataset,
+# memory-mapped TF-IDF matrix and models are shared copy-on-write by all workers.
+# Web3/RPC clients and background threads are created in each worker after fork.
+import multiprocessing
+import os
+
+os.environ.setdefault('BYTEFORCE_PREFORK', '1')
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+worker_class = 'gthread'
+preload_app = True
+timeout = 120
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = 100 if max_requests else 0
+accesslog = '-'
+
+_frozen = False
+
+
+def on_starting(server):
+    import app
+    app.reset_metrics_dir()
+
+
+def pre_fork(server, worker):
+    global _frozen
+    if not _frozen:
+        import app
+        app.freeze_shared_state()
+        _frozen = True
+
+
+def post_fork(server, worker):
+    import app
+    app.init_worker()
@@ -0,0 +1,50 @@
+const { ethers } = require("hardhat");
+const fs = require('fs');
+
+// MIGRATE=1 deploys with the migration window open (see scripts/migrate_ledger_v2.py);
+// live writes are rejected until finishMigration() is called.
+async function main() {
+    const migrate = process.env.MIGRATE === '1';
+    console.log(`🚀 Deploying MedicineLedgerV2 (migration ${migrate ? 'open' : 'off'})...`);
+
+    const MedicineLedgerV2 = await ethers.getContractFactory("MedicineLedgerV2");
+    const ledger = await MedicineLedgerV2.deploy(migrate);
+    await ledger.waitForDeployment();
+    const receipt = await ledger.deploymentTransaction().wait();
+
+    const contractAddress = await ledger.getAddress();
+    console.log("✅ MedicineLedgerV2 deployed to:", contractAddress, "in block", receipt.blockNumber);
+
+    // The app reads v2 records from logs, starting at the deployment block
+    const contractInfo = {
+        address: contractAddress,
+        abi: JSON.parse(ledger.interface.formatJson()),
+        deployedAt: new Date().toISOString(),
+        deployBlock: receipt.blockNumber,
+        network: "hardhat",
+        contractName: "MedicineLedgerV2"
+    };
+    fs.writeFileSync('MedicineLedgerV2.json', JSON.stringify(contractInfo, null, 2));
+    console.log("📄 Contract ABI and address saved to MedicineLedgerV2.json");
+
+    if (!migrate) {
+        console.log("\n🧪 Testing contract functions...");
+        await (await ledger.registerNames(0, ["Test Pharmacy"])).wait();
+        await (await ledger.registerNames(1, ["Paracetamol"])).wait();
+        await (await ledger.registerNames(2, ["Mumbai"])).wait();
+        await (await ledger.addMedicineStock(1, 1, 100, 500)).wait();
+        await (await ledger.reportShortage(1, 1)).wait();
+        console.log("📦 Stock updates:", (await ledger.getStockCount()).toString());
+        console.log("⚠️ Shortage reports:", (await ledger.getShortageCount()).toString());
+    }
+
+    console.log("\n🎉 Deployment completed successfully!");
+    console.log("📝 Start the app with LEDGER_CONTRACT_VERSION=2 to use it");
+}
+
+main()
+    .then(() => process.exit(0))
+    .catch((error) => {
+        console.error("💥 Deployment failed:", error);
+        process.exit(1);
+    });
@@ -0,0 +1,112 @@
+const { ethers } = require("hardhat");
+
+// Gas per ledger write, MedicineLedger v1 vs v2, on a local Hardhat chain:
+//   npx hardhat run scripts/gas_benchmark.js
+// ROUNDS (default 100) writes of each kind cycle through realistic names, so v2 pays
+// for name registration the first time a name is seen and reports it separately.
+// MARKDOWN=1 prints the results as the table kept in the README.
+const ROUNDS = parseInt(process.env.ROUNDS || '100', 10);
+const MARKDOWN = process.env.MARKDOWN === '1';
+
+const PHARMACIES = [
+    "Apollo Pharmacy - Andheri West, Mumbai",
+    "MedPlus Health Services - Koramangala, Bengaluru",
+    "Wellness Forever Chemists - FC Road, Pune",
+    "Jan Aushadhi Kendra - Civil Lines, Nagpur",
+    "Netmeds Partner Store - Salt Lake Sector V, Kolkata"
+];
+const MEDICINES = [
+    "Augmentin 625 Duo Tablet",
+    "Azithral 500 Tablet",
+    "Pan-D Capsule PR",
+    "Glycomet-GP 2 Tablet PR",
+    "Thyronorm 50mcg Tablet",
+    "Huminsulin R 40IU/ml Injection",
+    "Telma-H Tablet",
+    "Montair-LC Kid Syrup"
+];
+const LOCATIONS = ["Mumbai Suburban", "Bengaluru Urban", "Pune", "Nagpur", "Kolkata"];
+
+async function gasOf(txPromise) {
+    const receipt = await (await txPromise).wait();
+    return Number(receipt.gasUsed);
+}
+
+function average(values) {
+    return values.length ? Math.round(values.reduce((a, b) => a + b, 0) / values.length) : 0;
+}
+
+async function main() {
+    const [, manufacturer] = await ethers.getSigners();
+    const v1 = await (await ethers.getContractFactory("MedicineLedger")).deploy();
+    const v2 = await (await ethers.getContractFactory("MedicineLedgerV2")).deploy(false);
+    await v1.waitForDeployment();
+    await v2.waitForDeployment();
+
+    const ids = [new Map(), new Map(), new Map()];
+    const registration = [];
+    async function idFor(kind, name) {
+        if (!ids[kind].has(name)) {
+            registration.push(await gasOf(v2.registerName(kind, name)));
+            ids[kind].set(name, Number(await v2.nameId(kind, name)));
+        }
+        return ids[kind].get(name);
+    }
+
+    const results = {};
+    function record(name, version, gas) {
+        results[name] = results[name] || { v1: [], v2: [] };
+        results[name][version].push(gas);
+    }
+
+    console.log(`⛽ Running ${ROUNDS} rounds of each ledger write...`);
+    for (let i = 0; i < ROUNDS; i++) {
+        const pharmacy = PHARMACIES[i % PHARMACIES.length];
+        const medicine = MEDICINES[i % MEDICINES.length];
+        const location = LOCATIONS[i % LOCATIONS.length];
+        const quantity = 50 + i;
+        const price = 1000 + 7 * i;
+
+        record("addMedicineStock", "v1", await gasOf(v1.addMedicineStock(pharmacy, medicine, quantity, price)));
+        const pharmacyId = await idFor(0, pharmacy);
+        const medicineId = await idFor(1, medicine);
+        record("addMedicineStock", "v2", await gasOf(v2.addMedicineStock(pharmacyId, medicineId, quantity, price)));
+
+        record("reportShortage", "v1", await gasOf(v1.reportShortage(medicine, location)));
+        const locationId = await idFor(2, location);
+        record("reportShortage", "v2", await gasOf(v2.reportShortage(medicineId, locationId)));
+
+        record("placeOrder", "v1", await gasOf(v1.placeOrder(medicine, quantity, manufacturer.address)));
+        record("placeOrder", "v2", await gasOf(v2.placeOrder(medicineId, quantity, manufacturer.address)));
+
+        record("updateRetailerStock", "v1", await gasOf(v1.updateRetailerStock(medicine, quantity)));
+        record("updateRetailerStock", "v2", await gasOf(v2.updateRetailerStock(medicineId, quantity)));
+    }
+
+    const rows = Object.entries(results).map(([name, gas]) => {
+        const a = average(gas.v1);
+        const b = average(gas.v2);
+        return [name, a, b, a ? Math.round((1 - b / a) * 100) : 0];
+    });
+    if (MARKDOWN) {
+        console.log(`\n| Write (avg of ${ROUNDS}) | v1 gas | v2 gas | Saved |`);
+        console.log("|---|---:|---:|---:|");
+        for (const [name, a, b, saved] of rows) {
+            console.log(`| \`${name}\` | ${a} | ${b} | ${saved}% |`);
+        }
+        console.log(`| v2 name registration (once per name) | | ${average(registration)} | |`);
+        return;
+    }
+    console.log(`\n${"function".padEnd(24)}${"v1 gas".padStart(10)}${"v2 gas".padStart(10)}${"saved".padStart(8)}`);
+    for (const [name, a, b, saved] of rows) {
+        console.log(`${name.padEnd(24)}${String(a).padStart(10)}${String(b).padStart(10)}${(saved + "%").padStart(8)}`);
+    }
+    console.log(`\n🏷️ v2 name registration: ${registration.length} names, ${average(registration)} gas each (one-time)`);
+}
+
+main()
+    .then(() => process.exit(0))
+    .catch((error) => {
+        console.error("💥 Benchmark failed:", error);
+        process.exit(1);
+    });
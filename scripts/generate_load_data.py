@@ -0,0 +1,316 @@
+"""Generate a scaled healthcare.db and Medicine_Details.csv for load testing.
+
+Usage:
+    python scripts/generate_load_data.py --out bench_data \
+        --pharmacies 10000 --inventory 5000000 --reports 1000000
+
+The database is built from healthcare_schema.sql, so it has exactly the tables,
+indexes and triggers the app expects, plus synthetic rows on top of the sample data.
+"""
+import argparse
+import csv
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import groupby
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA_FILE = os.path.join(ROOT, 'healthcare_schema.sql')
+
+# Password for every generated account, used by the load test to log in if needed
+LOAD_TEST_PASSWORD = 'loadtest'
+
+STATES = {
+    'Maharashtra': (19.7, 75.7), 'Karnataka': (15.3, 75.7), 'Delhi': (28.6, 77.2),
+    'Tamil Nadu': (11.1, 78.6), 'West Bengal': (22.9, 87.8), 'Gujarat': (22.2, 71.1),
+    'Rajasthan': (27.0, 74.2), 'Uttar Pradesh': (26.8, 80.9), 'Kerala': (10.8, 76.2),
+    'Telangana': (18.1, 79.0)
+}
+
+INGREDIENTS = [
+    'Paracetamol', 'Metformin', 'Amlodipine', 'Atorvastatin', 'Amoxicillin', 'Clavulanic Acid',
+    'Azithromycin', 'Cetirizine', 'Levocetirizine', 'Montelukast', 'Omeprazole', 'Pantoprazole',
+    'Domperidone', 'Insulin Human', 'Levothyroxine', 'Glimepiride', 'Telmisartan', 'Losartan',
+    'Hydrochlorothiazide', 'Diclofenac', 'Ibuprofen', 'Aceclofenac', 'Ciprofloxacin', 'Ofloxacin',
+    'Ornidazole', 'Ranitidine', 'Famotidine', 'Vitamin D3', 'Calcium Carbonate', 'Rosuvastatin'
+]
+DOSAGES = ['2.5mg', '5mg', '10mg', '20mg', '40mg', '50mg', '100mg', '250mg', '500mg', '625mg', '50mcg', '100IU']
+FORMS = ['tablet', 'capsule', 'syrup', 'injection', 'drops']
+MANUFACTURERS = ['Cipla Ltd', 'Sun Pharma', 'Lupin Ltd', 'Dr Reddys', 'Zydus Cadila', 'Mankind Pharma',
+                 'Alkem Labs', 'Torrent Pharma', 'GSK', 'Pfizer', 'Abbott', 'Glenmark']
+REPORT_TYPES = ['shortage', 'overpriced', 'unavailable', 'fake']
+
+
+def chunked(rows, size=50000):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def insert_many(conn, sql, rows, label):
+    started = time.time()
+    total = 0
+    for batch in chunked(rows):
+        conn.executemany(sql, batch)
+        total += len(batch)
+    conn.commit()
+    print(f"  {label}: {total} rows in {time.time() - started:.1f}s")
+
+
+def composition(rng):
+    parts = rng.sample(INGREDIENTS, rng.choice([1, 1, 2, 2, 3]))
+    return ' + '.join(f"{name} ({rng.choice(DOSAGES)})" for name in parts)
+
+
+def generate_database(path, args, rng):
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    with open(SCHEMA_FILE) as f:
+        conn.executescript(f.read())
+    # Bulk loading is much faster without per-row triggers and FK checks
+    conn.execute('PRAGMA foreign_keys = OFF')
+    triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall()
+    for name, _ in triggers:
+        conn.execute(f'DROP TRIGGER {name}')
+
+    print(f"📝 Building {path}")
+    try:
+        from werkzeug.security import generate_password_hash
+        password_hash = generate_password_hash(LOAD_TEST_PASSWORD)
+    except ImportError:
+        password_hash = 'pbkdf2:sha256:hash'
+
+    # Locations: states plus districts around them
+    base_location = conn.execute('SELECT COALESCE(MAX(id), 0) FROM locations').fetchone()[0]
+    location_rows = []
+    district_coords = []
+    next_id = base_location + 1
+    for state, (lat, lon) in STATES.items():
+        state_id = next_id
+        location_rows.append((state_id, f'{state} (synthetic)', 'state', None, lat, lon))
+        next_id += 1
+        for d in range(args.districts_per_state):
+            dlat, dlon = lat + rng.uniform(-2, 2), lon + rng.uniform(-2, 2)
+            location_rows.append((next_id, f'{state} District {d + 1}', 'district', state_id, dlat, dlon))
+            district_coords.append((next_id, dlat, dlon))
+            next_id += 1
+    insert_many(conn, '''INSERT INTO locations (id, name, location_type, parent_id, latitude, longitude)
+                         VALUES (?, ?, ?, ?, ?, ?)''', location_rows, 'locations')
+
+    # Medicines
+    base_medicine = conn.execute('SELECT COALESCE(MAX(id), 0) FROM medicines').fetchone()[0]
+    medicine_ids = [base_medicine + i + 1 for i in range(args.medicines)]
+    insert_many(conn, '''INSERT INTO medicines (id, name, generic_name, brand_name, dosage_form, strength,
+                                                category, manufacturer, is_essential)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', (
+        (mid, f'Medicine {mid}', rng.choice(INGREDIENTS), f'Brand {mid}', rng.choice(FORMS),
+         rng.choice(DOSAGES), 'essential' if mid % 7 == 0 else 'general', rng.choice(MANUFACTURERS),
+         mid % 7 == 0)
+        for mid in medicine_ids), 'medicines')
+
+    # Users: one per pharmacy plus patients
+    base_user = conn.execute('SELECT COALESCE(MAX(id), 0) FROM users').fetchone()[0]
+    pharmacy_user_ids = [base_user + i + 1 for i in range(args.pharmacies)]
+    patient_user_ids = [base_user + args.pharmacies + i + 1 for i in range(args.patients)]
+    insert_many(conn, '''INSERT INTO users (id, username, email, password_hash, user_type, full_name, is_verified)
+                         VALUES (?, ?, ?, ?, ?, ?, TRUE)''', (
+        (uid, f'user{uid}', f'user{uid}@load.test', password_hash,
+         'pharmacy' if uid <= base_user + args.pharmacies else 'patient', f'Load User {uid}')
+        for uid in pharmacy_user_ids + patient_user_ids), 'users')
+
+    # Pharmacies scattered around districts
+    base_pharmacy = conn.execute('SELECT COALESCE(MAX(id), 0) FROM pharmacies').fetchone()[0]
+    pharmacy_rows = []
+    for i, uid in enumerate(pharmacy_user_ids):
+        loc_id, lat, lon = rng.choice(district_coords)
+        pid = base_pharmacy + i + 1
+        pharmacy_rows.append((pid, uid, f'Pharmacy {pid}', f'LT-{pid:07d}', f'{pid} Market Road',
+                              loc_id, lat + rng.uniform(-0.1, 0.1), lon + rng.uniform(-0.1, 0.1),
+                              f'9{pid:09d}'[:10]))
+    insert_many(conn, '''INSERT INTO pharmacies (id, user_id, pharmacy_name, license_number, address,
+                                                 location_id, latitude, longitude, phone, is_verified)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, TRUE)''', pharmacy_rows, 'pharmacies')
+    pharmacy_ids = [row[0] for row in pharmacy_rows]
+    pharmacy_location = {row[0]: row[5] for row in pharmacy_rows}
+
+    # Inventory: spread rows evenly, batches keep (pharmacy, medicine, batch) unique
+    per_pharmacy = max(1, args.inventory // max(1, len(pharmacy_ids)))
+    today = datetime.now().date()
+    base_inventory = conn.execute('SELECT COALESCE(MAX(id), 0) FROM pharmacy_inventory').fetchone()[0]
+
+    def inventory_rows():
+        for pid in pharmacy_ids:
+            for j in range(per_pharmacy):
+                mid = medicine_ids[(pid * 31 + j) % len(medicine_ids)]
+                batch = f'B{j // len(medicine_ids)}'
+                price = round(rng.uniform(2, 800), 2)
+                yield (pid, mid, rng.randint(0, 500), price, round(price * 1.15, 2), batch,
+                       (today + timedelta(days=rng.randint(-30, 720))).isoformat(), rng.choice([10, 20, 30, 50]))
+    insert_many(conn, '''INSERT INTO pharmacy_inventory (pharmacy_id, medicine_id, current_stock, unit_price, mrp,
+                                                         batch_number, expiry_date, minimum_stock_level)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', inventory_rows(), 'pharmacy_inventory')
+
+    # Price history: a sample of inventory movements over the last 90 days, each tied to its batch row
+    def price_rows():
+        for _ in range(args.price_history):
+            index = rng.randrange(len(pharmacy_ids))
+            j = rng.randrange(per_pharmacy)
+            pid = pharmacy_ids[index]
+            recorded = datetime.now() - timedelta(minutes=rng.randint(0, 90 * 24 * 60))
+            yield (pid, medicine_ids[(pid * 31 + j) % len(medicine_ids)], base_inventory + index * per_pharmacy + j + 1,
+                   round(rng.uniform(2, 800), 2), None, rng.randint(0, 500), recorded.strftime('%Y-%m-%d %H:%M:%S'))
+    insert_many(conn, '''INSERT INTO price_history (pharmacy_id, medicine_id, inventory_id, price, mrp, stock_level,
+                                                    recorded_at)
+                         VALUES (?, ?, ?, ?, ?, ?, ?)''', price_rows(), 'price_history')
+
+    # Patient reports
+    def report_rows():
+        for _ in range(args.reports):
+            pid = rng.choice(pharmacy_ids)
+            created = datetime.now() - timedelta(minutes=rng.randint(0, 60 * 24 * 60))
+            yield (rng.choice(patient_user_ids) if patient_user_ids else None, rng.choice(medicine_ids),
+                   pharmacy_location[pid], rng.choice(REPORT_TYPES), pid,
+                   round(rng.uniform(10, 900), 2), round(rng.uniform(10, 700), 2),
+                   'Synthetic load-test report', created.strftime('%Y-%m-%d %H:%M:%S'))
+    insert_many(conn, '''INSERT INTO patient_reports (user_id, medicine_id, location_id, report_type, pharmacy_id,
+                                                      reported_price, expected_price, description, created_at)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', report_rows(), 'patient_reports')
+
+    # Active alerts for a slice of (medicine, district) pairs
+    insert_many(conn, '''INSERT INTO shortage_alerts (medicine_id, location_id, alert_type, severity, description)
+                         VALUES (?, ?, 'shortage', ?, 'Synthetic alert')''', (
+        (rng.choice(medicine_ids), rng.choice(district_coords)[0], rng.choice(['low', 'medium', 'high', 'critical']))
+        for _ in range(args.alerts)), 'shortage_alerts')
+
+    # /api/search_pharmacies reads pharmacy_medicines; expose inventory under that name
+    conn.execute('''
+        CREATE VIEW IF NOT EXISTS pharmacy_medicines AS
+        SELECT pi.pharmacy_id, m.name AS medicine_name, pi.unit_price AS price
+        FROM pharmacy_inventory pi JOIN medicines m ON pi.medicine_id = m.id
+    ''')
+
+    # Restore the schema's triggers, then build what they would have maintained row by row
+    for _, sql in triggers:
+        conn.execute(sql)
+    rebuild_derived_tables(conn)
+    conn.execute('ANALYZE')
+    conn.commit()
+    conn.close()
+    return {
+        'pharmacy_user_ids': pharmacy_user_ids,
+        'patient_user_ids': patient_user_ids,
+        'medicine_ids': medicine_ids,
+        'district_coords': district_coords
+    }
+
+
+def rebuild_derived_tables(conn):
+    """Search index, map index and availability summary, as the app keeps them on live writes"""
+    conn.execute("INSERT INTO medicines_fts(medicines_fts) VALUES ('rebuild')")
+    conn.execute('DELETE FROM pharmacy_rtree')
+    conn.execute('''
+        INSERT INTO pharmacy_rtree
+        SELECT id, latitude, latitude, longitude, longitude FROM pharmacies
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    ''')
+    # Same summary as rebuild_availability() in app.py
+    rows = conn.execute('''
+        SELECT pi.medicine_id, p.location_id, pi.pharmacy_id, pi.current_stock, pi.unit_price, pi.expiry_date
+        FROM pharmacy_inventory pi
+        JOIN pharmacies p ON pi.pharmacy_id = p.id
+        WHERE pi.current_stock > 0 AND pi.is_available = TRUE AND p.location_id IS NOT NULL
+        ORDER BY pi.medicine_id, p.location_id
+    ''')
+    summaries = []
+    for (medicine_id, location_id), group in groupby(rows, key=lambda r: (r[0], r[1])):
+        group = list(group)
+        prices = [float(r[4]) for r in group if r[4] is not None]
+        expiries = [r[5] for r in group if r[5]]
+        summaries.append((medicine_id, location_id, sum(r[3] for r in group), len({r[2] for r in group}),
+                          min(prices) if prices else None, statistics.median(prices) if prices else None,
+                          min(expiries) if expiries else None))
+    conn.execute('DELETE FROM medicine_availability')
+    insert_many(conn, '''INSERT INTO medicine_availability
+                         (medicine_id, location_id, total_stock, pharmacy_count, min_price, median_price, nearest_expiry)
+                         VALUES (?, ?, ?, ?, ?, ?, ?)''', summaries, 'medicine_availability')
+    print("  medicines_fts, pharmacy_rtree: rebuilt")
+
+
+def generate_medicine_csv(path, rows, rng):
+    print(f"📝 Writing {path}")
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Medicine Name', 'Composition', 'Uses', 'Side_effects', 'Image URL',
+                         'Manufacturer', 'Excellent Review %', 'Average Review %', 'Poor Review %'])
+        for i in range(rows):
+            excellent = rng.randint(0, 100)
+            average = rng.randint(0, 100 - excellent)
+            writer.writerow([f'Synthetic Med {i} {rng.choice(FORMS).title()}', composition(rng),
+                             'Treatment of synthetic conditions', 'Nausea Headache', '',
+                             rng.choice(MANUFACTURERS), excellent, average, 100 - excellent - average])
+    print(f"  Medicine_Details.csv: {rows} rows")
+
+
+def generate_models(out_dir, rng):
+    """Train throwaway models with the app's feature layout so app.py can import"""
+    try:
+        import joblib
+        import pandas as pd
+        from sklearn.tree import DecisionTreeClassifier
+    except ImportError as e:
+        print(f"⚠️ Skipping model generation ({e}); copy the real .pkl files into {out_dir}")
+        return
+    X = pd.DataFrame([{
+        'Month': rng.choice([1, 5, 8]),
+        'Region_Code': rng.randint(0, 4),
+        'Medicine_Code': rng.randint(0, 63),
+        'Avg_Daily_Demand': rng.randint(1, 150),
+        'Stock_Level': rng.randint(0, 60),
+    } for _ in range(2000)])
+    shortage = (X['Stock_Level'] < X['Avg_Daily_Demand'] / 5).astype(int)
+    spike = ((X['Stock_Level'] < 10) & (X['Month'] == 5)).astype(int)
+    for name, y in (('medicine_shortage_model.pkl', shortage), ('medicine_price_spike_model.pkl', spike)):
+        target = os.path.join(out_dir, name)
+        if not os.path.exists(target):
+            joblib.dump(DecisionTreeClassifier(max_depth=6).fit(X, y), target)
+            print(f"  {name}: trained synthetic model")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--out', default='bench_data')
+    parser.add_argument('--pharmacies', type=int, default=10000)
+    parser.add_argument('--inventory', type=int, default=5000000)
+    parser.add_argument('--reports', type=int, default=1000000)
+    parser.add_argument('--patients', type=int, default=20000)
+    parser.add_argument('--medicines', type=int, default=5000)
+    parser.add_argument('--districts-per-state', type=int, default=40)
+    parser.add_argument('--price-history', type=int, default=1000000)
+    parser.add_argument('--alerts', type=int, default=2000)
+    parser.add_argument('--csv-rows', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    os.makedirs(args.out, exist_ok=True)
+    started = time.time()
+    generate_database(os.path.join(args.out, 'healthcare.db'), args, rng)
+    generate_medicine_csv(os.path.join(args.out, 'Medicine_Details.csv'), args.csv_rows, rng)
+    generate_models(args.out, rng)
+    print(f"✅ Load-test data ready in {args.out} ({time.time() - started:.1f}s)")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,460 @@
+"""Replay realistic traffic against the Flask app in-process and report latency per route.
+
+Usage:
+    python scripts/generate_load_data.py --out bench_data
+    python scripts/load_test.py --data bench_data --workers 8 --duration 60
+
+The app is imported from the repository root with bench_data as its working
+directory, and the Hardhat node is replaced by an in-process chain stand-in so
+ledger writes and reads cost a function call rather than an RPC round trip.
+Pass --ledger-version 2 to emulate MedicineLedgerV2 (interned ids, event logs).
+"""
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class InProcessChain:
+    """Minimal MedicineLedger emulation exposing the web3 contract/eth surface the app uses"""
+
+    def __init__(self, accounts=10):
+        self.lock = threading.Lock()
+        self.accounts = ['0x' + hashlib.sha1(f'account{i}'.encode()).hexdigest() for i in range(accounts)]
+        self.block_number = 0
+        self.nonces = {a: 0 for a in self.accounts}
+        self.stock_updates = []
+        self.shortage_reports = []
+        self.orders = []
+        self.retailer_stocks = {}
+        self.functions = _Functions(self)
+        self.eth = _Eth(self)
+
+    def is_connected(self):
+        return True
+
+    def to_checksum_address(self, address):
+        return address
+
+    # Contract implementation
+    def addMedicineStock(self, sender, pharmacy, medicine, quantity, price):
+        self.stock_updates.append((pharmacy, medicine, quantity, price, int(time.time()), sender))
+
+    def reportShortage(self, sender, medicine, location):
+        self.shortage_reports.append((medicine, location, int(time.time()), sender))
+
+    def placeOrder(self, sender, medicine, quantity, manufacturer):
+        self.orders.append([medicine, quantity, sender, manufacturer, 'pending', int(time.time())])
+
+    def updateRetailerStock(self, sender, medicine, new_stock):
+        self.retailer_stocks[(sender, medicine)] = new_stock
+
+    def getStockCount(self):
+        return len(self.stock_updates)
+
+    def getShortageCount(self):
+        return len(self.shortage_reports)
+
+    def getOrderCount(self):
+        return len(self.orders)
+
+    def stockUpdates(self, index):
+        return self.stock_updates[index]
+
+    def shortageReports(self, index):
+        return self.shortage_reports[index]
+
+    def getOrder(self, index):
+        return tuple(self.orders[index][:5])
+
+    def retailerStocks(self, retailer, medicine):
+        return self.retailer_stocks.get((retailer, medicine), 0)
+
+
+class InProcessChainV2(InProcessChain):
+    """MedicineLedgerV2 emulation: interned name ids, event-only stock/shortage records"""
+
+    address = '0x' + '0' * 39 + '2'
+
+    def __init__(self, topic, signatures, accounts=10):
+        super().__init__(accounts)
+        self.topic = topic
+        self.signatures = signatures
+        self.names = {}
+        self.name_counts = {}
+        self.logs = []
+        self.stock_count = 0
+        self.shortage_count = 0
+        self.events = _Events()
+
+    def _emit(self, event, indexed, args):
+        topics = [self.topic(self.signatures[event])] + [self.topic(v) for v in indexed]
+        self.logs.append({'address': self.address, 'blockNumber': self.block_number + 1,
+                          'topics': topics, 'event': event, 'args': args})
+
+    def get_logs(self, params):
+        wanted = params.get('topics', [])
+        from_block = params.get('fromBlock', 0)
+
+        def matches(log):
+            for expected, actual in zip(wanted, log['topics']):
+                if expected is not None and actual not in (expected if isinstance(expected, list) else [expected]):
+                    return False
+            return len(log['topics']) >= len(wanted)
+
+        return [log for log in self.logs if log['blockNumber'] >= from_block and matches(log)]
+
+    # Contract implementation
+    def registerName(self, sender, kind, name):
+        ids = self.names.setdefault(kind, {})
+        if name not in ids:
+            ids[name] = self.name_counts[kind] = self.name_counts.get(kind, 0) + 1
+            self._emit('NameRegistered', (kind, ids[name]), {'kind': kind, 'id': ids[name], 'name': name})
+
+    def registerNames(self, sender, kind, names):
+        for name in names:
+            self.registerName(sender, kind, name)
+
+    def nameId(self, kind, name):
+        return self.names.get(kind, {}).get(name, 0)
+
+    def addMedicineStock(self, sender, pharmacy_id, medicine_id, quantity, price):
+        seq, self.stock_count = self.stock_count, self.stock_count + 1
+        self._emit('StockAdded', (seq, pharmacy_id, medicine_id), {
+            'seq': seq, 'pharmacyId': pharmacy_id, 'medicineId': medicine_id, 'quantity': quantity,
+            'price': price, 'timestamp': int(time.time()), 'updatedBy': sender})
+
+    def reportShortage(self, sender, medicine_id, location_id):
+        seq, self.shortage_count = self.shortage_count, self.shortage_count + 1
+        self._emit('ShortageReported', (seq, medicine_id, location_id), {
+            'seq': seq, 'medicineId': medicine_id, 'locationId': location_id,
+            'timestamp': int(time.time()), 'reportedBy': sender})
+
+    def placeOrder(self, sender, medicine_id, quantity, manufacturer):
+        self.orders.append([medicine_id, quantity, sender, manufacturer, 0, int(time.time())])
+
+    def owner(self):
+        return self.accounts[0]
+
+    def anchorLedger(self, sender, head_hash, records):
+        if sender != self.owner():
+            raise ValueError('execution reverted: Only the owner can do this')
+        self._emit('LedgerAnchored', (int.from_bytes(head_hash, 'big'),),
+                   {'headHash': head_hash, 'records': records, 'anchoredBy': sender})
+
+    def getStockCount(self):
+        return self.stock_count
+
+    def getShortageCount(self):
+        return self.shortage_count
+
+
+class _Events:
+    """contract.events stand-in; the emulated logs are already decoded"""
+
+    def __getattr__(self, name):
+        return lambda: self
+
+    @staticmethod
+    def process_log(log):
+        return log
+
+
+class _Receipt:
+    def __init__(self, tx_hash):
+        self.transactionHash = tx_hash
+        self.gasUsed = 50000
+
+
+class _TxHash(bytes):
+    def hex(self):
+        return '0x' + super().hex()
+
+
+class _Call:
+    def __init__(self, chain, name, args):
+        self.chain = chain
+        self.fn_name = name
+        self.args = args
+
+    def call(self, *_):
+        with self.chain.lock:
+            return getattr(self.chain, self.fn_name)(*self.args)
+
+    def estimate_gas(self, tx=None):
+        return 50000 + 64 * sum(len(str(a)) for a in self.args)
+
+    def transact(self, tx=None):
+        sender = (tx or {}).get('from', self.chain.accounts[0])
+        with self.chain.lock:
+            expected = self.chain.nonces[sender]
+            nonce = (tx or {}).get('nonce', expected)
+            if nonce != expected:
+                raise ValueError(f'nonce too low/high: expected {expected}, got {nonce}')
+            self.chain.nonces[sender] = expected + 1
+            getattr(self.chain, self.fn_name)(sender, *self.args)
+            self.chain.block_number += 1
+            return _TxHash(hashlib.sha256(f'{sender}{nonce}'.encode()).digest())
+
+
+class _Functions:
+    def __init__(self, chain):
+        self._chain = chain
+
+    def __getattr__(self, name):
+        if not hasattr(self._chain, name):
+            raise AttributeError(name)
+        return lambda *args: _Call(self._chain, name, args)
+
+
+class _Eth:
+    def __init__(self, chain):
+        self._chain = chain
+
+    @property
+    def accounts(self):
+        return list(self._chain.accounts)
+
+    @property
+    def block_number(self):
+        return self._chain.block_number
+
+    def get_transaction_count(self, account, block_identifier='latest'):
+        return self._chain.nonces.get(account, 0)
+
+    def wait_for_transaction_receipt(self, tx_hash, timeout=120):
+        return _Receipt(tx_hash)
+
+    def get_logs(self, params):
+        with self._chain.lock:
+            return self._chain.get_logs(params)
+
+    def contract(self, address=None, abi=None):
+        return self._chain
+
+
+def install_chain(app_module, chain):
+    """Point the app's ledger globals at the in-process chain"""
+    app_module.w3 = chain
+    app_module.contract = app_module.InstrumentedContract(chain)
+    app_module.default_account = chain.accounts[0]
+    app_module.blockchain_enabled = True
+    app_module.tx_manager = app_module.LedgerTransactionManager(chain, app_module.contract)
+    if isinstance(chain, InProcessChainV2):
+        app_module.LEDGER_VERSION = 2
+        app_module.ledger_names.reset(0)
+
+
+def load_app(data_dir):
+    os.environ.setdefault('GEOCODE_BACKFILL', '0')
+    os.environ.setdefault('GEOCODER_BACKEND', 'static')
+    os.chdir(data_dir)
+    sys.path.insert(0, ROOT)
+    import app as app_module
+    app_module.app.config['TESTING'] = True
+    return app_module
+
+
+class Fixtures:
+    """IDs and names sampled from the generated data so requests hit real rows"""
+
+    def __init__(self, data_dir, rng):
+        self.rng = rng
+        conn = sqlite3.connect(os.path.join(data_dir, 'healthcare.db'))
+        self.pharmacy_users = [r[0] for r in conn.execute(
+            'SELECT user_id FROM pharmacies ORDER BY RANDOM() LIMIT 2000')]
+        self.patients = [r[0] for r in conn.execute(
+            "SELECT id FROM users WHERE user_type = 'patient' ORDER BY RANDOM() LIMIT 2000")]
+        self.medicines = [r[0] for r in conn.execute('SELECT id FROM medicines ORDER BY RANDOM() LIMIT 2000')]
+        self.medicine_names = [r[0] for r in conn.execute('SELECT name FROM medicines ORDER BY RANDOM() LIMIT 200')]
+        self.locations = [tuple(r) for r in conn.execute(
+            'SELECT id, latitude, longitude FROM locations WHERE latitude IS NOT NULL')]
+        admin = conn.execute("SELECT id FROM users WHERE user_type = 'admin' LIMIT 1").fetchone()
+        authority = conn.execute("SELECT id FROM users WHERE user_type IN ('government', 'ngo') LIMIT 1").fetchone()
+        self.admin = admin[0] if admin else 1
+        self.authority = authority[0] if authority else 4
+        conn.close()
+        self.csv_names = []
+        csv_path = os.path.join(data_dir, 'Medicine_Details.csv')
+        if os.path.exists(csv_path):
+            with open(csv_path, newline='') as f:
+                self.csv_names = [row['Medicine Name'] for row in itertools.islice(csv.DictReader(f), 5000)]
+
+
+def build_routes(fx):
+    """(name, weight, role, user_id_fn, request_fn) — weights approximate production mix"""
+    rng = fx.rng
+
+    def search_alternatives(client):
+        name = rng.choice(fx.csv_names) if fx.csv_names else 'Paracetamol'
+        return client.post('/api/search-alternatives', json={'medicine_name': name})
+
+    def search_pharmacies(client):
+        _, lat, lon = rng.choice(fx.locations)
+        return client.post('/api/search_pharmacies', json={
+            'latitude': lat, 'longitude': lon, 'medicines': rng.sample(fx.medicine_names, 2)})
+
+    def update_inventory(client):
+        return client.post('/inventory/update', data={
+            'medicine_id': rng.choice(fx.medicines), 'current_stock': rng.randint(0, 500),
+            'unit_price': f'{rng.uniform(2, 800):.2f}', 'mrp': f'{rng.uniform(800, 900):.2f}',
+            'batch_number': 'B0', 'expiry_date': '2027-12-31', 'minimum_stock_level': 20})
+
+    def report_medicine(client):
+        return client.post('/report-medicine', data={
+            'medicine_id': rng.choice(fx.medicines), 'location_id': rng.choice(fx.locations)[0],
+            'report_type': rng.choice(['shortage', 'overpriced', 'unavailable']),
+            'description': 'load test'})
+
+    return [
+        ('GET /', 20, None, None, lambda c: c.get('/')),
+        ('GET /admin/dashboard', 3, 'admin', lambda: fx.admin, lambda c: c.get('/admin/dashboard')),
+        ('GET /pharmacy/dashboard', 10, 'pharmacy', lambda: rng.choice(fx.pharmacy_users),
+         lambda c: c.get('/pharmacy/dashboard')),
+        ('GET /patient/dashboard', 10, 'patient', lambda: rng.choice(fx.patients),
+         lambda c: c.get('/patient/dashboard')),
+        ('GET /authority/dashboard', 3, 'government', lambda: fx.authority, lambda c: c.get('/authority/dashboard')),
+        ('POST /api/search-alternatives', 20, None, None, search_alternatives),
+        ('POST /api/search_pharmacies', 15, None, None, search_pharmacies),
+        ('POST /inventory/update', 12, 'pharmacy', lambda: rng.choice(fx.pharmacy_users), update_inventory),
+        ('POST /report-medicine', 7, 'patient', lambda: rng.choice(fx.patients), report_medicine),
+    ]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def run(app_module, routes, workers, duration, max_requests, seed):
+    results = {name: {'latencies': [], 'errors': 0} for name, *_ in routes}
+    results_lock = threading.Lock()
+    weights = [r[1] for r in routes]
+    deadline = time.monotonic() + duration
+    counter = itertools.count()
+
+    def worker(worker_id):
+        rng = random.Random(seed + worker_id)
+        client = app_module.app.test_client()
+        while time.monotonic() < deadline:
+            if max_requests and next(counter) >= max_requests:
+                return
+            name, _, role, user_fn, send = rng.choices(routes, weights=weights)[0]
+            with client.session_transaction() as sess:
+                sess.clear()
+                if role:
+                    sess['user_id'] = user_fn()
+                    sess['user_type'] = role
+                    sess['full_name'] = 'Load Test'
+            started = time.perf_counter()
+            try:
+                response = send(client)
+                failed = response.status_code >= 500
+            except Exception:
+                failed = True
+            elapsed = time.perf_counter() - started
+            with results_lock:
+                # Error responses are counted but kept out of the latency figures
+                if failed:
+                    results[name]['errors'] += 1
+                else:
+                    results[name]['latencies'].append(elapsed)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(workers)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, time.monotonic() - started
+
+
+def summarize(results, wall_time, max_error_rate):
+    report = {}
+    for name, data in results.items():
+        lat = sorted(data['latencies'])
+        requests = len(lat) + data['errors']
+        error_rate = data['errors'] / requests if requests else 0.0
+        report[name] = {
+            'requests': requests,
+            'errors': data['errors'],
+            'error_rate': round(error_rate, 4),
+            'failing': error_rate > max_error_rate,
+            'p50_ms': round(percentile(lat, 50) * 1000, 2),
+            'p99_ms': round(percentile(lat, 99) * 1000, 2),
+            'mean_ms': round(sum(lat) / len(lat) * 1000, 2) if lat else 0.0,
+            'throughput_rps': round(len(lat) / wall_time, 2) if wall_time else 0.0,
+        }
+    total = sum(r['requests'] for r in report.values())
+    report['_total'] = {'requests': total, 'wall_time_s': round(wall_time, 2),
+                        'throughput_rps': round(total / wall_time, 2) if wall_time else 0.0,
+                        'failing_routes': sorted(name for name, r in report.items() if r['failing'])}
+    return report
+
+
+def print_report(report, max_error_rate):
+    print(f"\n{'route':<32}{'reqs':>8}{'errs':>6}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+    for name, r in report.items():
+        if name.startswith('_'):
+            continue
+        flag = '  ❌ errors' if r['failing'] else ''
+        print(f"{name:<32}{r['requests']:>8}{r['errors']:>6}{r['p50_ms']:>10}{r['p99_ms']:>10}{r['throughput_rps']:>10}{flag}")
+    total = report['_total']
+    print(f"\n📊 {total['requests']} requests in {total['wall_time_s']}s ({total['throughput_rps']} req/s)")
+    if total['failing_routes']:
+        print(f"❌ {len(total['failing_routes'])} routes above {max_error_rate:.0%} 5xx responses; "
+              f"their latencies cover successful requests only: {', '.join(total['failing_routes'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default='bench_data', help='directory produced by generate_load_data.py')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds to run')
+    parser.add_argument('--requests', type=int, default=0, help='stop after N requests (0 = duration only)')
+    parser.add_argument('--routes', default='', help='comma-separated route names to include')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', help='write the report as JSON to this file')
+    parser.add_argument('--max-error-rate', type=float, default=0.01,
+                        help='fail the run if any route returns more than this fraction of 5xx responses')
+    parser.add_argument('--ledger-version', type=int, choices=(1, 2), default=1,
+                        help='MedicineLedger contract version to emulate')
+    args = parser.parse_args(argv)
+
+    data_dir = os.path.abspath(args.data)
+    fixtures = Fixtures(data_dir, random.Random(args.seed))
+    app_module = load_app(data_dir)
+    if args.ledger_version == 2:
+        chain = InProcessChainV2(app_module.ledger_topic, app_module.LEDGER_V2_EVENTS)
+    else:
+        chain = InProcessChain()
+    install_chain(app_module, chain)
+
+    routes = build_routes(fixtures)
+    if args.routes:
+        wanted = {r.strip() for r in args.routes.split(',')}
+        routes = [r for r in routes if r[0] in wanted]
+
+    print(f"🚀 {args.workers} workers, {args.duration}s, {len(routes)} routes")
+    results, wall_time = run(app_module, routes, args.workers, args.duration, args.requests, args.seed)
+    report = summarize(results, wall_time, args.max_error_rate)
+    print_report(report, args.max_error_rate)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 1 if report['_total']['failing_routes'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
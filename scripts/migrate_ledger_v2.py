@@ -0,0 +1,154 @@
+"""Copy MedicineLedger v1 records into a MedicineLedgerV2 deployed in migration mode.
+
+Usage:
+    MIGRATE=1 npx hardhat run scripts/deploy_v2.js --network localhost
+    python scripts/migrate_ledger_v2.py            # resumable: re-run until it reports nothing left
+    python scripts/migrate_ledger_v2.py --finish   # copy retailer stocks, open v2 for live writes
+    LEDGER_CONTRACT_VERSION=2 python app.py
+
+Records keep their v1 index, timestamp and sender, so ledger_index rows and
+/api/ledger cursors stay valid after the switch. Progress is read back from the
+v2 counters, so an interrupted run continues where it stopped. Stop writes to v1
+(or the app) before --finish so nothing is recorded after the last copy.
+"""
+import argparse
+import json
+import os
+import sys
+
+from web3 import Web3
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+NAME_KINDS = {'pharmacy': 0, 'medicine': 1, 'location': 2}
+ORDER_STATUSES = ('pending', 'confirmed', 'shipped', 'delivered', 'cancelled')
+RETAILER_STOCK_EVENT = 'RetailerStockUpdated(address,string,uint256)'
+
+
+def load_contract(w3, path, address=None):
+    with open(path) as f:
+        info = json.load(f)
+    return w3.eth.contract(address=w3.to_checksum_address(address or info['address']), abi=info['abi'])
+
+
+def send(w3, fn, account):
+    receipt = w3.eth.wait_for_transaction_receipt(fn.transact({'from': account}), timeout=300)
+    if receipt.status != 1:
+        raise RuntimeError(f'Transaction {receipt.transactionHash.hex()} reverted')
+    return receipt
+
+
+def read_v1(v1, done):
+    """v1 records not yet copied, as tuples from the public storage getters"""
+    return {
+        'stocks': [v1.functions.stockUpdates(i).call()
+                   for i in range(done['stocks'], v1.functions.getStockCount().call())],
+        'shortages': [v1.functions.shortageReports(i).call()
+                      for i in range(done['shortages'], v1.functions.getShortageCount().call())],
+        'orders': [v1.functions.orders(i).call()
+                   for i in range(done['orders'], v1.functions.getOrderCount().call())]
+    }
+
+
+def latest_retailer_stocks(w3, v1):
+    """v1 retailer stocks are not enumerable on-chain, so rebuild them from RetailerStockUpdated logs"""
+    logs = w3.eth.get_logs({
+        'address': v1.address,
+        'fromBlock': 0,
+        'toBlock': 'latest',
+        'topics': [Web3.to_hex(Web3.keccak(text=RETAILER_STOCK_EVENT))]
+    })
+    decoder = v1.events.RetailerStockUpdated()
+    latest = {}
+    for log in logs:
+        args = decoder.process_log(log)['args']
+        latest[(args['retailer'], args['medicine'])] = args['newStock']
+    return latest
+
+
+def register(w3, v2, account, kind, names, batch):
+    """Register unknown names in batches and return name -> id for all of them"""
+    code = NAME_KINDS[kind]
+    names = list(dict.fromkeys(names))
+    new = [name for name in names if not v2.functions.nameId(code, name).call()]
+    for start in range(0, len(new), batch):
+        send(w3, v2.functions.registerNames(code, new[start:start + batch]), account)
+    if new:
+        print(f"  registered {len(new)} {kind} names")
+    return {name: v2.functions.nameId(code, name).call() for name in names}
+
+
+def order_status(status):
+    if status not in ORDER_STATUSES:
+        print(f"  ⚠️ unknown order status '{status}', importing as pending")
+        return 0
+    return ORDER_STATUSES.index(status)
+
+
+def import_batches(w3, fn, account, records, batch, label):
+    for start in range(0, len(records), batch):
+        send(w3, fn(records[start:start + batch]), account)
+        print(f"  {label}: {min(start + batch, len(records))}/{len(records)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--provider', default='http://127.0.0.1:8545')
+    parser.add_argument('--v1', default=os.path.join(ROOT, 'MedicineLedger.json'), help='v1 deployment/ABI file')
+    parser.add_argument('--v1-address', help='v1 address if it differs from the deployment file')
+    parser.add_argument('--v2', default=os.path.join(ROOT, 'MedicineLedgerV2.json'), help='v2 deployment/ABI file')
+    parser.add_argument('--batch', type=int, default=200, help='records per import transaction')
+    parser.add_argument('--finish', action='store_true', help='copy retailer stocks and close the migration')
+    args = parser.parse_args(argv)
+
+    w3 = Web3(Web3.HTTPProvider(args.provider))
+    if not w3.is_connected():
+        sys.exit(f"❌ Cannot connect to {args.provider}")
+    v1 = load_contract(w3, args.v1, args.v1_address)
+    v2 = load_contract(w3, args.v2)
+    owner = v2.functions.owner().call()
+    if not v2.functions.migrationOpen().call():
+        sys.exit("❌ v2 migration is already finished (or the contract was deployed without MIGRATE=1)")
+
+    done = {
+        'stocks': v2.functions.getStockCount().call(),
+        'shortages': v2.functions.getShortageCount().call(),
+        'orders': v2.functions.getOrderCount().call()
+    }
+    print(f"📦 Already copied: {done}")
+    pending = read_v1(v1, done)
+    retailer_stocks = latest_retailer_stocks(w3, v1) if args.finish else {}
+
+    pharmacy_ids = register(w3, v2, owner, 'pharmacy', [r[0] for r in pending['stocks']], args.batch)
+    medicine_ids = register(w3, v2, owner, 'medicine',
+                            [r[1] for r in pending['stocks']] + [r[0] for r in pending['shortages']] +
+                            [r[0] for r in pending['orders']] + [medicine for _, medicine in retailer_stocks],
+                            args.batch)
+    location_ids = register(w3, v2, owner, 'location', [r[1] for r in pending['shortages']], args.batch)
+
+    # (pharmacy, medicine, quantity, price, timestamp, updatedBy)
+    import_batches(w3, v2.functions.importStocks, owner, [
+        (pharmacy_ids[r[0]], medicine_ids[r[1]], r[2], r[3], r[4], r[5]) for r in pending['stocks']
+    ], args.batch, 'stock updates')
+    # (medicine, location, timestamp, reportedBy)
+    import_batches(w3, v2.functions.importShortages, owner, [
+        (medicine_ids[r[0]], location_ids[r[1]], r[2], r[3]) for r in pending['shortages']
+    ], args.batch, 'shortage reports')
+    # (medicine, quantity, retailer, manufacturer, status, timestamp)
+    import_batches(w3, v2.functions.importOrders, owner, [
+        (medicine_ids[r[0]], r[1], r[2], r[3], order_status(r[4]), r[5]) for r in pending['orders']
+    ], args.batch, 'orders')
+
+    if args.finish:
+        import_batches(w3, v2.functions.importRetailerStocks, owner, [
+            (retailer, medicine_ids[medicine], stock) for (retailer, medicine), stock in retailer_stocks.items()
+        ], args.batch, 'retailer stocks')
+        send(w3, v2.functions.finishMigration(), owner)
+        print("✅ Migration finished; set LEDGER_CONTRACT_VERSION=2 and restart the app")
+    else:
+        copied = sum(len(records) for records in pending.values())
+        print(f"✅ Copied {copied} records; run again with --finish once v1 writes have stopped")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import importlib
+import os
+import sqlite3
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def app_module(tmp_path_factory):
+    # The app resolves its data files against the working directory
+    workdir = tmp_path_factory.mktemp('app')
+    cwd = os.getcwd()
+    os.environ.setdefault('GEOCODE_BACKFILL', '0')
+    os.environ.setdefault('GEOCODER_BACKEND', 'static')
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    try:
+        yield importlib.import_module('app')
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def conn(app_module, tmp_path):
+    conn = sqlite3.connect(tmp_path / 'healthcare.db', isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    with open(os.path.join(ROOT, 'healthcare_schema.sql')) as f:
+        conn.executescript(f.read())
+    # One batch only, replacing the schema's sample rows for this pharmacy and medicine
+    conn.execute('DELETE FROM pharmacy_inventory WHERE pharmacy_id = 1 AND medicine_id = 1')
+    conn.execute('''
+        INSERT INTO pharmacy_inventory (pharmacy_id, medicine_id, current_stock, unit_price, batch_number, expiry_date)
+        VALUES (1, 1, 10, 5.0, 'B1', '2030-01-01')
+    ''')
+    yield conn
+    conn.close()
+
+
+def sale(app_module, event_id, quantity):
+    movement, error = app_module.parse_stock_movement(
+        {'event_id': event_id, 'type': 'sale', 'medicine_id': 1, 'quantity': quantity})
+    assert error is None
+    return movement
+
+
+def test_retry_in_same_group_is_a_duplicate(app_module, conn):
+    pharmacy = {'id': 1, 'location_id': 1, 'user_id': 2}
+    group = [{'pharmacy': pharmacy, 'events': [sale(app_module, 'till1-7', 3)]},
+             {'pharmacy': dict(pharmacy), 'events': [sale(app_module, 'till1-7', 3)]}]
+
+    conn.execute('BEGIN IMMEDIATE')
+    app_module.apply_stock_movements(conn, group)
+    conn.execute('COMMIT')
+
+    assert group[0]['results'] == [{'event_id': 'till1-7', 'status': 'applied', 'balance': 7}]
+    assert group[1]['results'] == [{'event_id': 'till1-7', 'status': 'duplicate', 'balance': 7}]
+    assert conn.execute("SELECT current_stock FROM pharmacy_inventory WHERE batch_number = 'B1'").fetchone()[0] == 7
+    assert conn.execute('SELECT COUNT(*) FROM stock_movements').fetchone()[0] == 1
+
+
+def test_form_edit_saves_details_and_count_together(app_module, conn):
+    movement, error = app_module.parse_stock_movement(
+        {'event_id': 'web-1', 'type': 'adjustment', 'medicine_id': 1, 'counted': 4, 'batch_number': 'B2'})
+    assert error is None
+    movement['details'] = {'unit_price': 6.5, 'mrp': 8.0, 'expiry_date': '2031-01-01', 'minimum_stock_level': 2}
+    unknown = dict(movement, event_id='web-2', medicine_id=999999)
+    group = [{'pharmacy': {'id': 1, 'location_id': 1, 'user_id': 2}, 'events': [movement, unknown]}]
+
+    conn.execute('BEGIN IMMEDIATE')
+    app_module.apply_stock_movements(conn, group)
+    conn.execute('COMMIT')
+
+    assert [r['status'] for r in group[0]['results']] == ['applied', 'rejected']
+    row = conn.execute("SELECT current_stock, unit_price, minimum_stock_level FROM pharmacy_inventory "
+                       "WHERE pharmacy_id = 1 AND batch_number = 'B2'").fetchone()
+    assert tuple(row) == (4, 6.5, 2)
+    assert conn.execute('SELECT COUNT(*) FROM pharmacy_inventory WHERE medicine_id = 999999').fetchone()[0] == 0